@@ -1,9 +1,21 @@
+import re
 import requests
+from six.moves.urllib.parse import urlencode, urlparse
 from bespin.exceptions import JobDoesNotExistException, ShareGroupNotFound, JobStrategyNotFound, WorkflowNotFound
+from bespin.stats import STATS
 
 CONTENT_TYPE = 'application/json'
 
 
+def first_item(items):
+    """
+    Return the first item from a list or generator of items
+    :param items: iterable of items (such as those returned by BespinApi *_list methods)
+    :return: first item or None if there are no items
+    """
+    return next(iter(items), None)
+
+
 class BespinApi(object):
     """
     Communicates with Bespin API via REST
@@ -23,20 +35,57 @@ class BespinApi(object):
         }
 
     def _get_request(self, url_suffix):
-        url = self._build_url(url_suffix)
+        return self._get_url(self._build_url(url_suffix))
+
+    def _get_url(self, url):
         headers = self._build_headers()
         try:
-            response = requests.get(url, headers=headers)
+            with STATS.timer(self._get_stats_name('GET', url)) as timer_details:
+                response = requests.get(url, headers=headers)
+                self._set_response_bytes(timer_details, response)
         except requests.exceptions.ConnectionError as ex:
             raise BespinException("Failed to connect to {}\n{}".format(self.config.url, ex))
         self._check_response(response)
         return response.json()
 
+    def _get_list_request(self, url_suffix):
+        """
+        Generator that yields the items of a list endpoint one page at a time.
+        Handles both plain JSON arrays and paginated responses ({"results": [...], "next": url}),
+        following the server provided next links so only one page is held in memory.
+        :param url_suffix: str: url of the list endpoint
+        """
+        url = self._build_url(url_suffix)
+        while url:
+            response = self._get_url(url)
+            if isinstance(response, dict) and 'results' in response:
+                items = response['results']
+                url = response.get('next')
+                if url:
+                    self._check_next_url(url)
+            else:
+                items = response
+                url = None
+            for item in items:
+                yield item
+
+    def _check_next_url(self, url):
+        """
+        Make sure a server provided next link points to bespin-api so the token is not sent to another host
+        :param url: str: next url from a paginated response
+        """
+        next_url_parts = urlparse(url)
+        config_url_parts = urlparse(self.config.url)
+        if (next_url_parts.scheme, next_url_parts.netloc) != (config_url_parts.scheme, config_url_parts.netloc):
+            raise BespinException("Refusing to follow next link {} that is not on {}".format(url, self.config.url))
+
     def _post_request(self, url_suffix, data):
         url = self._build_url(url_suffix)
         headers = self._build_headers()
         try:
-            response = requests.post(url, headers=headers, json=data)
+            with STATS.timer(self._get_stats_name('POST', url)) as timer_details:
+                response = requests.post(url, headers=headers, json=data)
+                self._set_response_bytes(timer_details, response)
         except requests.exceptions.ConnectionError as ex:
             raise BespinException("Failed to connect to {}\n{}".format(self.config.url, ex))
         self._check_response(response)
@@ -46,12 +95,43 @@ class BespinApi(object):
         url = self._build_url(url_suffix)
         headers = self._build_headers()
         try:
-            response = requests.delete(url, headers=headers)
+            with STATS.timer(self._get_stats_name('DELETE', url)) as timer_details:
+                response = requests.delete(url, headers=headers)
+                self._set_response_bytes(timer_details, response)
         except requests.exceptions.ConnectionError as ex:
             raise BespinException("Failed to connect to {}\n{}".format(self.config.url, ex))
         self._check_response(response)
         return response
 
+    def _get_stats_name(self, method, url):
+        """
+        Name requests to the same endpoint alike by removing the base url, query string and ids
+        :param method: str: HTTP method
+        :param url: str: full url of the request
+        :return: str: name such as 'api GET /job-strategies/{id}/'
+        """
+        path = url.replace(self.config.url, '', 1).split('?', 1)[0]
+        return 'api {} {}'.format(method, re.sub(r'/\d+(?=/|$)', '/{id}', path))
+
+    @staticmethod
+    def _set_response_bytes(timer_details, response):
+        # only read the response size when it is recorded
+        if STATS.recording:
+            timer_details['bytes'] = len(response.content)
+
+    @staticmethod
+    def _add_query_params(url_suffix, params):
+        """
+        Append url encoded query parameters to url_suffix skipping any with a value of None
+        :param url_suffix: str: url without a query string
+        :param params: [(str, object)]: ordered name/value pairs
+        :return: str: url with query string
+        """
+        query = urlencode([(name, value) for name, value in params if value is not None])
+        if query:
+            return '{}?{}'.format(url_suffix, query)
+        return url_suffix
+
     @staticmethod
     def _check_response(response):
         try:
@@ -75,23 +155,42 @@ class BespinApi(object):
             pass  # response was not JSON
         return response.text
 
-    def jobs_list(self):
-        return self._get_request('/jobs/')
+    def jobs_list(self, state=None, since=None, workflow_tag=None, limit=None):
+        """
+        Generate jobs for the current user, optionally filtered by the server
+        :param state: str: only include jobs in this state
+        :param since: str: only include jobs last updated at or after this ISO 8601 date/time
+        :param workflow_tag: str: only include jobs run against workflows with this tag
+        :param limit: int: maximum number of jobs to request per page
+        """
+        params = [
+            ('state', state),
+            ('last_updated__gte', since),
+            ('workflow_version__workflow__tag', workflow_tag),
+            ('limit', limit),
+        ]
+        return self._get_list_request(self._add_query_params('/jobs/', params))
+
+    def job_get(self, job_id):
+        try:
+            return self._get_request('/jobs/{}/'.format(job_id))
+        except NotFoundException as e:
+            raise JobDoesNotExistException("No job found for id: {}.".format(job_id))
 
     def workflows_list(self, tag=None):
         url = '/workflows/'
         if tag:
             url += "?tag={}".format(tag)
-        return self._get_request(url)
+        return self._get_list_request(url)
 
     def workflow_get(self, workflow_id):
         return self._get_request('/workflows/{}/'.format(workflow_id))
 
     def workflow_get_for_tag(self, workflow_tag):
-        workflows = self.workflows_list(workflow_tag)
-        if not workflows:
+        workflow = first_item(self.workflows_list(workflow_tag))
+        if not workflow:
             raise WorkflowNotFound("No workflow found with tag {}".format(workflow_tag))
-        return workflows[0]
+        return workflow
 
     def workflow_post(self, name, tag):
         data = {
@@ -104,14 +203,14 @@ class BespinApi(object):
         url = '/workflow-versions/'
         if workflow_tag:
             url += '?workflow__tag={}'.format(workflow_tag)
-        return self._get_request(url)
+        return self._get_list_request(url)
 
     def workflow_version_find_by_tag_version(self, tag, version):
         url = '/workflow-versions/?workflow__tag={}&version={}'.format(tag, version)
-        workflow_versions = self._get_request(url)
-        if not workflow_versions :
+        workflow_version = first_item(self._get_list_request(url))
+        if not workflow_version:
             raise WorkflowNotFound("No workflow version found matching {}/{}".format(tag, version))
-        return workflow_versions[0]
+        return workflow_version
 
     def workflow_versions_post(self, workflow, version, workflow_type, description, workflow_path, url, version_info_url, fields):
         data = {
@@ -129,6 +228,9 @@ class BespinApi(object):
     def workflow_version_get(self, workflow_version):
         return self._get_request('/workflow-versions/{}/'.format(workflow_version))
 
+    def workflow_version_tool_details_list(self):
+        return self._get_list_request('/workflow-version-tool-details/')
+
     def workflow_version_tool_details_post(self, workflow_version_id, tool_details):
         data = {
             "workflow_version": workflow_version_id,
@@ -148,7 +250,7 @@ class BespinApi(object):
         if workflow_tag:
             url += '{}workflow__tag={}'.format(prefix, workflow_tag)
             prefix = "&"
-        return self._get_request(url)
+        return self._get_list_request(url)
 
     def workflow_configurations_get(self, workflow_configuration_id):
         return self._get_request('/workflow-configurations/{}/'.format(workflow_configuration_id))
@@ -218,39 +320,39 @@ class BespinApi(object):
             raise JobDoesNotExistException("No job found for id: {}.".format(job_id))
 
     def dds_user_credentials_list(self):
-        return self._get_request('/dds-user-credentials/')
+        return self._get_list_request('/dds-user-credentials/')
 
     def share_groups_list(self, name=None):
         url = '/share-groups/'
         if name:
             url += "?name={}".format(name)
-        return self._get_request(url)
+        return self._get_list_request(url)
 
     def share_group_get(self, share_group_id):
         url = '/share-groups/{}/'.format(share_group_id)
         return self._get_request(url)
 
     def share_group_get_for_name(self, name):
-        groups = self.share_groups_list(name)
-        if not groups:
+        group = first_item(self.share_groups_list(name))
+        if not group:
             raise ShareGroupNotFound("No group found with name {}".format(name))
-        return groups[0]
+        return group
 
     def job_strategies_list(self, name=None):
         url = '/job-strategies/'
         if name:
             url += "?name={}".format(name)
-        return self._get_request(url)
+        return self._get_list_request(url)
 
     def job_strategy_get(self, job_strategy_id):
         url = '/job-strategies/{}/'.format(job_strategy_id)
         return self._get_request(url)
 
     def job_strategy_get_for_name(self, name):
-        job_strategies = self.job_strategies_list(name)
-        if not job_strategies:
+        job_strategy = first_item(self.job_strategies_list(name))
+        if not job_strategy:
             raise JobStrategyNotFound("No Job Strategy found with name {}".format(name))
-        return job_strategies[0]
+        return job_strategy
 
 
 class BespinException(Exception):
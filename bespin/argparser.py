@@ -1,6 +1,14 @@
 from __future__ import print_function
+from contextlib import contextmanager
 import argparse
 import sys
+from bespin.output import OUTPUT_FORMATS, TABLE_OUTPUT_FORMAT
+from bespin.batch import DEFAULT_MAX_WORKERS
+from bespin.backfill import DEFAULT_MAX_PROCESSES, DEFAULT_MAX_POSTS
+from bespin.stats import STATS
+from bespin.tracing import TRACER
+from bespin.cassette import record_http, replay_http
+from bespin.profiling import run_with_profile, run_with_tracemalloc, DEFAULT_PROFILE_FILENAME, DEFAULT_TOP_ENTRIES
 
 DESCRIPTION_STR = "bespin ({}) Run bioinformatics workflows"
 
@@ -16,6 +24,32 @@ class ArgParser(object):
         self.target_object = target_object
         description = DESCRIPTION_STR.format(version_str)
         self.argument_parser = argparse.ArgumentParser(description=description)
+        self.argument_parser.add_argument('--stats', action='store_true',
+                                          help='Print request, DukeDS and workflow timings when the command exits.')
+        self.argument_parser.add_argument('--stats-file', metavar='PATH',
+                                          help='Write request, DukeDS and workflow timings to PATH as JSON.')
+        self.argument_parser.add_argument('--trace', metavar='PATH',
+                                          help='Write request, DukeDS, job creation and workflow spans to PATH in '
+                                               'Chrome trace event format.')
+        http_cassette_group = self.argument_parser.add_mutually_exclusive_group()
+        http_cassette_group.add_argument('--record-http', metavar='PATH',
+                                         help='Record bespin-api and DukeDS HTTP requests to a cassette file at PATH '
+                                              'with tokens scrubbed.')
+        http_cassette_group.add_argument('--replay-http', metavar='PATH',
+                                         help='Answer bespin-api and DukeDS HTTP requests from the cassette file at '
+                                              'PATH instead of the network, taking as long as the recorded requests.')
+        self.argument_parser.add_argument('--replay-full-speed', action='store_true',
+                                          help='With --replay-http answer each request immediately.')
+        profile_group = self.argument_parser.add_mutually_exclusive_group()
+        profile_group.add_argument('--profile', metavar='PATH', nargs='?', const=DEFAULT_PROFILE_FILENAME,
+                                   help='Run the command under cProfile writing pstats to PATH (default: {})'
+                                        ' and print the top cumulative entries. Use --profile=PATH to '
+                                        'choose the path.'.format(DEFAULT_PROFILE_FILENAME))
+        profile_group.add_argument('--profile-memory', action='store_true',
+                                   help='Run the command under tracemalloc and print the peak memory along '
+                                        'with the largest allocation sites.')
+        self.argument_parser.add_argument('--profile-top', metavar='N', type=int, default=DEFAULT_TOP_ENTRIES,
+                                          help='Number of entries printed by --profile and --profile-memory.')
         self.subparsers = self.argument_parser.add_subparsers()
         self._add_commands_to_parser()
 
@@ -41,11 +75,94 @@ class ArgParser(object):
         Parses arguments from args or command line if args is None.
         :param args: optional set of arguments to parse
         """
-        parsed_args = self.argument_parser.parse_args(args)
-        if hasattr(parsed_args, 'func'):
+        if args is None:
+            args = sys.argv[1:]
+        parsed_args = self.argument_parser.parse_args(self._expand_bare_profile_option(args))
+        if not hasattr(parsed_args, 'func'):
+            self.argument_parser.print_help()
+            return
+        if parsed_args.stats or parsed_args.stats_file:
+            STATS.enable()
+        if parsed_args.trace:
+            TRACER.enable()
+        try:
+            with TRACER.span('command', {'command': self._get_command_name(args)}), self._http_cassette(parsed_args):
+                self._run_command(parsed_args)
+        finally:
+            if STATS.enabled:
+                self._report_stats(parsed_args)
+            if parsed_args.trace:
+                with open(parsed_args.trace, 'w') as outfile:
+                    TRACER.write_chrome_trace(outfile)
+
+    def _get_command_name(self, args):
+        """
+        Return the command and action names from args, leaving out option values such as --token.
+        :param args: [str]: command line arguments
+        :return: str: command name followed by the action name, e.g. 'job run'
+        """
+        for idx, arg in enumerate(args):
+            if arg in self.subparsers.choices:
+                return ' '.join(args[idx:idx + 2])
+        return None
+
+    def _expand_bare_profile_option(self, args):
+        """
+        Replace --profile given without =PATH before the command name with --profile=<default path>,
+        otherwise argparse would use the command name as the path.
+        :param args: [str]: command line arguments
+        :return: [str]: arguments with --profile expanded
+        """
+        expanded_args = list(args)
+        for idx, arg in enumerate(expanded_args):
+            if arg in self.subparsers.choices:
+                break
+            if arg == '--profile':
+                expanded_args[idx] = '--profile={}'.format(DEFAULT_PROFILE_FILENAME)
+        return expanded_args
+
+    @staticmethod
+    @contextmanager
+    def _http_cassette(parsed_args):
+        if parsed_args.record_http:
+            with record_http(parsed_args.record_http):
+                yield
+        elif parsed_args.replay_http:
+            with replay_http(parsed_args.replay_http, realtime=not parsed_args.replay_full_speed):
+                yield
+        else:
+            yield
+
+    @staticmethod
+    def _run_command(parsed_args):
+        def run_func():
             parsed_args.func(parsed_args)
+        if parsed_args.profile_memory:
+            run_with_tracemalloc(run_func, parsed_args.profile_top, sys.stderr)
+        elif parsed_args.profile:
+            run_with_profile(run_func, parsed_args.profile, parsed_args.profile_top, sys.stderr)
         else:
-            self.argument_parser.print_help()
+            run_func()
+
+    @staticmethod
+    def _report_stats(parsed_args):
+        if parsed_args.stats_file:
+            with open(parsed_args.stats_file, 'w') as outfile:
+                STATS.write_json(outfile)
+        if parsed_args.stats:
+            sys.stderr.write('\n')
+            STATS.write_table(sys.stderr)
+
+
+def add_output_format_argument(parser):
+    parser.add_argument('--format', dest='output_format', choices=OUTPUT_FORMATS, default=TABLE_OUTPUT_FORMAT,
+                        help='Output format for the list (default: table).')
+
+
+def add_strict_argument(parser):
+    parser.add_argument('--strict', action='store_true',
+                        help='Load the workflow with cwltool, checking it against the CWL schema. '
+                             'By default only the metadata bespin needs is read from the CWL files, which is much faster.')
 
 
 class WorkflowCommand(object):
@@ -63,6 +180,7 @@ class WorkflowCommand(object):
         exclusive_flags.add_argument('--short', action='store_true',
                                   help='show short list of only workflows excluding version/configuration data.')
         list_parser.add_argument('tag', nargs='?', metavar='WORKFLOW_TAG', help='Workflow tag to filter by')
+        add_output_format_argument(list_parser)
         list_parser.set_defaults(func=self._list)
 
         create_parser = subparsers.add_parser('create', description='create a workflow')
@@ -75,7 +193,8 @@ class WorkflowCommand(object):
     def _list(self, args):
         self.target.workflows_list(all_versions=args.all,
                                    short_format=args.short,
-                                   tag=args.tag)
+                                   tag=args.tag,
+                                   output_format=args.output_format)
 
     def _create(self, args):
         self.target.workflow_create(name=args.name,
@@ -93,6 +212,7 @@ class WorkflowVersionCommand(object):
         list_parser = subparsers.add_parser('list', description='list workflow versions')
         list_parser.add_argument('--workflow', metavar='WORKFLOW_TAG',
                                  help='Filter list based on a workflow tag.')
+        add_output_format_argument(list_parser)
         list_parser.set_defaults(func=self._list)
 
         create_parser = subparsers.add_parser('create', description='create new workflow version')
@@ -135,9 +255,10 @@ class WorkflowVersionCommand(object):
                                      help='Explicit version to check when validating')
         validate_parser.add_argument('--workflow-tag', metavar='WORKFLOW_TAG',
                                      help='Explicit workflow tag to check when validating')
+        add_strict_argument(validate_parser)
 
     def _list(self, args):
-        self.target.workflow_versions_list(workflow_tag=args.workflow)
+        self.target.workflow_versions_list(workflow_tag=args.workflow, output_format=args.output_format)
 
     def _create(self, args):
         self.target.workflow_version_create(url=args.url,
@@ -153,7 +274,8 @@ class WorkflowVersionCommand(object):
                                               workflow_type=args.type,
                                               workflow_path=args.path,
                                               expected_tag=args.workflow_tag,
-                                              expected_version=args.version)
+                                              expected_version=args.version,
+                                              strict=args.strict)
 
 
 class ToolDetailsCommand(object):
@@ -182,20 +304,55 @@ class ToolDetailsCommand(object):
         create_parser.add_argument('--workflow-tag', metavar='WORKFLOW_TAG',
                                    help='Explicit workflow tag to use when looking up workflow version '
                                         '(otherwise reads from CWL label)')
+        diff_parser = subparsers.add_parser('diff', description='Show the docker images and package versions that '
+                                                                'changed between two workflow versions')
+        diff_parser.add_argument('workflow_tag', metavar='WORKFLOW_TAG', help='Tag of the workflow')
+        diff_parser.add_argument('old_version', metavar='OLD_VERSION', help='Version to compare from')
+        diff_parser.add_argument('new_version', metavar='NEW_VERSION', help='Version to compare to')
+        add_output_format_argument(diff_parser)
+        backfill_parser = subparsers.add_parser('backfill', description='Create tool details for every workflow '
+                                                                        'version that has none')
+        backfill_parser.add_argument('--workflow', metavar='WORKFLOW_TAG',
+                                     help='Only backfill versions of this workflow.')
+        backfill_parser.add_argument('--processes', type=int, default=DEFAULT_MAX_PROCESSES,
+                                     help='Maximum number of workflows to download and extract at the same time '
+                                          '(default: {}).'.format(DEFAULT_MAX_PROCESSES))
+        backfill_parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_POSTS,
+                                     help='Maximum number of tool details to post to bespin-api at the same time '
+                                          '(default: {}).'.format(DEFAULT_MAX_POSTS))
+        for parser in [create_parser, preview_parser, diff_parser, backfill_parser]:
+            add_strict_argument(parser)
         create_parser.set_defaults(func=self._create)
         preview_parser.set_defaults(func=self._preview)
+        diff_parser.set_defaults(func=self._diff)
+        backfill_parser.set_defaults(func=self._backfill)
 
     def _preview(self, args):
         self.target.workflow_version_tool_details_preview(url=args.url,
                                                           workflow_type=args.type,
-                                                          workflow_path=args.path)
+                                                          workflow_path=args.path,
+                                                          strict=args.strict)
 
     def _create(self, args):
         self.target.workflow_version_tool_details_create(url=args.url,
                                                          workflow_type=args.type,
                                                          workflow_path=args.path,
                                                          override_version=args.version,
-                                                         override_tag=args.workflow_tag)
+                                                         override_tag=args.workflow_tag,
+                                                         strict=args.strict)
+
+    def _diff(self, args):
+        self.target.workflow_version_tool_details_diff(workflow_tag=args.workflow_tag,
+                                                       old_version=args.old_version,
+                                                       new_version=args.new_version,
+                                                       strict=args.strict,
+                                                       output_format=args.output_format)
+
+    def _backfill(self, args):
+        self.target.workflow_version_tool_details_backfill(workflow_tag=args.workflow,
+                                                           max_processes=args.processes,
+                                                           max_posts=args.max_workers,
+                                                           strict=args.strict)
 
 
 class WorkflowConfigCommand(object):
@@ -209,6 +366,7 @@ class WorkflowConfigCommand(object):
         list_parser = subparsers.add_parser('list', description='list workflow configurations')
         list_parser.add_argument('--workflow', metavar='TAG',
                                  help='Filter list based on a workflow tag.')
+        add_output_format_argument(list_parser)
         list_parser.set_defaults(func=self._list)
 
         show_job_order_parser = subparsers.add_parser('show-job-order', description='Prints out job order associated '
@@ -234,7 +392,7 @@ class WorkflowConfigCommand(object):
         create_parser.set_defaults(func=self._create)
 
     def _list(self, args):
-        self.target.workflow_configs_list(workflow_tag=args.workflow)
+        self.target.workflow_configs_list(workflow_tag=args.workflow, output_format=args.output_format)
 
     def _show_job_order(self, args):
         self.target.workflow_config_show_job_order(tag=args.tag,
@@ -259,10 +417,11 @@ class ShareGroupCommand(object):
 
     def add_actions(self, subparsers):
         list_parser = subparsers.add_parser('list', description='list share groups')
+        add_output_format_argument(list_parser)
         list_parser.set_defaults(func=self._list)
 
     def _list(self, args):
-        self.target.share_groups_list()
+        self.target.share_groups_list(output_format=args.output_format)
 
 
 class JobConfigCommand(object):
@@ -274,10 +433,11 @@ class JobConfigCommand(object):
 
     def add_actions(self, subparsers):
         list_parser = subparsers.add_parser('list', description='list VM configurations')
+        add_output_format_argument(list_parser)
         list_parser.set_defaults(func=self._list)
 
     def _list(self, args):
-        self.target.job_configs_list()
+        self.target.job_configs_list(output_format=args.output_format)
 
 
 class JobTemplateCommand(object):
@@ -307,22 +467,56 @@ class JobCommand(object):
         self.target = target
 
     def add_actions(self, subparsers):
-        create_parser = subparsers.add_parser('create', description='create a job based on a job template file')
-        create_parser.add_argument('job_template', type=argparse.FileType('r'), help='job template file')
+        create_parser = subparsers.add_parser('create', description='create jobs based on job template files')
         create_parser.set_defaults(func=self._create)
 
-        run_parser = subparsers.add_parser('run', description='create and start a job based on a job template file')
-        run_parser.add_argument('job_template', type=argparse.FileType('r'), help='job template file')
-        run_parser.add_argument('--token', type=str, help='Token used to authorize job (if necessary)')
+        run_parser = subparsers.add_parser('run', description='create and start jobs based on job template files')
+        run_parser.add_argument('--token', type=str, help='Token used to authorize jobs (if necessary)')
         run_parser.set_defaults(func=self._run)
 
+        for parser in [create_parser, run_parser]:
+            parser.add_argument('job_templates', metavar='job_template', nargs='+',
+                                help='job template file or glob pattern, - to read a job template from stdin')
+            parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS,
+                                help='Maximum number of jobs to create at the same time.')
+
+        cohort_parser = subparsers.add_parser('cohort', description='build one job per sample from a base job '
+                                                                    'template and a sample sheet')
+        cohort_parser.add_argument('base_job_template', type=argparse.FileType('r'),
+                                   help='job template file with ${column} placeholders')
+        cohort_parser.add_argument('sample_sheet', type=argparse.FileType('r'),
+                                   help='CSV or TSV file with a header row of column names and one row per sample')
+        cohort_action_group = cohort_parser.add_mutually_exclusive_group()
+        cohort_action_group.add_argument('--create', action='store_true', help='Create a job for each sample.')
+        cohort_action_group.add_argument('--run', action='store_true', help='Create and start a job for each sample.')
+        cohort_parser.add_argument('--token', type=str, help='Token used to authorize jobs (if necessary)')
+        cohort_parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS,
+                                   help='Maximum number of jobs to create at the same time.')
+        cohort_parser.set_defaults(func=self._cohort)
+
         validate_parser = subparsers.add_parser('validate', description='validate a job template file')
         validate_parser.add_argument('job_template', type=argparse.FileType('r'), help='job template file')
         validate_parser.set_defaults(func=self._validate)
 
         list_parser = subparsers.add_parser('list', description='list jobs')
+        list_parser.add_argument('--state', help='Only list jobs in this state.')
+        list_parser.add_argument('--since', metavar='DATETIME',
+                                 help='Only list jobs updated at or after this ISO 8601 date/time.')
+        list_parser.add_argument('--workflow-tag', metavar='WORKFLOW_TAG',
+                                 help='Only list jobs for the workflow with this tag.')
+        list_parser.add_argument('--limit', type=int, help='Maximum number of jobs to list.')
+        add_output_format_argument(list_parser)
         list_parser.set_defaults(func=self._list)
 
+        watch_parser = subparsers.add_parser('watch', description='print job state changes as they happen')
+        watch_parser.add_argument('job_ids', metavar='JOB_ID', type=int, nargs='*',
+                                  help='Jobs to watch until they finish. Watches all jobs if not specified.')
+        watch_parser.add_argument('--interval', type=float, default=5,
+                                  help='Seconds between polls while jobs are changing.')
+        watch_parser.add_argument('--max-interval', type=float, default=60,
+                                  help='Maximum seconds between polls while jobs are not changing.')
+        watch_parser.set_defaults(func=self._watch)
+
         start_parser = subparsers.add_parser('start', description='start job')
         start_parser.add_argument('job_id', type=int)
         start_parser.add_argument('--token', type=str, help='Token used to authorize job (if necessary)')
@@ -341,16 +535,24 @@ class JobCommand(object):
         delete_parser.set_defaults(func=self._delete)
 
     def _create(self, args):
-        self.target.job_create(job_template_infile=args.job_template)
+        self.target.job_create(job_template_paths=args.job_templates, max_workers=args.max_workers)
 
     def _run(self, args):
-        self.target.job_run(job_template_infile=args.job_template, token=args.token)
+        self.target.job_run(job_template_paths=args.job_templates, token=args.token, max_workers=args.max_workers)
+
+    def _cohort(self, args):
+        self.target.job_cohort(base_job_template_infile=args.base_job_template, sample_sheet_infile=args.sample_sheet,
+                               create=args.create, run=args.run, token=args.token, max_workers=args.max_workers)
 
     def _validate(self, args):
         self.target.job_validate(job_template_infile=args.job_template)
 
     def _list(self, args):
-        self.target.jobs_list()
+        self.target.jobs_list(state=args.state, since=args.since, workflow_tag=args.workflow_tag, limit=args.limit,
+                              output_format=args.output_format)
+
+    def _watch(self, args):
+        self.target.jobs_watch(job_ids=args.job_ids, min_interval=args.interval, max_interval=args.max_interval)
 
     def _start(self, args):
         self.target.start_job(job_id=args.job_id, token=args.token)
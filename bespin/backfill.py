@@ -0,0 +1,143 @@
+"""
+Creates tool details for the workflow versions in bespin-api that have none.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import time
+from bespin.tool_details import ToolDetails, ToolDetailsCache
+from bespin.workflow import CWLWorkflowVersion
+
+DEFAULT_MAX_PROCESSES = 4
+DEFAULT_MAX_POSTS = 4
+
+
+def extract_tool_details(workflow_version, strict, cache_filename):
+    """
+    Extract the tool details of a workflow version, run in a worker process
+    :param workflow_version: dict: workflow version from bespin-api
+    :param strict: bool: load the workflow with cwltool
+    :param cache_filename: str: path of the tool details cache file or None to extract every tool
+    :return: ([dict], dict): built tool details and the cache records added while extracting them
+    """
+    cache = ToolDetailsCache(cache_filename) if cache_filename else None
+    cwl_workflow_version = CWLWorkflowVersion(workflow_version['url'], workflow_version['type'],
+                                              workflow_version['workflow_path'], validate=False, strict=strict)
+    contents = ToolDetails(cwl_workflow_version, cache).contents
+    return contents, cache.added_records if cache else {}
+
+
+class ToolDetailsBackfillResult(object):
+    """
+    Outcome of creating tool details for one workflow version
+    """
+    def __init__(self, workflow_version):
+        self.workflow_version_id = workflow_version['id']
+        self.label = workflow_version.get('tag') or str(workflow_version['id'])
+        self.tool_details_id = None
+        self.num_tools = None
+        self.error = None
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+class ToolDetailsBackfill(object):
+    """
+    Creates tool details for workflow versions. The CWL of each workflow version is downloaded and its tools extracted
+    on a pool of processes. Each extraction reads the ToolDetailsCache file when it starts and returns the tools it
+    extracted, which are saved to the file so extractions started later do not parse them again.
+    Tool details are posted to bespin-api by a bounded pool of threads as soon as they are extracted.
+    """
+    def __init__(self, api, cache=None, max_processes=DEFAULT_MAX_PROCESSES, max_posts=DEFAULT_MAX_POSTS,
+                 strict=False):
+        """
+        :param api: BespinApi: api used to find workflow versions and create tool details
+        :param cache: ToolDetailsCache: cache that worker processes start from, updated with the tools they extract
+        :param max_processes: int: maximum number of workflow versions to extract at the same time
+        :param max_posts: int: maximum number of tool details to post at the same time
+        :param strict: bool: load workflows with cwltool, which does not use the cache
+        """
+        self.api = api
+        self.cache = cache
+        self.max_processes = max_processes
+        self.max_posts = max_posts
+        self.strict = strict
+        self.elapsed_seconds = None
+
+    def find_workflow_versions(self, workflow_tag=None):
+        """
+        :param workflow_tag: str: only include versions of this workflow when not None
+        :return: ([dict], int): workflow versions without tool details, number of workflow versions skipped
+        because they already have tool details
+        """
+        with_tool_details = set(tool_details['workflow_version']
+                                for tool_details in self.api.workflow_version_tool_details_list())
+        workflow_versions = []
+        skipped = 0
+        for workflow_version in self.api.workflow_versions_list(workflow_tag):
+            if workflow_version['id'] in with_tool_details:
+                skipped += 1
+            else:
+                workflow_versions.append(workflow_version)
+        return workflow_versions, skipped
+
+    def run(self, workflow_versions, on_result=None):
+        """
+        Create tool details for each workflow version
+        :param workflow_versions: [dict]: workflow versions from bespin-api
+        :param on_result: function: called with each ToolDetailsBackfillResult as soon as it is complete
+        :return: [ToolDetailsBackfillResult]: results in the same order as workflow_versions
+        """
+        start_time = time.time()
+        results = [ToolDetailsBackfillResult(workflow_version) for workflow_version in workflow_versions]
+        cache_filename = None
+        if self.cache and not self.strict:
+            # extractions read the cache file so it must include any records added in this process
+            self.cache.save()
+            cache_filename = self.cache.filename
+        with ProcessPoolExecutor(max_workers=self.max_processes) as process_executor, \
+                ThreadPoolExecutor(max_workers=self.max_posts) as thread_executor:
+            extract_futures = dict(
+                (process_executor.submit(extract_tool_details, workflow_version, self.strict, cache_filename), result)
+                for workflow_version, result in zip(workflow_versions, results))
+            post_futures = {}
+            pending = set(extract_futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in extract_futures:
+                        result = extract_futures[future]
+                        post_future = self._submit_post(thread_executor, future, result)
+                        if post_future:
+                            post_futures[post_future] = result
+                            pending.add(post_future)
+                            continue
+                    else:
+                        result = post_futures[future]
+                    if on_result:
+                        on_result(result)
+        self.elapsed_seconds = time.time() - start_time
+        return results
+
+    def _submit_post(self, executor, extract_future, result):
+        """
+        :return: Future: posting of the extracted tool details, None when extracting them failed
+        """
+        try:
+            contents, added_records = extract_future.result()
+        except Exception as ex:
+            # record the failure so the remaining workflow versions are still processed
+            result.error = ex
+            return None
+        if self.cache and added_records:
+            self.cache.add_records(added_records)
+            self.cache.save()
+        return executor.submit(self._post_tool_details, result, contents)
+
+    def _post_tool_details(self, result, contents):
+        try:
+            response = self.api.workflow_version_tool_details_post(result.workflow_version_id, contents)
+            result.tool_details_id = response['id']
+            result.num_tools = len(contents)
+        except Exception as ex:
+            result.error = ex
@@ -0,0 +1,255 @@
+"""
+Stores benchmark results as baselines keyed by git revision and machine fingerprint,
+and compares new results against them to find statistically meaningful regressions.
+"""
+import datetime
+import hashlib
+import json
+import math
+import os
+import platform
+import subprocess
+from bespin.exceptions import UserInputException
+
+BENCHMARK_DIRECTORY_ENV = 'BESPIN_BENCHMARK_DIR'
+DEFAULT_BENCHMARK_DIRECTORY = '~/.bespin-benchmarks'
+BASELINE_FORMAT_VERSION = 1
+DEFAULT_THRESHOLD_PERCENT = 10.0
+UNKNOWN_REVISION = 'unknown'
+COMPARISON_COLUMN_NAMES = ['name', 'baseline_mean_seconds', 'mean_seconds', 'change_percent', 'ci_low_percent',
+                           'ci_high_percent', 'baseline_requests', 'requests', 'status']
+STATUS_REGRESSION = 'regression'
+STATUS_IMPROVEMENT = 'improvement'
+STATUS_NO_CHANGE = 'no change'
+STATUS_NEW = 'new'
+# two sided 95% critical values of Student's t distribution by degrees of freedom
+T_CRITICAL_VALUES_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+Z_CRITICAL_VALUE_95 = 1.960
+
+
+def get_git_revision(directory=os.path.dirname(os.path.abspath(__file__))):
+    """
+    :param directory: str: directory inside the git checkout
+    :return: str: abbreviated commit id with -dirty appended when there are uncommitted changes,
+    UNKNOWN_REVISION when not in a git checkout
+    """
+    revision = resolve_git_revision('HEAD', directory)
+    if revision == 'HEAD':
+        return UNKNOWN_REVISION
+    changes = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory)
+    if changes.strip():
+        revision += '-dirty'
+    return revision
+
+
+def resolve_git_revision(name, directory=os.path.dirname(os.path.abspath(__file__))):
+    """
+    :param name: str: git revision such as HEAD~1, a tag or a commit id
+    :param directory: str: directory inside the git checkout
+    :return: str: abbreviated commit id, name when git can not resolve it
+    """
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short=12', '--verify', '--quiet',
+                                          '{}^{{commit}}'.format(name)], cwd=directory, stderr=subprocess.STDOUT)
+        return output.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return name
+
+
+def get_machine_info():
+    """
+    :return: dict: details of the machine and python that affect benchmark timings
+    """
+    return {
+        'system': platform.system(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python_implementation': platform.python_implementation(),
+        'python_version': platform.python_version(),
+    }
+
+
+def get_machine_fingerprint(machine_info):
+    """
+    :param machine_info: dict: result of get_machine_info
+    :return: str: short id that is the same for every run on the same machine and python
+    """
+    canonical_json = json.dumps(machine_info, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical_json.encode('utf-8')).hexdigest()[:12]
+
+
+def create_baseline(results, revision, machine_info):
+    """
+    :param results: [dict]: results from BenchmarkRunner
+    :param revision: str: git revision the results were measured at
+    :param machine_info: dict: result of get_machine_info
+    :return: dict: baseline in the current format
+    """
+    return {
+        'format_version': BASELINE_FORMAT_VERSION,
+        'revision': revision,
+        'fingerprint': get_machine_fingerprint(machine_info),
+        'machine': machine_info,
+        'created': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'results': results,
+    }
+
+
+def load_baseline_file(filename):
+    """
+    :param filename: str: path of a baseline JSON file
+    :return: dict: baseline
+    """
+    try:
+        with open(filename) as infile:
+            baseline = json.load(infile)
+    except ValueError:
+        raise UserInputException("Benchmark baseline {} is not valid JSON.".format(filename))
+    if baseline.get('format_version') != BASELINE_FORMAT_VERSION:
+        raise UserInputException("Benchmark baseline {} has format version {}, expected {}.".format(
+            filename, baseline.get('format_version'), BASELINE_FORMAT_VERSION))
+    return baseline
+
+
+class BaselineStore(object):
+    """
+    Directory of baselines, one JSON file per machine fingerprint and git revision
+    """
+    def __init__(self, directory=os.environ.get(BENCHMARK_DIRECTORY_ENV, DEFAULT_BENCHMARK_DIRECTORY)):
+        """
+        :param directory: str: directory to store baselines in, created when first needed
+        """
+        self.directory = os.path.expanduser(directory)
+
+    def get_filename(self, fingerprint, revision):
+        return os.path.join(self.directory, fingerprint, '{}.json'.format(revision))
+
+    def save(self, baseline):
+        """
+        Save a baseline replacing any earlier baseline for the same revision and machine
+        :param baseline: dict: result of create_baseline
+        :return: str: path of the saved file
+        """
+        filename = self.get_filename(baseline['fingerprint'], baseline['revision'])
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(filename)):
+                raise
+        with open(filename, 'w') as outfile:
+            json.dump(baseline, outfile, indent=2, sort_keys=True)
+            outfile.write('\n')
+        return filename
+
+    def load(self, fingerprint, revision):
+        """
+        :param fingerprint: str: machine fingerprint the baseline was measured on
+        :param revision: str: git revision the baseline was measured at
+        :return: dict: baseline
+        """
+        filename = self.get_filename(fingerprint, revision)
+        if not os.path.exists(filename):
+            raise UserInputException("No benchmark baseline for revision {} on this machine ({}) in {}.".format(
+                revision, fingerprint, self.directory))
+        return load_baseline_file(filename)
+
+
+def get_t_critical_value(degrees_of_freedom):
+    if degrees_of_freedom > len(T_CRITICAL_VALUES_95):
+        return Z_CRITICAL_VALUE_95
+    # rounding down the degrees of freedom gives a slightly wider, conservative interval
+    return T_CRITICAL_VALUES_95[max(int(degrees_of_freedom), 1) - 1]
+
+
+def mean_and_variance(values):
+    mean = sum(values) / float(len(values))
+    variance = sum((value - mean) ** 2 for value in values) / float(len(values) - 1)
+    return mean, variance
+
+
+def confidence_interval(baseline_seconds, current_seconds):
+    """
+    95% confidence interval of the difference in mean run time (current - baseline) using Welch's t-test
+    :param baseline_seconds: [float]: run times from the baseline
+    :param current_seconds: [float]: run times from the current results
+    :return: (float, float): low and high seconds or None when either side has fewer than two runs
+    """
+    if len(baseline_seconds) < 2 or len(current_seconds) < 2:
+        return None
+    baseline_mean, baseline_variance = mean_and_variance(baseline_seconds)
+    current_mean, current_variance = mean_and_variance(current_seconds)
+    difference = current_mean - baseline_mean
+    baseline_term = baseline_variance / len(baseline_seconds)
+    current_term = current_variance / len(current_seconds)
+    standard_error = math.sqrt(baseline_term + current_term)
+    if standard_error == 0:
+        return difference, difference
+    degrees_of_freedom = (baseline_term + current_term) ** 2 / (
+        baseline_term ** 2 / (len(baseline_seconds) - 1) + current_term ** 2 / (len(current_seconds) - 1))
+    margin = get_t_critical_value(degrees_of_freedom) * standard_error
+    return difference - margin, difference + margin
+
+
+def compare_result(baseline_result, result, threshold_percent):
+    """
+    Compare the run times of one benchmark.
+    It is a regression when it is slower by more than threshold_percent and the confidence interval of the
+    difference is entirely above zero, so noise between runs is not reported.
+    :param baseline_result: dict: result from the baseline or None when the benchmark is new
+    :param result: dict: current result
+    :param threshold_percent: float: smallest change in mean run time that is reported
+    :return: dict: comparison with COMPARISON_COLUMN_NAMES
+    """
+    mean_seconds = sum(result['seconds']) / len(result['seconds'])
+    comparison = {
+        'name': result['name'],
+        'baseline_mean_seconds': None,
+        'mean_seconds': round(mean_seconds, 4),
+        'change_percent': None,
+        'ci_low_percent': None,
+        'ci_high_percent': None,
+        'baseline_requests': None,
+        'requests': result['requests'],
+        'status': STATUS_NEW,
+    }
+    if baseline_result is None:
+        return comparison
+    baseline_mean_seconds = sum(baseline_result['seconds']) / len(baseline_result['seconds'])
+    change_percent = (mean_seconds - baseline_mean_seconds) * 100.0 / baseline_mean_seconds
+    interval = confidence_interval(baseline_result['seconds'], result['seconds'])
+    if interval is None:
+        # without repeated runs there is no measure of noise so the threshold alone decides
+        significant = True
+    else:
+        ci_low, ci_high = [value * 100.0 / baseline_mean_seconds for value in interval]
+        comparison['ci_low_percent'] = round(ci_low, 1)
+        comparison['ci_high_percent'] = round(ci_high, 1)
+        significant = ci_low > 0 or ci_high < 0
+    status = STATUS_NO_CHANGE
+    if significant and change_percent > threshold_percent:
+        status = STATUS_REGRESSION
+    elif significant and change_percent < -threshold_percent:
+        status = STATUS_IMPROVEMENT
+    comparison.update({
+        'baseline_mean_seconds': round(baseline_mean_seconds, 4),
+        'change_percent': round(change_percent, 1),
+        'baseline_requests': baseline_result.get('requests'),
+        'status': status,
+    })
+    return comparison
+
+
+def compare_results(baseline, results, threshold_percent=DEFAULT_THRESHOLD_PERCENT):
+    """
+    :param baseline: dict: baseline to compare against
+    :param results: [dict]: current results from BenchmarkRunner
+    :param threshold_percent: float: smallest change in mean run time that is reported
+    :return: [dict]: one comparison per current result in the same order
+    """
+    baseline_results = dict((result['name'], result) for result in baseline['results'])
+    return [compare_result(baseline_results.get(result['name']), result, threshold_percent) for result in results]
@@ -0,0 +1,140 @@
+"""
+Creates jobs for many job template files in one process.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import sys
+import time
+from bespin.jobtemplate import JobTemplateLoader, JobCreationContext
+from bespin.exceptions import UserInputException
+from bespin.tracing import TRACER
+
+DEFAULT_MAX_WORKERS = 4
+GLOB_CHARACTERS = '*?['
+STDIN_PATH = '-'
+
+
+def expand_job_template_paths(patterns):
+    """
+    Expand any glob patterns (for patterns quoted to avoid shell expansion) into sorted file paths
+    :param patterns: [str]: file paths or glob patterns
+    :return: [str]: file paths
+    """
+    paths = []
+    for pattern in patterns:
+        if any(character in pattern for character in GLOB_CHARACTERS):
+            matching_paths = sorted(glob.glob(pattern))
+            if not matching_paths:
+                raise UserInputException("No job template files match {}".format(pattern))
+            paths.extend(matching_paths)
+        else:
+            paths.append(pattern)
+    return paths
+
+
+class JobTemplateFile(object):
+    """
+    Job template read from a file (or stdin when the path is -) when its job is created
+    """
+    def __init__(self, path):
+        self.label = path
+        self.path = path
+
+    def load(self):
+        if self.path == STDIN_PATH:
+            return JobTemplateLoader(sys.stdin).create_job_template()
+        try:
+            with open(self.path) as infile:
+                return JobTemplateLoader(infile).create_job_template()
+        except IOError as ex:
+            raise UserInputException("Unable to read job template file {}: {}".format(self.path, ex.strerror))
+
+
+class InMemoryJobTemplate(object):
+    """
+    Job template that was built in memory
+    """
+    def __init__(self, label, job_template):
+        """
+        :param label: str: name used to report the outcome of creating this job
+        :param job_template: JobTemplate: job template to create a job for
+        """
+        self.label = label
+        self.job_template = job_template
+
+    def load(self):
+        return self.job_template
+
+
+class JobBatchResult(object):
+    """
+    Outcome of creating (and optionally starting) a job for one job template
+    """
+    def __init__(self, label):
+        self.label = label
+        self.job_id = None
+        self.authorized = False
+        self.started = False
+        self.error = None
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+class JobBatch(object):
+    """
+    Creates jobs for job templates using a bounded pool of threads.
+    Lookups that are the same for every job are made once through a shared JobCreationContext.
+    """
+    def __init__(self, api, job_templates, max_workers=DEFAULT_MAX_WORKERS, context=None):
+        """
+        :param api: BespinApi: api used to create jobs
+        :param job_templates: [str|JobTemplateFile|InMemoryJobTemplate]: job template file paths or sources
+        :param max_workers: int: maximum number of jobs to create at the same time
+        :param context: JobCreationContext: optional context to share lookups with
+        """
+        self.api = api
+        self.job_templates = [JobTemplateFile(item) if isinstance(item, str) else item for item in job_templates]
+        self.max_workers = max_workers
+        self.context = context or JobCreationContext(api)
+        self.elapsed_seconds = None
+
+    def run(self, start_jobs=False, token=None, on_result=None):
+        """
+        Create a job for each job template
+        :param start_jobs: bool: start each job after it is created
+        :param token: str: token used to authorize jobs before they are started
+        :param on_result: function: called with each JobBatchResult, in job_templates order, once it is complete
+        :return: [JobBatchResult]: results in the same order as job_templates
+        """
+        start_time = time.time()
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(TRACER.bind(self._create_job), job_template_source, start_jobs, token)
+                       for job_template_source in self.job_templates]
+            for future in futures:
+                result = future.result()
+                if on_result:
+                    on_result(result)
+                results.append(result)
+        self.elapsed_seconds = time.time() - start_time
+        return results
+
+    def _create_job(self, job_template_source, start_jobs, token):
+        result = JobBatchResult(job_template_source.label)
+        try:
+            with TRACER.span('job batch item', {'label': result.label}):
+                job_template = job_template_source.load()
+                job = job_template.create_job(self.api, self.context)
+                result.job_id = job['job']
+                if start_jobs:
+                    if token:
+                        self.api.authorize_job(result.job_id, token)
+                        result.authorized = True
+                    self.api.start_job(result.job_id)
+                    result.started = True
+        except Exception as ex:
+            # record the failure so the remaining job templates are still processed
+            result.error = ex
+        return result
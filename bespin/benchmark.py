@@ -0,0 +1,407 @@
+"""
+Benchmarks of bespin-cli's hot paths using synthetic data, runnable offline:
+
+    python -m bespin.benchmark [--repeat N] [--filter TEXT] [--json PATH] [--save-baseline] [--compare REVISION]
+
+bespin-api requests go to a FakeBespinServer and DukeDS lookups to FakeDDSFileUtil.
+Each benchmark reports wall time over several runs, the requests made by one run and the peak traced memory.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import yaml
+from bespin.api import BespinApi
+from bespin.baseline import BaselineStore, create_baseline, load_baseline_file, compare_results, get_git_revision, \
+    resolve_git_revision, get_machine_info, get_machine_fingerprint, COMPARISON_COLUMN_NAMES, STATUS_REGRESSION, \
+    DEFAULT_THRESHOLD_PERCENT
+from bespin.commands import JobsList, FullWorkflowDetails
+from bespin.dukeds import DDSFileRecord
+from bespin.exceptions import UserInputException
+from bespin.fakeserver import FakeBespinServer, FakeBespinData
+from bespin.jobtemplate import JobTemplate, JobTemplateLoader, JobCreationContext, FormattedJobOrder
+from bespin.output import StreamingTable
+from bespin.tool_details import ToolDetailsBuilder
+
+DEFAULT_REPEAT = 3
+REGRESSION_EXIT_STATUS = 1
+USER_INPUT_EXIT_STATUS = 2
+RESULT_COLUMN_NAMES = ['name', 'repeat', 'min_seconds', 'mean_seconds', 'max_seconds', 'requests', 'peak_kib']
+FAKE_SERVER_PAGE_SIZE = 100
+BENCHMARK_JOB_TEMPLATE_TAG = 'workflow1/v1/config1'
+COLD_START_SCRIPT = """
+from bespin.argparser import ArgParser
+from bespin.commands import Commands
+ArgParser('benchmark', Commands('benchmark', 'benchmark')).argument_parser.format_help()
+"""
+
+
+def create_job_order(num_files):
+    """
+    Create a job order shaped like a paired-end sequencing workflow's: one record per sample holding two files
+    :param num_files: int: total number of DukeDS files in the job order
+    :return: dict: job order
+    """
+    samples = []
+    for idx in range(num_files // 2):
+        samples.append({
+            'name': 'sample{}'.format(idx),
+            'reads': [
+                {'class': 'File', 'path': 'dds://project/sample{}/reads_R1.fastq.gz'.format(idx)},
+                {'class': 'File', 'path': 'dds://project/sample{}/reads_R2.fastq.gz'.format(idx)},
+            ],
+        })
+    return {
+        'samples': samples,
+        'reference': {'class': 'File', 'path': 'https://example.com/reference.fa'},
+        'threads': 8,
+    }
+
+
+class FakeDDSFileUtil(object):
+    """
+    Stands in for DDSFileUtil, finding a file for every path without talking to DukeDS
+    """
+    def __init__(self):
+        self.request_count = 0
+
+    def find_file_for_path(self, duke_ds_file_path):
+        self.request_count += 1
+        return DDSFileRecord(project_id='project1', file_id=duke_ds_file_path, version_id='version1', size=1000,
+                             checked_at=0)
+
+    def give_download_permissions(self, project_id, dds_user_id):
+        self.request_count += 1
+
+
+class Benchmark(object):
+    """
+    Base class for benchmarks. Subclasses set name and implement run.
+    setup and teardown are not timed.
+    """
+    name = None
+
+    def setup(self):
+        pass
+
+    def run(self):
+        raise NotImplementedError()
+
+    def teardown(self):
+        pass
+
+    def get_request_count(self):
+        """
+        :return: int: requests made by the last run or None when the benchmark makes no requests
+        """
+        return None
+
+
+class FakeServerBenchmark(Benchmark):
+    """
+    Benchmark that talks to a FakeBespinServer serving data
+    """
+    def __init__(self, data):
+        self.data = data
+        self.server = None
+        self.api = None
+
+    def setup(self):
+        self.server = FakeBespinServer(self.data, page_size=FAKE_SERVER_PAGE_SIZE).start()
+        self.api = BespinApi(self.server.create_config(), user_agent_str='benchmark')
+
+    def run(self):
+        self.server.reset_request_counts()
+        self.run_with_api()
+
+    def run_with_api(self):
+        raise NotImplementedError()
+
+    def teardown(self):
+        self.server.stop()
+
+    def get_request_count(self):
+        return self.server.total_requests
+
+
+class JobsListBenchmark(FakeServerBenchmark):
+    def __init__(self, num_jobs):
+        super(JobsListBenchmark, self).__init__(FakeBespinData(num_jobs=num_jobs, num_workflows=10, num_versions=5))
+        self.name = 'jobs list {} jobs'.format(num_jobs)
+
+    def run_with_api(self):
+        for _ in JobsList(self.api).get_column_data():
+            pass
+
+
+class FullWorkflowDetailsBenchmark(FakeServerBenchmark):
+    def __init__(self, num_workflows, num_versions):
+        data = FakeBespinData(num_jobs=0, num_workflows=num_workflows, num_versions=num_versions)
+        super(FullWorkflowDetailsBenchmark, self).__init__(data)
+        self.name = 'workflow list {} versions'.format(num_workflows * num_versions)
+
+    def run_with_api(self):
+        for _ in FullWorkflowDetails(self.api, all_versions=True, tag=None).get_column_data():
+            pass
+
+
+class CreateJobBenchmark(FakeServerBenchmark):
+    def __init__(self, num_files):
+        super(CreateJobBenchmark, self).__init__(FakeBespinData(num_jobs=0))
+        self.name = 'create job {} files'.format(num_files)
+        self.num_files = num_files
+        self.dds_file_util = None
+
+    def run_with_api(self):
+        self.dds_file_util = FakeDDSFileUtil()
+        job_template = JobTemplate(tag=BENCHMARK_JOB_TEMPLATE_TAG, name='benchmark', fund_code='001',
+                                   job_order=create_job_order(self.num_files))
+        job_template.create_job(self.api, JobCreationContext(self.api, self.dds_file_util))
+
+    def get_request_count(self):
+        return self.server.total_requests + self.dds_file_util.request_count
+
+
+class FormatJobOrderBenchmark(Benchmark):
+    def __init__(self, num_files):
+        self.name = 'job order format {} files'.format(num_files)
+        self.job_order = create_job_order(num_files)
+
+    def run(self):
+        FormattedJobOrder(self.job_order)
+
+
+class FakeWorkflow(object):
+    """
+    Visits CommandLineTool nodes the way a loaded cwltool workflow does, repeating tools like a scattered workflow
+    """
+    def __init__(self, num_nodes, num_tools):
+        self.nodes = []
+        for idx in range(num_nodes):
+            tool_idx = idx % num_tools
+            self.nodes.append({
+                'class': 'CommandLineTool',
+                'id': 'file:///tmp/workflow/tools/tool{}.cwl'.format(tool_idx),
+                'requirements': [{'class': 'DockerRequirement', 'dockerPull': 'example/tool{}:1.0'.format(tool_idx)}],
+                'hints': [{'class': 'SoftwareRequirement', 'packages': [
+                    {'package': 'tool{}'.format(tool_idx), 'version': ['1.0']},
+                ]}],
+            })
+
+    def visit(self, op):
+        for node in self.nodes:
+            op(node)
+
+
+class ToolDetailsBuilderBenchmark(Benchmark):
+    def __init__(self, num_nodes, num_tools):
+        self.name = 'tool details {} nodes'.format(num_nodes)
+        self.workflow = FakeWorkflow(num_nodes, num_tools)
+
+    def run(self):
+        builder = ToolDetailsBuilder('file:///tmp/workflow/')
+        builder.accept(self.workflow)
+        builder.build()
+
+
+class YamlBenchmark(Benchmark):
+    def __init__(self, num_files):
+        self.name = 'yaml dump/load {} files'.format(num_files)
+        self.data = {
+            'tag': BENCHMARK_JOB_TEMPLATE_TAG,
+            'name': 'benchmark',
+            'fund_code': '001',
+            'job_order': create_job_order(num_files),
+        }
+
+    def run(self):
+        text = yaml.safe_dump(self.data, default_flow_style=False)
+        JobTemplateLoader.create_job_template_for_data(yaml.safe_load(text))
+
+
+class ColdStartBenchmark(Benchmark):
+    """
+    Time to start a new python process, import the bespin modules and build the command line parser
+    """
+    name = 'cli cold start'
+
+    def run(self):
+        subprocess.check_call([sys.executable, '-c', COLD_START_SCRIPT])
+
+
+def get_default_benchmarks():
+    """
+    :return: [Benchmark]: every benchmark in the suite
+    """
+    return [
+        JobsListBenchmark(10),
+        JobsListBenchmark(1000),
+        JobsListBenchmark(10000),
+        FullWorkflowDetailsBenchmark(num_workflows=10, num_versions=20),
+        CreateJobBenchmark(10),
+        CreateJobBenchmark(100),
+        CreateJobBenchmark(1000),
+        FormatJobOrderBenchmark(10000),
+        ToolDetailsBuilderBenchmark(num_nodes=1000, num_tools=100),
+        ToolDetailsBuilderBenchmark(num_nodes=5000, num_tools=1000),
+        YamlBenchmark(1000),
+        ColdStartBenchmark(),
+    ]
+
+
+class BenchmarkRunner(object):
+    """
+    Runs benchmarks timing several runs of each, then runs each once more under tracemalloc for its peak memory
+    """
+    def __init__(self, repeat=DEFAULT_REPEAT, measure_memory=True):
+        """
+        :param repeat: int: number of timed runs of each benchmark
+        :param measure_memory: bool: also measure peak traced memory with an extra run
+        """
+        self.repeat = repeat
+        self.measure_memory = measure_memory
+
+    def run(self, benchmarks):
+        """
+        Generate results as each benchmark completes
+        :param benchmarks: [Benchmark]: benchmarks to run
+        :return: generator of dict: one result per benchmark (see RESULT_COLUMN_NAMES) plus its run 'seconds'
+        """
+        for benchmark in benchmarks:
+            yield self.run_benchmark(benchmark)
+
+    def run_benchmark(self, benchmark):
+        benchmark.setup()
+        try:
+            seconds = []
+            request_count = None
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                benchmark.run()
+                seconds.append(time.perf_counter() - start)
+                if request_count is None:
+                    request_count = benchmark.get_request_count()
+            peak_kib = None
+            if self.measure_memory:
+                peak_kib = self.measure_peak_kib(benchmark)
+        finally:
+            benchmark.teardown()
+        return {
+            'name': benchmark.name,
+            'repeat': self.repeat,
+            'seconds': seconds,
+            'min_seconds': round(min(seconds), 4),
+            'mean_seconds': round(sum(seconds) / len(seconds), 4),
+            'max_seconds': round(max(seconds), 4),
+            'requests': request_count,
+            'peak_kib': peak_kib,
+        }
+
+    @staticmethod
+    def measure_peak_kib(benchmark):
+        tracemalloc.start()
+        try:
+            benchmark.run()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return round(peak / 1024.0, 1)
+
+
+def select_benchmarks(benchmarks, name_filters):
+    """
+    :param benchmarks: [Benchmark]: benchmarks to select from
+    :param name_filters: [str]: keep benchmarks whose name contains any of these, keep all when empty
+    :return: [Benchmark]: selected benchmarks
+    """
+    if not name_filters:
+        return benchmarks
+    return [benchmark for benchmark in benchmarks if any(text in benchmark.name for text in name_filters)]
+
+
+def load_compare_baseline(store, revision_or_path, fingerprint):
+    """
+    :param store: BaselineStore: saved baselines
+    :param revision_or_path: str: git revision whose baseline was saved on this machine or path of a baseline file
+    :param fingerprint: str: fingerprint of this machine
+    :return: dict: baseline
+    """
+    if os.path.isfile(revision_or_path):
+        baseline = load_baseline_file(revision_or_path)
+        if baseline['fingerprint'] != fingerprint:
+            sys.stderr.write("Warning: baseline {} was measured on a different machine ({}).\n".format(
+                revision_or_path, baseline['fingerprint']))
+        return baseline
+    return store.load(fingerprint, resolve_git_revision(revision_or_path))
+
+
+def main(args=None):
+    """
+    Run the benchmarks printing the results and optionally saving or comparing them with a baseline
+    :param args: [str]: command line arguments, sys.argv when None
+    :return: int: REGRESSION_EXIT_STATUS when a comparison finds a regression, otherwise 0
+    """
+    parser = argparse.ArgumentParser(description='Benchmark bespin-cli hot paths against synthetic data.')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Number of timed runs of each benchmark.')
+    parser.add_argument('--filter', action='append', default=[], metavar='TEXT',
+                        help='Only run benchmarks whose name contains TEXT, may be repeated.')
+    parser.add_argument('--no-memory', action='store_true', help='Skip measuring peak memory.')
+    parser.add_argument('--json', metavar='PATH', help='Also write results to PATH as a baseline JSON file.')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Save results as the baseline for the current git revision on this machine.')
+    parser.add_argument('--compare', metavar='REVISION_OR_PATH',
+                        help='Compare results with the baseline saved for REVISION on this machine or a baseline '
+                             'JSON file, exiting with status {} when any benchmark regressed.'.format(
+                            REGRESSION_EXIT_STATUS))
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD_PERCENT, metavar='PERCENT',
+                        help='Smallest slowdown of the mean run time reported as a regression (default: %(default)s).')
+    parser.add_argument('--baseline-dir', metavar='DIR', default=BaselineStore().directory,
+                        help='Directory of saved baselines (default: %(default)s).')
+    parsed_args = parser.parse_args(args)
+    store = BaselineStore(parsed_args.baseline_dir)
+    machine_info = get_machine_info()
+    compare_baseline = None
+    if parsed_args.compare:
+        # load the baseline first so a missing one is reported before spending time running benchmarks
+        compare_baseline = load_compare_baseline(store, parsed_args.compare, get_machine_fingerprint(machine_info))
+    runner = BenchmarkRunner(parsed_args.repeat, measure_memory=not parsed_args.no_memory)
+    results = []
+    for benchmark in select_benchmarks(get_default_benchmarks(), parsed_args.filter):
+        sys.stderr.write("Running {}\n".format(benchmark.name))
+        results.append(runner.run_benchmark(benchmark))
+    StreamingTable(RESULT_COLUMN_NAMES, results).write(sys.stdout)
+
+    baseline = create_baseline(results, get_git_revision(), machine_info)
+    if parsed_args.json:
+        with open(parsed_args.json, 'w') as outfile:
+            json.dump(baseline, outfile, indent=2, sort_keys=True)
+            outfile.write('\n')
+    if parsed_args.save_baseline:
+        sys.stderr.write("Saved baseline to {}\n".format(store.save(baseline)))
+    if compare_baseline:
+        return print_comparison(compare_baseline, results, parsed_args.threshold)
+    return 0
+
+
+def print_comparison(baseline, results, threshold_percent):
+    comparisons = compare_results(baseline, results, threshold_percent)
+    print("\nCompared with baseline {} from {}:".format(baseline['revision'], baseline['created']))
+    StreamingTable(COMPARISON_COLUMN_NAMES, comparisons).write(sys.stdout)
+    regressions = [comparison for comparison in comparisons if comparison['status'] == STATUS_REGRESSION]
+    if regressions:
+        print("{} of {} benchmarks regressed by more than {}%.".format(len(regressions), len(comparisons),
+                                                                       threshold_percent))
+        return REGRESSION_EXIT_STATUS
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except UserInputException as ex:
+        print(str(ex))
+        sys.exit(USER_INPUT_EXIT_STATUS)
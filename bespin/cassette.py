@@ -0,0 +1,265 @@
+"""
+Records the HTTP requests made through the requests package (BespinApi and the DukeDS client) into a cassette file
+with tokens scrubbed, and replays them offline (see the global --record-http and --replay-http options).
+"""
+from contextlib import contextmanager
+import base64
+import datetime
+import json
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from bespin.exceptions import UserInputException
+
+CASSETTE_FORMAT_VERSION = 1
+SCRUBBED_VALUE = 'SCRUBBED'
+SENSITIVE_HEADERS = ('authorization', 'cookie', 'set-cookie', 'proxy-authorization')
+SENSITIVE_FIELDS = ('token', 'api_token', 'agent_key', 'user_key', 'password', 'secret')
+# the recorded body has already been decoded so these no longer describe it
+REPLAY_SKIPPED_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length')
+BODY_ENCODING_TEXT = 'text'
+BODY_ENCODING_BASE64 = 'base64'
+
+
+class CassetteMismatchException(UserInputException):
+    pass
+
+
+def is_sensitive_field(name):
+    return any(sensitive_field in name.lower() for sensitive_field in SENSITIVE_FIELDS)
+
+
+def scrub_data(data):
+    """
+    Return a copy of JSON data with the values of token, key and password fields replaced
+    :param data: object: dict, list or value decoded from JSON
+    :return: object: scrubbed copy
+    """
+    if isinstance(data, dict):
+        return dict((key, SCRUBBED_VALUE if is_sensitive_field(key) else scrub_data(value))
+                    for key, value in data.items())
+    if isinstance(data, list):
+        return [scrub_data(item) for item in data]
+    return data
+
+
+def scrub_headers(headers):
+    return dict((name, SCRUBBED_VALUE if name.lower() in SENSITIVE_HEADERS else value)
+                for name, value in headers.items())
+
+
+def scrub_request_body(body):
+    """
+    Scrub a request body so it can be stored and compared with the bodies of replayed requests
+    :param body: bytes or str: body sent with the request or None
+    :return: str: JSON bodies scrubbed and with sorted keys, other bodies as text, None when empty
+    """
+    if not body:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    try:
+        return json.dumps(scrub_data(json.loads(body)), sort_keys=True)
+    except ValueError:
+        return body
+
+
+def encode_response_body(content):
+    """
+    :param content: bytes: response body
+    :return: (str, str): body encoding and the scrubbed body, JSON and text as is and anything else as base64
+    """
+    try:
+        text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        return BODY_ENCODING_BASE64, base64.b64encode(content).decode('ascii')
+    try:
+        return BODY_ENCODING_TEXT, json.dumps(scrub_data(json.loads(text)))
+    except ValueError:
+        return BODY_ENCODING_TEXT, text
+
+
+def decode_response_body(body_encoding, body):
+    if body_encoding == BODY_ENCODING_BASE64:
+        return base64.b64decode(body)
+    return body.encode('utf-8')
+
+
+def get_interaction_key(method, url, request_body):
+    return method, url, request_body
+
+
+@contextmanager
+def patch_http_send(send):
+    """
+    Route every request made with the requests package through send while in the with statement
+    :param send: function: called with the original HTTPAdapter.send, the adapter, the PreparedRequest and
+    send's keyword arguments, returns a Response
+    """
+    original_send = HTTPAdapter.send
+
+    def patched_send(adapter, request, **kwargs):
+        return send(original_send, adapter, request, **kwargs)
+
+    HTTPAdapter.send = patched_send
+    try:
+        yield
+    finally:
+        HTTPAdapter.send = original_send
+
+
+class Cassette(object):
+    """
+    HTTP interactions in the order their responses were received
+    """
+    def __init__(self, interactions=None, created=None):
+        self.interactions = interactions if interactions is not None else []
+        self.created = created or datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    @staticmethod
+    def load(filename):
+        try:
+            with open(filename) as infile:
+                data = json.load(infile)
+        except ValueError:
+            raise UserInputException("HTTP cassette {} is not valid JSON.".format(filename))
+        if data.get('format_version') != CASSETTE_FORMAT_VERSION:
+            raise UserInputException("HTTP cassette {} has format version {}, expected {}.".format(
+                filename, data.get('format_version'), CASSETTE_FORMAT_VERSION))
+        return Cassette(data['interactions'], data.get('created'))
+
+    def save(self, filename):
+        with open(filename, 'w') as outfile:
+            json.dump({
+                'format_version': CASSETTE_FORMAT_VERSION,
+                'created': self.created,
+                'interactions': self.interactions,
+            }, outfile, indent=2)
+            outfile.write('\n')
+
+
+class HTTPRecorder(object):
+    """
+    Sends requests as usual while adding each exchange to a cassette. Safe to use from multiple threads.
+    """
+    def __init__(self, cassette=None):
+        self.cassette = cassette or Cassette()
+        self._lock = threading.Lock()
+        self._start = time.time()
+
+    @contextmanager
+    def activate(self):
+        with patch_http_send(self.send):
+            yield self
+
+    def send(self, original_send, adapter, request, **kwargs):
+        start = time.time()
+        response = original_send(adapter, request, **kwargs)
+        # reading the content here keeps it available to the caller, even for streamed responses
+        body_encoding, body = encode_response_body(response.content)
+        elapsed = time.time() - start
+        interaction = {
+            'method': request.method,
+            'url': request.url,
+            'request_body': scrub_request_body(request.body),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': scrub_headers(response.headers),
+            'body_encoding': body_encoding,
+            'body': body,
+            'started': round(start - self._start, 6),
+            'elapsed': round(elapsed, 6),
+        }
+        with self._lock:
+            self.cassette.interactions.append(interaction)
+        return response
+
+
+class HTTPReplayer(object):
+    """
+    Answers requests from a cassette without using the network. Safe to use from multiple threads.
+    Requests are matched by method, url and scrubbed body, in recorded order when the same request was made
+    several times. Once those are used up the last of them is repeated, so retried token requests still match.
+    """
+    def __init__(self, cassette, realtime=True):
+        """
+        :param cassette: Cassette: recorded interactions
+        :param realtime: bool: wait as long as each recorded request took before answering, otherwise answer at once
+        """
+        self.realtime = realtime
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._last_interactions = {}
+        for interaction in cassette.interactions:
+            key = get_interaction_key(interaction['method'], interaction['url'], interaction['request_body'])
+            self._queues.setdefault(key, []).append(interaction)
+
+    @contextmanager
+    def activate(self):
+        with patch_http_send(self.send):
+            yield self
+
+    @property
+    def unused_interaction_count(self):
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def send(self, original_send, adapter, request, **kwargs):
+        interaction = self._take_interaction(request)
+        if self.realtime:
+            time.sleep(interaction['elapsed'])
+        return self._create_response(request, interaction)
+
+    def _take_interaction(self, request):
+        key = get_interaction_key(request.method, request.url, scrub_request_body(request.body))
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                self._last_interactions[key] = queue.pop(0)
+            interaction = self._last_interactions.get(key)
+        if interaction is None:
+            raise CassetteMismatchException("No recorded HTTP response for {} {}.".format(request.method,
+                                                                                          request.url))
+        return interaction
+
+    @staticmethod
+    def _create_response(request, interaction):
+        response = Response()
+        response.status_code = interaction['status']
+        response.reason = interaction['reason']
+        response.headers = CaseInsensitiveDict(dict(
+            (name, value) for name, value in interaction['headers'].items()
+            if name.lower() not in REPLAY_SKIPPED_HEADERS))
+        response._content = decode_response_body(interaction['body_encoding'], interaction['body'])
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.elapsed = datetime.timedelta(seconds=interaction['elapsed'])
+        return response
+
+
+@contextmanager
+def record_http(filename):
+    """
+    Record HTTP requests made in the with statement to a cassette file, saved even when the body fails
+    :param filename: str: path of the cassette file to write
+    """
+    recorder = HTTPRecorder()
+    try:
+        with recorder.activate():
+            yield recorder
+    finally:
+        recorder.cassette.save(filename)
+
+
+@contextmanager
+def replay_http(filename, realtime=True):
+    """
+    Answer HTTP requests made in the with statement from a cassette file
+    :param filename: str: path of the cassette file to read
+    :param realtime: bool: wait as long as each recorded request took before answering
+    """
+    with HTTPReplayer(Cassette.load(filename), realtime).activate() as replayer:
+        yield replayer
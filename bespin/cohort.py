@@ -0,0 +1,115 @@
+"""
+Builds one job template per sample from a base job template and a sample sheet.
+"""
+import csv
+import string
+from bespin.jobtemplate import JobTemplateLoader
+from bespin.exceptions import UserInputException
+
+TAB_SEPARATED_EXTENSIONS = ('.tsv', '.tab', '.txt')
+COMMA_SEPARATED_EXTENSIONS = ('.csv',)
+
+
+def get_sample_sheet_delimiter(filename, sample_text):
+    """
+    Determine the delimiter of a sample sheet from its file extension, sniffing the contents when that is unknown
+    :param filename: str: name of the sample sheet file
+    :param sample_text: str: beginning of the sample sheet contents
+    :return: str: delimiter character
+    """
+    lower_filename = filename.lower()
+    if lower_filename.endswith(TAB_SEPARATED_EXTENSIONS):
+        return '\t'
+    if lower_filename.endswith(COMMA_SEPARATED_EXTENSIONS):
+        return ','
+    try:
+        return csv.Sniffer().sniff(sample_text, delimiters=',\t').delimiter
+    except csv.Error:
+        raise UserInputException("Unable to determine the delimiter of sample sheet {}.".format(filename))
+
+
+def read_sample_sheet(infile):
+    """
+    Read the rows of a CSV or TSV sample sheet that has a header row of column names
+    :param infile: file: sample sheet to read
+    :return: [dict]: one dictionary of column name to string value per sample
+    """
+    contents = infile.read()
+    filename = getattr(infile, 'name', '')
+    delimiter = get_sample_sheet_delimiter(filename, contents[:4096])
+    reader = csv.DictReader(contents.splitlines(), delimiter=delimiter)
+    rows = []
+    errors = []
+    for row in reader:
+        # DictReader puts the values of a long row past the header under the None key
+        extra_values = row.pop(None, [])
+        if not any(value for value in row.values()) and not any(extra_values):
+            continue
+        # and fills the columns missing from a short row with None
+        missing_column_names = [name for name in reader.fieldnames if row[name] is None]
+        if missing_column_names:
+            errors.append("Sample sheet {} line {}: missing value for column {}.".format(
+                filename, reader.line_num, ', '.join(missing_column_names)))
+        # empty trailing cells are ignored
+        if any(extra_values):
+            errors.append("Sample sheet {} line {}: {} values but the header has {} columns.".format(
+                filename, reader.line_num, len(reader.fieldnames) + len(extra_values), len(reader.fieldnames)))
+        rows.append(row)
+    if errors:
+        raise UserInputException('\n'.join(errors))
+    if not rows:
+        raise UserInputException("Sample sheet {} does not contain any samples.".format(filename))
+    return rows
+
+
+class CohortBuilder(object):
+    """
+    Creates a JobTemplate for each sample sheet row by replacing ${column} placeholders in the base job template.
+    Values are always substituted as strings. Use $$ for a literal $.
+    """
+    def __init__(self, base_data, rows):
+        """
+        :param base_data: dict: job template fields (tag, name, fund_code, job_order, job_strategy) with placeholders
+        :param rows: [dict]: sample sheet rows of column name to value
+        """
+        self.base_data = base_data
+        self.rows = rows
+
+    def create_job_templates(self):
+        """
+        Create job templates for all rows, reporting every row that can not be filled in together
+        :return: [(str, JobTemplate)]: label and job template for each row
+        """
+        job_templates = []
+        errors = []
+        for row_number, row in enumerate(self.rows, start=1):
+            try:
+                data = self.substitute(self.base_data, row)
+            except UserInputException as ex:
+                errors.append("Sample sheet row {}: {}".format(row_number, ex))
+                continue
+            label = "row {}: {}".format(row_number, data.get('name'))
+            job_templates.append((label, JobTemplateLoader.create_job_template_for_data(data)))
+        if errors:
+            raise UserInputException('\n'.join(errors))
+        return job_templates
+
+    def substitute(self, obj, row):
+        """
+        Return a copy of obj with placeholders in every string replaced by values from row
+        :param obj: object: dict, list or value from the base job template
+        :param row: dict: sample sheet row
+        :return: object: copy with placeholders replaced
+        """
+        if isinstance(obj, dict):
+            return dict((key, self.substitute(value, row)) for key, value in obj.items())
+        if isinstance(obj, list):
+            return [self.substitute(item, row) for item in obj]
+        if isinstance(obj, str):
+            try:
+                return string.Template(obj).substitute(row)
+            except KeyError as ex:
+                raise UserInputException("missing sample sheet column {} used in '{}'".format(ex, obj))
+            except ValueError:
+                raise UserInputException("invalid placeholder in '{}'".format(obj))
+        return obj
@@ -1,14 +1,24 @@
 from __future__ import print_function
 from bespin.config import ConfigFile
-from bespin.api import BespinApi
+from bespin.api import BespinApi, first_item
 from bespin.workflow import CWLWorkflowVersion, BespinWorkflowLoader
-from bespin.tool_details import ToolDetails
-from bespin.jobtemplate import JobTemplateLoader
-from bespin.exceptions import WorkflowConfigurationNotFoundException, UserInputException
-from tabulate import tabulate
+from bespin.tool_details import ToolDetails, ToolDetailsCache, ToolDetailsDiff
+from bespin.backfill import ToolDetailsBackfill, DEFAULT_MAX_PROCESSES, DEFAULT_MAX_POSTS
+from bespin.jobtemplate import JobTemplateLoader, JobCreationContext
+from bespin.batch import JobBatch, InMemoryJobTemplate, DEFAULT_MAX_WORKERS, expand_job_template_paths
+from bespin.cohort import CohortBuilder, read_sample_sheet
+from bespin.dukeds import DDSPathCache
+from bespin.journal import JobCreationJournal
+from bespin.stats import STATS
+from bespin.output import StreamingTable, RECORD_WRITERS, TABLE_OUTPUT_FORMAT
+from bespin.exceptions import WorkflowConfigurationNotFoundException, UserInputException, JobBatchException, \
+    ToolDetailsBackfillException
 import yaml
 import json
 import sys
+import time
+import datetime
+from itertools import islice
 from decimal import Decimal, ROUND_HALF_UP
 
 
@@ -29,30 +39,47 @@ class Commands(object):
         config = ConfigFile().read_or_create_config()
         return BespinApi(config, user_agent_str=self.user_agent_str)
 
+    @staticmethod
+    def _create_job_creation_context(api):
+        return JobCreationContext(api, dds_path_cache=DDSPathCache(), journal=JobCreationJournal())
+
     def _print_details_as_table(self, details):
-        print(Table(details.column_names, details.get_column_data()))
+        StreamingTable(details.column_names, details.get_column_data()).write(sys.stdout)
 
-    def workflows_list(self, all_versions, short_format, tag):
+    def _print_details(self, details, output_format=TABLE_OUTPUT_FORMAT):
+        """
+        Print details as a table or as machine readable records
+        :param details: object with column_names and get_column_data() such as JobsList
+        :param output_format: str: one of bespin.output.OUTPUT_FORMATS
+        """
+        if output_format == TABLE_OUTPUT_FORMAT:
+            self._print_details_as_table(details)
+        else:
+            writer_class = RECORD_WRITERS[output_format]
+            writer_class(details.column_names, details.get_column_data()).write(sys.stdout)
+
+    def workflows_list(self, all_versions, short_format, tag, output_format=TABLE_OUTPUT_FORMAT):
         """
         Print out a table of workflows and optionally the versions/configurations
         :param all_versions: bool: when true show all versions otherwise show most recent
         :param short_format: bool: when true show only workflow info
         :param tag: str: when true show all versions otherwise show most recent
+        :param output_format: str: one of bespin.output.OUTPUT_FORMATS
         """
         api = self._create_api()
         if short_format:
-            self._print_details_as_table(ShortWorkflowDetails(api, tag))
+            self._print_details(ShortWorkflowDetails(api, tag), output_format)
         else:
-            self._print_details_as_table(FullWorkflowDetails(api, all_versions, tag))
+            self._print_details(FullWorkflowDetails(api, all_versions, tag), output_format)
 
     def workflow_create(self, name, tag):
         api = self._create_api()
         response = api.workflow_post(name, tag)
         print("Created workflow {}.".format(response['id']))
 
-    def workflow_versions_list(self, workflow_tag):
+    def workflow_versions_list(self, workflow_tag, output_format=TABLE_OUTPUT_FORMAT):
         api = self._create_api()
-        self._print_details_as_table(WorkflowVersionsList(api, workflow_tag))
+        self._print_details(WorkflowVersionsList(api, workflow_tag), output_format)
 
     def workflow_version_create(self, url, workflow_type, workflow_path, version_info_url, override_tag=None,
                                 override_version=None, validate=True):
@@ -74,30 +101,44 @@ class Commands(object):
             msg = "Error: path is required for {} workflows".format(workflow_type)
             raise UserInputException(msg)
 
-    def workflow_version_validate(self, url, workflow_type, workflow_path, expected_tag=None, expected_version=None):
+    def workflow_version_validate(self, url, workflow_type, workflow_path, expected_tag=None, expected_version=None,
+                                  strict=False):
         self._raise_on_incompatible_workflow_type_and_path(workflow_type, workflow_path)
-        workflow_version = CWLWorkflowVersion(url, workflow_type, workflow_path, validate=True)
+        workflow_version = CWLWorkflowVersion(url, workflow_type, workflow_path, validate=True, strict=strict)
         validated = workflow_version.validate_workflow(expected_tag, expected_version)
         print("Validated {} as '{}/{}'".format(url, validated.tag, validated.version))
 
-    def _extract_tool_details(self, url, workflow_type, workflow_path, override_tag=None, override_version=None):
+    @staticmethod
+    def _create_tool_details_cache(strict):
+        # cwltool loads every tool so strict extraction has nothing to reuse
+        if strict:
+            return None
+        return ToolDetailsCache()
+
+    def _extract_tool_details(self, url, workflow_type, workflow_path, override_tag=None, override_version=None,
+                              strict=False):
         self._raise_on_incompatible_workflow_type_and_path(workflow_type, workflow_path)
         workflow_version = CWLWorkflowVersion(url, workflow_type, workflow_path, override_version=override_version,
-                                              override_tag=override_tag, validate=False)
-        return ToolDetails(workflow_version)
+                                              override_tag=override_tag, validate=False, strict=strict)
+        cache = self._create_tool_details_cache(strict)
+        tool_details = ToolDetails(workflow_version, cache)
+        if cache:
+            cache.save()
+        return tool_details
 
-    def workflow_version_tool_details_preview(self, url, workflow_type, workflow_path):
+    def workflow_version_tool_details_preview(self, url, workflow_type, workflow_path, strict=False):
         """
         Fetch/load/extract tools from a CWL workflow and print the JSON without POSTing to the API
         :param url: URL of the CWL workflow to parse
         :param workflow_type: Type of workflow (packed/zipped/direct)
         :param workflow_path: Path of the workflow in the URL
+        :param strict: Load the workflow with cwltool instead of only reading the tool requirements
         """
-        tool_details = self._extract_tool_details(url, workflow_type, workflow_path)
+        tool_details = self._extract_tool_details(url, workflow_type, workflow_path, strict=strict)
         print(json.dumps(tool_details.contents, indent=2))
 
     def workflow_version_tool_details_create(self, url, workflow_type, workflow_path, override_tag=None,
-                                             override_version=None):
+                                             override_version=None, strict=False):
         """
         Fetch/load/extract tools from a CWL workflow and create a workflow-version-tool-details object via the API for
         the corresponding workflow-version
@@ -106,28 +147,101 @@ class Commands(object):
         :param workflow_path: Path of the workflow in the URL
         :param override_tag: Workflow tag of the workflow version to attach tool details to (parses from CWL if none)
         :param override_version: Version string of the workflow version to attach to details to (parses from CWL if none)
+        :param strict: Load the workflow with cwltool instead of only reading the tool requirements
         """
-        tool_details = self._extract_tool_details(url, workflow_type, workflow_path, override_tag, override_version)
+        tool_details = self._extract_tool_details(url, workflow_type, workflow_path, override_tag, override_version,
+                                                  strict=strict)
         api = self._create_api()
         response = tool_details.create(api)
         print("Created workflow version tool details {}.".format(response['id']))
 
-    def workflow_configs_list(self, workflow_tag):
+    def workflow_version_tool_details_diff(self, workflow_tag, old_version, new_version, strict=False,
+                                           output_format=TABLE_OUTPUT_FORMAT):
+        """
+        Extract tools from the CWL of two workflow versions and print the docker images and package versions that
+        changed between them
+        :param workflow_tag: Tag of the workflow the versions belong to
+        :param old_version: Version string of the workflow version to compare from
+        :param new_version: Version string of the workflow version to compare to
+        :param strict: Load the workflows with cwltool instead of only reading the tool requirements
+        :param output_format: str: one of bespin.output.OUTPUT_FORMATS
+        """
         api = self._create_api()
-        self._print_details_as_table(WorkflowConfigurationsList(api, workflow_tag))
+        cache = self._create_tool_details_cache(strict)
+        contents = []
+        for version in [old_version, new_version]:
+            api_workflow_version = api.workflow_version_find_by_tag_version(workflow_tag, version)
+            workflow_version = CWLWorkflowVersion(api_workflow_version['url'], api_workflow_version['type'],
+                                                  api_workflow_version['workflow_path'], validate=False,
+                                                  strict=strict)
+            contents.append(ToolDetails(workflow_version, cache).contents)
+        if cache:
+            cache.save()
+        self._print_details(ToolDetailsDiff(*contents), output_format)
+
+    def workflow_version_tool_details_backfill(self, workflow_tag=None, max_processes=DEFAULT_MAX_PROCESSES,
+                                               max_posts=DEFAULT_MAX_POSTS, strict=False):
+        """
+        Create tool details for every workflow version that has none
+        :param workflow_tag: Only backfill versions of this workflow when not None
+        :param max_processes: Maximum number of workflows to download and extract at the same time
+        :param max_posts: Maximum number of tool details to post at the same time
+        :param strict: Load the workflows with cwltool instead of only reading the tool requirements
+        """
+        api = self._create_api()
+        cache = self._create_tool_details_cache(strict)
+        backfill = ToolDetailsBackfill(api, cache, max_processes=max_processes, max_posts=max_posts, strict=strict)
+        workflow_versions, skipped = backfill.find_workflow_versions(workflow_tag)
+        print("Found {} workflow versions without tool details ({} already have them).".format(
+            len(workflow_versions), skipped))
+        progress = {'completed': 0}
+
+        def print_result(result):
+            progress['completed'] += 1
+            self._print_backfill_result(result, progress['completed'], len(workflow_versions))
+
+        try:
+            results = backfill.run(workflow_versions, on_result=print_result)
+        finally:
+            if cache:
+                cache.save()
+        self._print_backfill_summary(results, skipped, backfill.elapsed_seconds)
+
+    @staticmethod
+    def _print_backfill_result(result, completed, total):
+        if result.error:
+            print("[{}/{}] Failed to create tool details for {}: {}".format(completed, total, result.label,
+                                                                          result.error))
+        else:
+            print("[{}/{}] Created tool details {} for {} ({} tools)".format(completed, total, result.tool_details_id,
+                                                                           result.label, result.num_tools))
+
+    @staticmethod
+    def _print_backfill_summary(results, skipped, elapsed_seconds):
+        failed = len([result for result in results if not result.succeeded])
+        print("")
+        print("Created tool details for {} workflow versions ({} failed, {} skipped) in {:.1f} seconds.".format(
+            len(results) - failed, failed, skipped, elapsed_seconds))
+        if failed:
+            raise ToolDetailsBackfillException("Failed to create tool details for {} of {} workflow versions.".format(
+                failed, len(results)))
+
+    def workflow_configs_list(self, workflow_tag, output_format=TABLE_OUTPUT_FORMAT):
+        api = self._create_api()
+        self._print_details(WorkflowConfigurationsList(api, workflow_tag), output_format)
 
     def workflow_config_show_job_order(self, tag, workflow_tag, outfile):
         api = self._create_api()
-        configs = api.workflow_configurations_list(tag=tag, workflow_tag=workflow_tag)
-        if not configs:
+        config = first_item(api.workflow_configurations_list(tag=tag, workflow_tag=workflow_tag))
+        if not config:
             msg = "Workflow configuration not found for tag {} and workflow {}".format(tag, workflow_tag)
             raise WorkflowConfigurationNotFoundException(msg)
-        config = configs[0]
         outfile.write(yaml.dump(config['system_job_order'], default_flow_style=False))
 
     def workflow_config_create(self, workflow_tag, default_job_strategy_name, share_group_name, tag, joborder_infile):
         api = self._create_api()
-        joborder = yaml.load(joborder_infile)
+        with STATS.timer('yaml load'):
+            joborder = yaml.load(joborder_infile)
         workflow = api.workflow_get_for_tag(workflow_tag)
         default_job_strategy = api.job_strategy_get_for_name(default_job_strategy_name)
         share_group = api.share_group_get_for_name(share_group_name)
@@ -138,23 +252,42 @@ class Commands(object):
                                                     joborder)
         print("Created workflow config {}.".format(response['id']))
 
-    def share_groups_list(self):
+    def share_groups_list(self, output_format=TABLE_OUTPUT_FORMAT):
         api = self._create_api()
         item_list = ShareGroupsList(api)
-        self._print_details_as_table(item_list)
+        self._print_details(item_list, output_format)
 
-    def job_configs_list(self):
+    def job_configs_list(self, output_format=TABLE_OUTPUT_FORMAT):
         api = self._create_api()
         item_list = JobStrategiesList(api)
-        self._print_details_as_table(item_list)
+        self._print_details(item_list, output_format)
 
-    def jobs_list(self):
+    def jobs_list(self, state=None, since=None, workflow_tag=None, limit=None, output_format=TABLE_OUTPUT_FORMAT):
         """
         Print out a table of current job statuses
+        :param state: str: only show jobs in this state
+        :param since: str: only show jobs last updated at or after this ISO 8601 date/time
+        :param workflow_tag: str: only show jobs for workflows with this tag
+        :param limit: int: maximum number of jobs to show
+        :param output_format: str: one of bespin.output.OUTPUT_FORMATS
+        """
+        api = self._create_api()
+        jobs_list = JobsList(api, state=state, since=since, workflow_tag=workflow_tag, limit=limit)
+        self._print_details(jobs_list, output_format)
+
+    def jobs_watch(self, job_ids, min_interval, max_interval):
+        """
+        Print job state/step transitions as they happen
+        :param job_ids: [int]: ids of jobs to watch, watches all jobs when empty
+        :param min_interval: float: seconds between polls while jobs are changing
+        :param max_interval: float: maximum seconds between polls while jobs are not changing
         """
         api = self._create_api()
-        jobs_list = JobsList(api)
-        self._print_details_as_table(jobs_list)
+        watcher = JobWatcher(api, job_ids, min_interval=min_interval, max_interval=max_interval)
+        try:
+            watcher.watch()
+        except KeyboardInterrupt:
+            print("Stopped watching jobs.")
 
     def job_template_create(self, tag, outfile):
         """
@@ -169,36 +302,120 @@ class Commands(object):
             print("Wrote job file {}.".format(outfile.name))
             print("Edit this file filling in TODO fields then run `bespin job create {}` .".format(outfile.name))
 
-    def job_create(self, job_template_infile):
+    def job_create(self, job_template_paths, max_workers=DEFAULT_MAX_WORKERS):
         """
-        Create a job based on an input job file (possibly created via init_job_template)
-        Prints out job id.
-        :param job_template_infile: file: input file to use for creating a job
+        Create jobs based on input job files (possibly created via init_job_template)
+        Prints out job ids.
+        :param job_template_paths: [str]: paths or glob patterns of job files to use for creating jobs
+        :param max_workers: int: maximum number of jobs to create at the same time
         """
         api = self._create_api()
-        job_template = JobTemplateLoader(job_template_infile).create_job_template()
-        result = job_template.create_job(api)
-        job_id = result['job']
-        print("Created job {}".format(job_id))
-        print("To start this job run `bespin job start {}` .".format(job_id))
+        results = self._run_job_batch(api, expand_job_template_paths(job_template_paths), max_workers,
+                                      start_jobs=False)
+        if len(results) == 1:
+            print("To start this job run `bespin job start {}` .".format(results[0].job_id))
 
-    def job_run(self, job_template_infile, token=None):
+    def job_run(self, job_template_paths, token=None, max_workers=DEFAULT_MAX_WORKERS):
         """
-        Creates and starts a job based on an input job file (possibly created via init_job_template)
-        Prints out job id.
-        :param job_template_infile: file: input file to use for creating a job
-        :param token: str: token to use to authorize running the job
+        Creates and starts jobs based on input job files (possibly created via init_job_template)
+        Prints out job ids.
+        :param job_template_paths: [str]: paths or glob patterns of job files to use for creating jobs
+        :param token: str: token to use to authorize running the jobs
+        :param max_workers: int: maximum number of jobs to create at the same time
         """
         api = self._create_api()
-        job_template = JobTemplateLoader(job_template_infile).create_job_template()
-        result = job_template.create_job(api)
-        job_id = result['job']
-        print("Created job {}".format(job_id))
-        if token:
-            api.authorize_job(job_id, token)
-            print("Set run token for job {}".format(job_id))
-        api.start_job(job_id)
-        print("Started job {}".format(job_id))
+        self._run_job_batch(api, expand_job_template_paths(job_template_paths), max_workers, start_jobs=True,
+                            token=token)
+
+    def job_cohort(self, base_job_template_infile, sample_sheet_infile, create=False, run=False, token=None,
+                   max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Build a job template for each sample in a sample sheet, printing them or creating (and starting) jobs.
+        :param base_job_template_infile: file: job template file containing ${column} placeholders
+        :param sample_sheet_infile: file: CSV or TSV file with a header row of column names and one row per sample
+        :param create: bool: create a job for each sample
+        :param run: bool: create and start a job for each sample
+        :param token: str: token to use to authorize running the jobs
+        :param max_workers: int: maximum number of DukeDS lookups or jobs to create at the same time
+        """
+        with STATS.timer('yaml load'):
+            base_data = yaml.safe_load(base_job_template_infile)
+        labeled_job_templates = CohortBuilder(base_data, read_sample_sheet(sample_sheet_infile)).create_job_templates()
+        if not (create or run):
+            self._print_cohort_preview(labeled_job_templates)
+            return
+        api = self._create_api()
+        context = self._create_job_creation_context(api)
+        dds_file_paths = []
+        for label, job_template in labeled_job_templates:
+            dds_file_paths.extend(job_template.get_dds_file_paths())
+        try:
+            context.prefetch_dds_files(dds_file_paths, max_workers)
+        finally:
+            context.save_dds_path_cache()
+        job_templates = [InMemoryJobTemplate(label, job_template) for label, job_template in labeled_job_templates]
+        self._run_job_batch(api, job_templates, max_workers, start_jobs=run, token=token, context=context)
+
+    @staticmethod
+    def _print_cohort_preview(labeled_job_templates):
+        items = []
+        for label, job_template in labeled_job_templates:
+            items.append({
+                "job_template": label,
+                "tag": job_template.tag,
+                "fund_code": job_template.fund_code,
+                "dds_files": len(job_template.get_dds_file_paths()),
+            })
+        StreamingTable(["job_template", "tag", "fund_code", "dds_files"], items).write(sys.stdout)
+        print("")
+        print("Run with --create or --run to submit these {} jobs.".format(len(items)))
+
+    def _run_job_batch(self, api, job_templates, max_workers, start_jobs, token=None, context=None):
+        if context is None:
+            context = self._create_job_creation_context(api)
+        job_batch = JobBatch(api, job_templates, max_workers=max_workers, context=context)
+        try:
+            results = job_batch.run(start_jobs=start_jobs, token=token, on_result=self._print_job_batch_result)
+        finally:
+            context.save_dds_path_cache()
+        if len(results) == 1:
+            if results[0].error:
+                raise results[0].error
+        else:
+            self._print_job_batch_summary(results, job_batch.elapsed_seconds, job_batch.context.dds_file_cache)
+        return results
+
+    @staticmethod
+    def _print_job_batch_result(result):
+        if result.job_id:
+            print("Created job {}".format(result.job_id))
+        if result.authorized:
+            print("Set run token for job {}".format(result.job_id))
+        if result.started:
+            print("Started job {}".format(result.job_id))
+        if result.error:
+            print("Failed to process {}: {}".format(result.label, result.error))
+
+    @staticmethod
+    def _print_job_batch_summary(results, elapsed_seconds, dds_file_cache):
+        items = []
+        for result in results:
+            if result.succeeded:
+                status = "started" if result.started else "created"
+            else:
+                status = "failed"
+            items.append({"job_template": result.label, "job": result.job_id, "status": status})
+        print("")
+        StreamingTable(["job_template", "job", "status"], items).write(sys.stdout)
+        failed = len([result for result in results if not result.succeeded])
+        print("")
+        print("Processed {} job templates ({} failed) in {:.1f} seconds.".format(len(results), failed,
+                                                                                elapsed_seconds))
+        if dds_file_cache.misses:
+            print("Looked up {} distinct DukeDS files ({} cache hits).".format(dds_file_cache.misses,
+                                                                              dds_file_cache.hits))
+        if failed:
+            raise JobBatchException("Failed to process {} of {} job templates.".format(failed, len(results)))
 
     def job_validate(self, job_template_infile):
         """
@@ -207,12 +424,15 @@ class Commands(object):
         """
         api = self._create_api()
         job_template = JobTemplateLoader(job_template_infile).create_job_template()
+        context = self._create_job_creation_context(api)
         try:
-            job_template.validate(api)
+            job_template.validate(api, context)
             print("Job file is valid.")
         except UserInputException:
             print("ERROR: Job template is invalid.")
             raise
+        finally:
+            context.save_dds_path_cache()
 
     def start_job(self, job_id, token=None):
         """
@@ -255,24 +475,6 @@ class Commands(object):
         print("Deleted job {}".format(job_id))
 
 
-class Table(object):
-    """
-    Used to display column headers and associated data as rows
-    """
-    def __init__(self, column_names, items):
-        self.column_names = column_names
-        self.items = items
-
-    @staticmethod
-    def _format_column_name(column_name):
-        return column_name.replace("_", " ").title()
-
-    def __str__(self):
-        column_data = [[item[name] for name in self.column_names] for item in self.items]
-        formatted_column_names = [self._format_column_name(name) for name in self.column_names]
-        return tabulate(column_data, headers=formatted_column_names)
-
-
 class ShortWorkflowDetails(object):
     """
     Creates column data based on workflows
@@ -284,13 +486,11 @@ class ShortWorkflowDetails(object):
 
     def get_column_data(self):
         """
-        Return list of dictionaries of workflow data.
-        :return: [dict]: one record for each questionnaire
+        Generate dictionaries of workflow data.
+        :return: generator of dict: one record for each questionnaire
         """
-        data = []
         for workflow in self.api.workflows_list(self.tag):
-            data.append(dict(workflow))
-        return data
+            yield dict(workflow)
 
 
 class FullWorkflowDetails(object):
@@ -307,10 +507,9 @@ class FullWorkflowDetails(object):
 
     def get_column_data(self):
         """
-        Return list of dictionaries of workflow data.
-        :return: [dict]: one record for each questionnaire
+        Generate dictionaries of workflow data.
+        :return: generator of dict: one record for each questionnaire
         """
-        data = []
         for workflow in self.api.workflows_list(self.tag):
             if len(workflow['versions']):
                 versions = workflow['versions']
@@ -322,8 +521,7 @@ class FullWorkflowDetails(object):
                     for workflow_configuration in configurations:
                         tag = '{}/{}'.format(workflow_version['tag'], workflow_configuration['tag'])
                         workflow[self.TAG_COLUMN_NAME] = tag
-                        data.append(dict(workflow))
-        return data
+                        yield dict(workflow)
 
 
 class WorkflowVersionsList(object):
@@ -334,12 +532,10 @@ class WorkflowVersionsList(object):
         self.column_names = ["id", "description", self.WORKFLOW_FIELDNAME, "version", "url", "workflow_path"]
 
     def get_column_data(self):
-        data = []
         for item in self.api.workflow_versions_list(self.workflow_tag):
             workflow = self.api.workflow_get(item['workflow'])
             item[self.WORKFLOW_FIELDNAME] = workflow['tag']
-            data.append(item)
-        return data
+            yield item
 
 
 class WorkflowConfigurationsList(object):
@@ -354,11 +550,9 @@ class WorkflowConfigurationsList(object):
                              self.DEFAULT_JOB_STRATEGY_FIELDNAME]
 
     def get_column_data(self):
-        data = []
         for item in self.api.workflow_configurations_list(workflow_tag=self.workflow_tag):
             self.add_new_fields(item)
-            data.append(item)
-        return data
+            yield item
 
     def add_new_fields(self, item):
         workflow = self.api.workflow_get(item['workflow'])
@@ -374,25 +568,44 @@ class JobsList(object):
     """
     Creates column data based on current users's jobs
     """
-    def __init__(self, api):
+    def __init__(self, api, state=None, since=None, workflow_tag=None, limit=None):
+        """
+        :param api: BespinApi: api used to fetch jobs
+        :param state: str: only include jobs in this state
+        :param since: str: only include jobs last updated at or after this ISO 8601 date/time
+        :param workflow_tag: str: only include jobs for workflows with this tag
+        :param limit: int: maximum number of jobs to include
+        """
         self.api = api
+        self.state = state
+        self.since = since
+        self.workflow_tag = workflow_tag
+        self.limit = limit
         self.column_names = ["id", "name", "state", "step", "last_updated", "elapsed_hours", self.WORKFLOW_VERSION_TAG]
+        self.workflow_version_tags = {}
 
     def get_column_data(self):
         """
-        Return list of dictionaries of workflow data.
-        :return: [dict]: one record for each questionnaire
+        Generate dictionaries of job data as pages of jobs are received.
+        :return: generator of dict: one record for each job
         """
-        data = []
-        for job in self.api.jobs_list():
+        jobs = self.api.jobs_list(state=self.state, since=self.since, workflow_tag=self.workflow_tag,
+                                  limit=self.limit)
+        if self.limit is not None:
+            # stop before enriching any jobs past the limit in case the server returns more
+            jobs = islice(jobs, self.limit)
+        for job in jobs:
             job['elapsed_hours'] = self.get_elapsed_hours(job.get('usage'))
             job[self.WORKFLOW_VERSION_TAG] = self.get_workflow_version_tag(job['workflow_version'])
-            data.append(job)
-        return data
+            yield job
 
     def get_workflow_version_tag(self, workflow_version_id):
-        workflow_version = self.api.workflow_version_get(workflow_version_id)
-        return workflow_version['tag']
+        workflow_version_tag = self.workflow_version_tags.get(workflow_version_id)
+        if workflow_version_tag is None:
+            workflow_version = self.api.workflow_version_get(workflow_version_id)
+            workflow_version_tag = workflow_version['tag']
+            self.workflow_version_tags[workflow_version_id] = workflow_version_tag
+        return workflow_version_tag
 
     def get_elapsed_hours(self, usage):
         if usage:
@@ -403,16 +616,109 @@ class JobsList(object):
         return None
 
 
+class JobWatcher(object):
+    """
+    Polls for jobs that changed since the previous poll and prints their state/step transitions.
+    """
+    FINISHED_STATES = ['F', 'E', 'C', 'D']
+
+    def __init__(self, api, job_ids=None, min_interval=5, max_interval=60, sleep_func=time.sleep,
+                 utcnow_func=datetime.datetime.utcnow):
+        """
+        :param api: BespinApi: api used to fetch jobs
+        :param job_ids: [int]: ids of jobs to watch, all jobs are watched when empty
+        :param min_interval: float: seconds to wait after a poll that found changes
+        :param max_interval: float: upper bound on seconds to wait when nothing is changing
+        :param sleep_func: function: called with the number of seconds to wait between polls
+        :param utcnow_func: function: returns the current UTC datetime, used to start watching all jobs from now
+        """
+        self.api = api
+        self.job_ids = set(job_ids or [])
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.sleep_func = sleep_func
+        self.utcnow_func = utcnow_func
+        # JobsList caches workflow version tags so enrichment is only fetched once across polls
+        self.jobs_list = JobsList(api)
+        self.job_states = {}
+        self.last_updated = None
+
+    def watch(self):
+        """
+        Poll until all watched jobs are finished, doubling the wait between polls while nothing changes.
+        Runs until interrupted when watching all jobs.
+        """
+        interval = self.min_interval
+        while True:
+            transitions = self.poll()
+            for transition in transitions:
+                print(transition)
+            if self.all_jobs_finished():
+                break
+            if transitions:
+                interval = self.min_interval
+            else:
+                interval = min(interval * 2, self.max_interval)
+            self.sleep_func(interval)
+
+    def poll(self):
+        """
+        Fetch jobs updated since the previous poll and record their state/step.
+        The first poll fetches each watched job by id, or only notes the current time when watching all jobs.
+        Raises JobDoesNotExistException when a watched job does not exist.
+        :return: [str]: descriptions of jobs whose state or step changed
+        """
+        if self.last_updated is None:
+            jobs = self._get_initial_jobs()
+        else:
+            jobs = self.api.jobs_list(since=self.last_updated)
+        transitions = []
+        for job in jobs:
+            if self.job_ids and job['id'] not in self.job_ids:
+                continue
+            if self.last_updated is None or job['last_updated'] > self.last_updated:
+                self.last_updated = job['last_updated']
+            state_and_step = (job['state'], job['step'])
+            previous_state_and_step = self.job_states.get(job['id'])
+            if state_and_step != previous_state_and_step:
+                self.job_states[job['id']] = state_and_step
+                transitions.append(self.format_transition(job, previous_state_and_step))
+        return transitions
+
+    def _get_initial_jobs(self):
+        if self.job_ids:
+            return [self.api.job_get(job_id) for job_id in sorted(self.job_ids)]
+        # jobs that changed before watching started are not reported
+        self.last_updated = self.utcnow_func().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        return []
+
+    def format_transition(self, job, previous_state_and_step):
+        workflow_version_tag = self.jobs_list.get_workflow_version_tag(job['workflow_version'])
+        description = "{} Job {} '{}' ({})".format(job['last_updated'], job['id'], job['name'], workflow_version_tag)
+        if previous_state_and_step:
+            previous_state, previous_step = previous_state_and_step
+            return "{} state: {} -> {} step: {} -> {}".format(description, previous_state, job['state'],
+                                                              previous_step, job['step'])
+        return "{} state: {} step: {}".format(description, job['state'], job['step'])
+
+    def all_jobs_finished(self):
+        if not self.job_ids:
+            return False
+        for job_id in self.job_ids:
+            state_and_step = self.job_states.get(job_id)
+            if not state_and_step or state_and_step[0] not in self.FINISHED_STATES:
+                return False
+        return True
+
+
 class ShareGroupsList(object):
     def __init__(self, api):
         self.api = api
         self.column_names = ["id", "name", "email"]
 
     def get_column_data(self):
-        data = []
         for item in self.api.share_groups_list():
-            data.append(item)
-        return data
+            yield item
 
 
 class JobStrategiesList(object):
@@ -426,11 +732,9 @@ class JobStrategiesList(object):
                              self.VOLUME_SIZE_FIELDNAME]
 
     def get_column_data(self):
-        data = []
         for item in self.api.job_strategies_list():
             self.add_new_fields(item)
-            data.append(item)
-        return data
+            yield item
 
     def add_new_fields(self, item):
         volume_size_factor = item['volume_size_factor']
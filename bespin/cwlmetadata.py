@@ -0,0 +1,364 @@
+"""
+Reads the metadata bespin needs from a CWL workflow - class, cwlVersion, label, doc, input fields and the
+requirements and hints of every tool - straight from packed JSON or CWL YAML files, following run: references.
+This skips the schema validation and object construction done by cwltool.load_tool, which takes tens of seconds
+for large workflows. The results mirror the parts of a cwltool Process used by BespinWorkflowParser,
+BespinWorkflowValidator and ToolDetailsBuilder.
+"""
+import copy
+import hashlib
+import json
+import os
+from six.moves.urllib.parse import urljoin, urldefrag, urlparse
+from six.moves.urllib.request import urlopen
+import yaml
+from bespin.exceptions import InvalidWorkflowFileException
+
+MAIN_PROCESS_ID = 'main'
+# fields whose map form ({key: value}) is a list of dicts with the key stored under the given field
+ID_MAP_FIELDS = {
+    'inputs': 'id',
+    'outputs': 'id',
+    'steps': 'id',
+    'in': 'id',
+    'requirements': 'class',
+    'hints': 'class',
+    'packages': 'package',
+}
+# field a plain value is stored under when a map form entry is not a dict
+ID_MAP_PREDICATES = {
+    'inputs': 'type',
+    'outputs': 'type',
+    'in': 'source',
+    'packages': 'specs',
+}
+
+
+def to_uri(path):
+    """
+    :param path: str: URI or local file path
+    :return: str: URI, local paths become file:// URIs of their real path as cwltool does
+    """
+    if urlparse(path).scheme:
+        return path
+    return 'file://{}'.format(os.path.realpath(path))
+
+
+def expand_id(base_uri, process_id):
+    """
+    :param base_uri: str: URI of the document containing the id, without a fragment
+    :param process_id: str: id as written in the document, e.g. '#main', 'main' or a full URI
+    :return: str: full URI
+    """
+    if urlparse(process_id).scheme:
+        return process_id
+    return '{}#{}'.format(base_uri, process_id.lstrip('#'))
+
+
+def shortname(uri):
+    """
+    :param uri: str: id of a CWL object e.g. 'file:///workflow.cwl#main/reads'
+    :return: str: last part of the id, e.g. 'reads'
+    """
+    return urldefrag(uri)[1].split('/')[-1] or uri.split('/')[-1]
+
+
+def get_content_hash(content):
+    """
+    :param content: bytes: CWL document or canonical JSON of a process
+    :return: str: sha256 hex digest
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def aslist(value):
+    return value if isinstance(value, list) else [value]
+
+
+def normalize_id_map(items, field_name):
+    """
+    Convert the map form of a CWL field into the list form
+    :param items: dict or list: value of the field
+    :param field_name: str: name of the field, a key of ID_MAP_FIELDS
+    :return: list: entries of the field, map form entries sorted by key as schema-salad does
+    """
+    if not isinstance(items, dict):
+        return list(items or [])
+    key_field = ID_MAP_FIELDS[field_name]
+    normalized = []
+    for key in sorted(items.keys()):
+        value = items[key]
+        if isinstance(value, dict):
+            entry = dict(value)
+        else:
+            entry = {ID_MAP_PREDICATES.get(field_name, key_field): value}
+        entry[key_field] = key
+        normalized.append(entry)
+    return normalized
+
+
+def expand_type(cwl_type):
+    """
+    Expand the type shorthand of CWL v1.0: 'File?' is ['null', 'File'] and 'File[]' is an array of File
+    :param cwl_type: str, list or dict: type as written in the document
+    :return: str, list or dict: expanded type
+    """
+    if isinstance(cwl_type, str):
+        if cwl_type.endswith('?'):
+            return ['null', expand_type(cwl_type[:-1])]
+        if cwl_type.endswith('[]'):
+            return {'type': 'array', 'items': expand_type(cwl_type[:-2])}
+        return cwl_type
+    if isinstance(cwl_type, list):
+        expanded_types = []
+        for item in cwl_type:
+            expanded = expand_type(item)
+            if isinstance(expanded, list):
+                expanded_types.extend(expanded_type for expanded_type in expanded
+                                      if expanded_type not in expanded_types)
+            else:
+                expanded_types.append(expanded)
+        return expanded_types
+    if isinstance(cwl_type, dict):
+        expanded = dict(cwl_type)
+        if 'items' in expanded:
+            expanded['items'] = expand_type(expanded['items'])
+        if 'fields' in expanded:
+            expanded['fields'] = [dict(field, type=expand_type(field.get('type')))
+                                  for field in normalize_id_map(expanded['fields'], 'inputs')]
+        return expanded
+    return cwl_type
+
+
+def expand_namespaces(value, namespaces):
+    """
+    Replace namespace prefixes in dict keys, e.g. 's:citation' becomes 'https://schema.org/citation'
+    :param value: object: requirement or hint as loaded from the document
+    :param namespaces: dict: prefix to URI from the $namespaces of the document
+    :return: object: copy with expanded keys
+    """
+    if isinstance(value, dict):
+        return dict((expand_name(key, namespaces), expand_namespaces(item, namespaces))
+                    for key, item in value.items())
+    if isinstance(value, list):
+        return [expand_namespaces(item, namespaces) for item in value]
+    return value
+
+
+def expand_name(name, namespaces):
+    prefix, separator, rest = name.partition(':')
+    if separator and prefix in namespaces:
+        return namespaces[prefix] + rest
+    return name
+
+
+class CWLMetadataLoader(object):
+    """
+    Loads CWL processes by URI, reading each document once no matter how many steps run it
+    """
+    def __init__(self, tool_cache=None):
+        """
+        :param tool_cache: ToolDetailsCache: CommandLineTools whose content hash is in this cache were extracted
+        before and are not parsed again, None to parse every tool
+        """
+        self.tool_cache = tool_cache
+        self.content_hashes = {}
+        self._contents = {}
+        self._documents = {}
+        self._processes = {}
+
+    def load(self, tool_path):
+        """
+        :param tool_path: str: URI or path of the CWL document, packed documents use a fragment such as #main
+        :return: CWLMetadata: loaded process
+        """
+        uri = to_uri(tool_path)
+        if uri not in self._processes:
+            base_uri, fragment = urldefrag(uri)
+            if fragment:
+                # processes in a packed document share the file so are hashed individually
+                document = self._read_document(base_uri)
+                process = self._find_process(document, base_uri, fragment)
+                content_hash = get_content_hash(json.dumps(process, sort_keys=True).encode('utf-8'))
+            else:
+                content_hash = self._get_document_hash(base_uri)
+            cached_tool = self.tool_cache.get(content_hash) if self.tool_cache is not None else None
+            if cached_tool is not None:
+                metadata = self._create_cached_tool_metadata(uri, fragment, cached_tool['id_fragment'])
+            else:
+                if not fragment:
+                    document = self._read_document(base_uri)
+                    process = self._find_process(document, base_uri, fragment)
+                metadata = self._create_metadata(process, base_uri, document)
+            self.content_hashes[metadata.tool['id']] = content_hash
+            self._processes[uri] = metadata
+        return self._processes[uri]
+
+    def _get_document_hash(self, base_uri):
+        """
+        :param base_uri: str: URI of a CWL document
+        :return: str: hash of the file, or of the document with its $import and $include files resolved when it has any
+        """
+        content = self._read_content(base_uri)
+        if b'$import' in content or b'$include' in content:
+            # the imported files are part of the tool, so a change to one of them must change the hash
+            document = self._read_document(base_uri)
+            return get_content_hash(json.dumps(document, sort_keys=True, default=str).encode('utf-8'))
+        return get_content_hash(content)
+
+    def _read_content(self, base_uri):
+        if base_uri not in self._contents:
+            try:
+                with urlopen(base_uri) as infile:
+                    self._contents[base_uri] = infile.read()
+            except (OSError, ValueError) as e:
+                raise InvalidWorkflowFileException('Unable to read CWL document {}: {}'.format(base_uri, e))
+        return self._contents[base_uri]
+
+    def _read_document(self, base_uri):
+        if base_uri not in self._documents:
+            try:
+                document = yaml.safe_load(self._read_content(base_uri).decode('utf-8'))
+            except (yaml.YAMLError, UnicodeDecodeError) as e:
+                raise InvalidWorkflowFileException('CWL document {} is not valid YAML: {}'.format(base_uri, e))
+            self._documents[base_uri] = self._resolve_imports(document, base_uri)
+        return self._documents[base_uri]
+
+    def _create_cached_tool_metadata(self, uri, fragment, id_fragment):
+        """
+        Create the metadata of a tool without reading its requirements, which are in the tool cache
+        :param uri: str: URI the tool was loaded from
+        :param fragment: str: fragment of uri, set for tools in packed documents
+        :param id_fragment: str: fragment of the id the tool had when it was cached
+        :return: CWLMetadata
+        """
+        tool_id = uri
+        if not fragment and id_fragment:
+            tool_id = '{}#{}'.format(uri, id_fragment)
+        tool = {'class': 'CommandLineTool', 'id': tool_id, 'inputs': [], 'steps': []}
+        return CWLMetadata(tool, [], self.content_hashes)
+
+    def _resolve_imports(self, value, base_uri):
+        if isinstance(value, dict):
+            if set(value.keys()) == {'$import'}:
+                return self._read_document(urldefrag(urljoin(base_uri, value['$import']))[0])
+            if set(value.keys()) == {'$include'}:
+                with urlopen(urljoin(base_uri, value['$include'])) as infile:
+                    return infile.read().decode('utf-8')
+            return dict((key, self._resolve_imports(item, base_uri)) for key, item in value.items())
+        if isinstance(value, list):
+            return [self._resolve_imports(item, base_uri) for item in value]
+        return value
+
+    @staticmethod
+    def _find_process(document, base_uri, fragment):
+        if not isinstance(document, dict):
+            raise InvalidWorkflowFileException('CWL document {} does not contain a CWL object'.format(base_uri))
+        graph = document.get('$graph')
+        if graph is None:
+            return document
+        process_id = fragment or MAIN_PROCESS_ID
+        for process in graph:
+            if expand_id(base_uri, process.get('id', '')) == expand_id(base_uri, process_id):
+                return process
+        raise InvalidWorkflowFileException('CWL document {} has no process with id #{}'.format(base_uri, process_id))
+
+    def _create_metadata(self, process, base_uri, document, process_id=None):
+        """
+        :param process: dict: process as loaded from the document
+        :param base_uri: str: URI of the document containing the process
+        :param document: dict: whole document, it holds cwlVersion and $namespaces for packed workflows
+        :param process_id: str: id to use when the process has none, defaults to the document URI
+        :return: CWLMetadata
+        """
+        namespaces = dict(document.get('$namespaces', {}))
+        namespaces.update(process.get('$namespaces', {}))
+        tool = dict((key, value) for key, value in process.items() if not key.startswith('$'))
+        tool['id'] = expand_id(base_uri, process['id']) if 'id' in process else process_id or base_uri
+        if 'cwlVersion' in document:
+            tool.setdefault('cwlVersion', document['cwlVersion'])
+        for field_name in ['requirements', 'hints']:
+            if field_name in tool:
+                tool[field_name] = [self._normalize_requirement(requirement, namespaces)
+                                    for requirement in normalize_id_map(tool[field_name], field_name)]
+        tool['inputs'] = [self._normalize_parameter(parameter, tool['id'], namespaces)
+                          for parameter in normalize_id_map(tool.get('inputs'), 'inputs')]
+        steps = normalize_id_map(tool.get('steps'), 'steps')
+        tool['steps'] = steps
+        step_processes = [self._load_step_process(step, tool['id'], base_uri, document) for step in steps]
+        return CWLMetadata(tool, step_processes, self.content_hashes)
+
+    @staticmethod
+    def _normalize_requirement(requirement, namespaces):
+        requirement = expand_namespaces(requirement, namespaces)
+        if 'packages' in requirement:
+            requirement['packages'] = normalize_id_map(requirement['packages'], 'packages')
+        return requirement
+
+    @staticmethod
+    def _normalize_parameter(parameter, parent_id, namespaces):
+        parameter = dict(parameter)
+        parameter['id'] = '{}/{}'.format(parent_id, shortname(parameter['id']))
+        parameter['type'] = expand_type(parameter.get('type'))
+        if isinstance(parameter.get('format'), str):
+            parameter['format'] = expand_name(parameter['format'], namespaces)
+        return parameter
+
+    def _load_step_process(self, step, parent_id, base_uri, document):
+        run = step.get('run')
+        if isinstance(run, dict):
+            step_id = '{}/{}'.format(parent_id, shortname(step.get('id', '')))
+            return self._create_metadata(run, base_uri, document, process_id='{}/run'.format(step_id))
+        if not isinstance(run, str):
+            raise InvalidWorkflowFileException('Step {} of {} has no run field'.format(step.get('id'), parent_id))
+        if run.startswith('#'):
+            return self.load(base_uri + run)
+        return self.load(urljoin(base_uri, run))
+
+
+class CWLMetadata(object):
+    """
+    A CWL process read by CWLMetadataLoader with the attributes of a cwltool Process that bespin uses
+    """
+    def __init__(self, tool, step_processes, content_hashes):
+        """
+        :param tool: dict: process with list form requirements, hints, inputs and steps and full URI ids
+        :param step_processes: [CWLMetadata]: processes run by the steps of a workflow in step order
+        :param content_hashes: dict: process id to the content hash of the process, for every process loaded
+        """
+        self.tool = tool
+        self.step_processes = step_processes
+        self.content_hashes = content_hashes
+        self.inputs_record_schema = {
+            'name': 'input_record_schema',
+            'type': 'record',
+            'fields': [self._create_input_field(parameter) for parameter in tool['inputs']],
+        }
+
+    @staticmethod
+    def _create_input_field(parameter):
+        # matches how cwltool builds inputs_record_schema: the parameter with a short name instead of an id,
+        # made optional when it has a default
+        field = copy.deepcopy(parameter)
+        field['name'] = shortname(field.pop('id'))
+        if 'default' in field and 'null' not in aslist(field['type']):
+            field['type'] = ['null'] + aslist(field['type'])
+        return field
+
+    def visit(self, op):
+        """
+        Call op with this process and every process run by its steps, depth first like cwltool's Process.visit
+        :param op: function: called with each process dict
+        """
+        op(self.tool)
+        for step_process in self.step_processes:
+            step_process.visit(op)
+
+
+def load_cwl_metadata(tool_path, tool_cache=None):
+    """
+    :param tool_path: str: URI or path of the workflow, packed workflows use the #main fragment
+    :param tool_cache: ToolDetailsCache: tools whose details were extracted before, these are not parsed again
+    :return: CWLMetadata: loaded workflow
+    """
+    return CWLMetadataLoader(tool_cache).load(tool_path)
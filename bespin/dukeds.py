@@ -1,24 +1,93 @@
 from ddsc.sdk.client import Client, ItemNotFound
-from bespin.exceptions import InvalidFilePathException, FileDoesNotExistException, ProjectDoesNotExistException
+from ddsc.core.ddsapi import DataServiceError
+from bespin.stats import STATS
+from bespin.exceptions import InvalidFilePathException, FileDoesNotExistException, ProjectDoesNotExistException, \
+    UserInputException
+import hashlib
 import os
+import json
+import tempfile
+import threading
+import time
 
 PATH_PREFIX = "dds://"
 
+DDS_PATH_CACHE_FILENAME_ENV = 'BESPIN_DDS_PATH_CACHE'
+DEFAULT_DDS_PATH_CACHE_FILENAME = '~/.bespin-dds-path-cache.json'
+DDS_PATH_CACHE_TTL_SECONDS = 60 * 60
+DDS_PATH_CACHE_FORMAT_VERSION = 2
+
 INVALID_DUKEDS_FILE_PATH_MSG = "Invalid DukeDS file path ({})"
 DUKEDS_FILE_PATH_MISSING_PREFIX = INVALID_DUKEDS_FILE_PATH_MSG.format("missing prefix")
 DUKEDS_FILE_PATH_MISSING_SLASH = INVALID_DUKEDS_FILE_PATH_MSG.format("missing / between project and file path")
+DUKEDS_PROJECT_KIND = 'dds-project'
 
 
 class DDSFileUtil(object):
-    def __init__(self):
+    def __init__(self, path_cache=None):
+        """
+        :param path_cache: DDSPathCache: optional cache of files found by previous commands
+        """
         self.client = Client()
+        self.path_cache = path_cache
+        self._projects_by_name = None
+        self._projects_lock = threading.Lock()
 
     def find_file_for_path(self, duke_ds_file_path):
+        dds_config = self.client.dds_connection.config
+        if self.path_cache:
+            record = self.path_cache.get(duke_ds_file_path, dds_config)
+            if record:
+                if not self.path_cache.is_expired(record):
+                    STATS.increment('dukeds path cache fresh')
+                    return record
+                STATS.increment('dukeds path cache revalidated')
+                dds_file = self.revalidate_file(duke_ds_file_path, record)
+                if dds_file:
+                    self.path_cache.put(duke_ds_file_path, dds_config, dds_file)
+                    return dds_file
+        dds_file = self.find_file_for_path_uncached(duke_ds_file_path)
+        if self.path_cache:
+            self.path_cache.put(duke_ds_file_path, dds_config, dds_file)
+        return dds_file
+
+    def revalidate_file(self, duke_ds_file_path, record):
+        """
+        Fetch a previously found file by id, which is much cheaper than finding it by path again
+        :param duke_ds_file_path: str: dds://<project_name>/<file_path> path the file was found for
+        :param record: DDSFileRecord: cached details of the file
+        :return: ddsc.sdk.client.File or None if the file was deleted, renamed or moved
+        """
+        try:
+            with STATS.timer('dukeds get_file_by_id'):
+                dds_file = self.client.get_file_by_id(record.id)
+        except DataServiceError as ex:
+            if ex.status_code == 404:
+                return None
+            raise
+        if dds_file.is_deleted or dds_file.project_id != record.project_id:
+            return None
+        project_name, file_path = self.get_project_name_and_file_path(duke_ds_file_path)
+        if self.get_file_path(dds_file) != file_path:
+            return None
+        return dds_file
+
+    @staticmethod
+    def get_file_path(dds_file):
+        """
+        :param dds_file: ddsc.sdk.client.File: file fetched from DukeDS
+        :return: str: path of the file within its project
+        """
+        folder_names = [ancestor['name'] for ancestor in dds_file.ancestors if ancestor['kind'] != DUKEDS_PROJECT_KIND]
+        return '/'.join(folder_names + [dds_file.name])
+
+    def find_file_for_path_uncached(self, duke_ds_file_path):
         project_name, file_path = self.get_project_name_and_file_path(duke_ds_file_path)
         project = self.find_project_for_name(project_name)
         if project:
             try:
-                return project.get_child_for_path(file_path)
+                with STATS.timer('dukeds get_child_for_path'):
+                    return project.get_child_for_path(file_path)
             except ItemNotFound:
                 raise FileDoesNotExistException("File does not exist: {}".format(duke_ds_file_path))
         else:
@@ -37,11 +106,196 @@ class DDSFileUtil(object):
         return project_name, file_path
 
     def find_project_for_name(self, project_name):
-        for project in self.client.get_projects():
-            if project.name == project_name:
-                return project
-        return None
+        """
+        Find a project by name, fetching the list of projects once per DDSFileUtil
+        :param project_name: str: name of the project to find
+        :return: ddsc.sdk.client.Project or None if not found
+        """
+        with self._projects_lock:
+            if self._projects_by_name is None:
+                self._projects_by_name = {}
+                with STATS.timer('dukeds get_projects'):
+                    for project in self.client.get_projects():
+                        self._projects_by_name.setdefault(project.name, project)
+        return self._projects_by_name.get(project_name)
 
     def give_download_permissions(self, project_id, dds_user_id):
-        self.client.dds_connection.data_service.set_user_project_permission(project_id, dds_user_id,
-                                                                            auth_role='file_downloader')
+        with STATS.timer('dukeds set_user_project_permission'):
+            self.client.dds_connection.data_service.set_user_project_permission(project_id, dds_user_id,
+                                                                                auth_role='file_downloader')
+
+
+class DDSFileCache(object):
+    """
+    Looks up each distinct DukeDS file path once, sharing the file found (or the error raised) with later lookups.
+    Concurrent lookups of the same path wait for the first one instead of repeating it.
+    """
+    def __init__(self, find_file_for_path):
+        """
+        :param find_file_for_path: function: looks up the ddsc.sdk.client.File for a dds://<project>/<path> path
+        """
+        self._find_file_for_path = find_file_for_path
+        self._lock = threading.Lock()
+        self._path_locks = {}
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def find_file_for_path(self, duke_ds_file_path):
+        with self._lock:
+            path_lock = self._path_locks.setdefault(duke_ds_file_path, threading.Lock())
+        with path_lock:
+            with self._lock:
+                result = self._results.get(duke_ds_file_path)
+                if result:
+                    self.hits += 1
+                    STATS.increment('dukeds file cache hits')
+            if result is None:
+                result = self._lookup(duke_ds_file_path)
+                with self._lock:
+                    self._results[duke_ds_file_path] = result
+                    self.misses += 1
+                    STATS.increment('dukeds file cache misses')
+        dds_file, error = result
+        if error:
+            raise error
+        return dds_file
+
+    def _lookup(self, duke_ds_file_path):
+        try:
+            return self._find_file_for_path(duke_ds_file_path), None
+        except UserInputException as ex:
+            return None, ex
+
+
+def get_path_cache_key(duke_ds_file_path, dds_config):
+    """
+    Create the key a path is cached under, so files found with one DukeDS server or account are never used with another
+    :param duke_ds_file_path: str: dds://<project_name>/<file_path> path
+    :param dds_config: ddsc.config.Config: url and keys used to connect to DukeDS
+    :return: str: hex digest of the path and the DukeDS identity
+    """
+    key_data = {
+        'path': duke_ds_file_path,
+        'url': dds_config.url,
+        'agent_key_sha256': hashlib.sha256(str(dds_config.agent_key).encode('utf-8')).hexdigest(),
+        'user_key_sha256': hashlib.sha256(str(dds_config.user_key).encode('utf-8')).hexdigest(),
+    }
+    canonical_json = json.dumps(key_data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical_json.encode('utf-8')).hexdigest()
+
+
+class DDSFileRecord(object):
+    """
+    Details of a DukeDS file needed to create a job, as saved in a DDSPathCache.
+    """
+    def __init__(self, project_id, file_id, version_id, size, checked_at):
+        """
+        :param project_id: str: id of the project containing the file
+        :param file_id: str: id of the file
+        :param version_id: str: id of the current version of the file
+        :param size: int: size of the current version of the file
+        :param checked_at: float: time the file was last found in DukeDS
+        """
+        self.project_id = project_id
+        self.id = file_id
+        self.current_version = {'id': version_id, 'upload': {'size': size}}
+        self.checked_at = checked_at
+
+    @staticmethod
+    def from_dds_file(dds_file, checked_at):
+        return DDSFileRecord(dds_file.project_id, dds_file.id, dds_file.current_version['id'],
+                             dds_file.current_version['upload']['size'], checked_at)
+
+    @staticmethod
+    def from_dict(data):
+        return DDSFileRecord(data['project_id'], data['file_id'], data['version_id'], data['size'],
+                             data['checked_at'])
+
+    def to_dict(self):
+        return {
+            'project_id': self.project_id,
+            'file_id': self.id,
+            'version_id': self.current_version['id'],
+            'size': self.current_version['upload']['size'],
+            'checked_at': self.checked_at,
+        }
+
+
+class DDSPathCache(object):
+    """
+    File of dds:// paths and the DukeDS files found for them, so later commands do not find the same path again.
+    Records are kept per DukeDS url and user/agent key.
+    Records older than ttl_seconds are revalidated by fetching the file by id before they are used.
+    Safe to use from multiple threads.
+    """
+    def __init__(self, filename=os.environ.get(DDS_PATH_CACHE_FILENAME_ENV, DEFAULT_DDS_PATH_CACHE_FILENAME),
+                 ttl_seconds=DDS_PATH_CACHE_TTL_SECONDS, time_func=time.time):
+        """
+        :param filename: str: path of the JSON file used to store records
+        :param ttl_seconds: float: seconds a record can be used without revalidating it
+        :param time_func: function: returns the current time in seconds
+        """
+        self.filename = os.path.expanduser(filename)
+        self.ttl_seconds = ttl_seconds
+        self.time_func = time_func
+        self._records = None
+        self._changed = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._records is None:
+            self._records = {}
+            try:
+                with open(self.filename) as infile:
+                    data = json.load(infile)
+                if data.get('version') == DDS_PATH_CACHE_FORMAT_VERSION:
+                    for key, record_dict in data['records'].items():
+                        self._records[key] = DDSFileRecord.from_dict(record_dict)
+            except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+                # a missing or unreadable cache is the same as an empty one
+                self._records = {}
+        return self._records
+
+    def get(self, duke_ds_file_path, dds_config):
+        """
+        :param duke_ds_file_path: str: dds://<project_name>/<file_path> path
+        :param dds_config: ddsc.config.Config: url and keys used to connect to DukeDS
+        :return: DDSFileRecord or None if the path is not cached
+        """
+        key = get_path_cache_key(duke_ds_file_path, dds_config)
+        with self._lock:
+            return self._load().get(key)
+
+    def is_expired(self, record):
+        return self.time_func() - record.checked_at >= self.ttl_seconds
+
+    def put(self, duke_ds_file_path, dds_config, dds_file):
+        """
+        Record the file found for a path, marking it as checked now
+        :param duke_ds_file_path: str: dds://<project_name>/<file_path> path
+        :param dds_config: ddsc.config.Config: url and keys used to connect to DukeDS
+        :param dds_file: ddsc.sdk.client.File or DDSFileRecord: file found for the path
+        """
+        key = get_path_cache_key(duke_ds_file_path, dds_config)
+        record = DDSFileRecord.from_dds_file(dds_file, self.time_func())
+        with self._lock:
+            self._load()[key] = record
+            self._changed = True
+
+    def save(self):
+        """
+        Write the records to the cache file if any changed, replacing the file in a single step.
+        """
+        with self._lock:
+            if not self._changed:
+                return
+            data = {
+                'version': DDS_PATH_CACHE_FORMAT_VERSION,
+                'records': dict((key, record.to_dict()) for key, record in self._records.items()),
+            }
+            directory = os.path.dirname(self.filename) or '.'
+            with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as outfile:
+                json.dump(data, outfile)
+            os.replace(outfile.name, self.filename)
+            self._changed = False
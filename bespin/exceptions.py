@@ -27,6 +27,10 @@ class WorkflowConfigurationNotFoundException(UserInputException):
     pass
 
 
+class DDSUserCredentialNotFoundException(UserInputException):
+    pass
+
+
 class WorkflowNotFound(UserInputException):
     pass
 
@@ -41,3 +45,11 @@ class ShareGroupNotFound(UserInputException):
 
 class JobStrategyNotFound(UserInputException):
     pass
+
+
+class JobBatchException(UserInputException):
+    pass
+
+
+class ToolDetailsBackfillException(UserInputException):
+    pass
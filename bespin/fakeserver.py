@@ -0,0 +1,398 @@
+"""
+In-process stand-in for the bespin-api endpoints used by BespinApi, serving synthetic data over HTTP on localhost.
+Latency, error rate and dataset size are configurable so concurrency, caching and retry behavior can be tested
+and benchmarked without the production server.
+"""
+from collections import OrderedDict
+import json
+import random
+import re
+import threading
+import time
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qsl, urlencode
+from bespin.config import Config
+
+FAKE_TOKEN = 'fake-token'
+JOB_STATES = ['N', 'A', 'S', 'R', 'F', 'E', 'C']
+JOB_STEPS = ['', 'V', 'S', 'R', 'O', 'P', 'T']
+INJECTED_FAULT_DETAIL = 'Injected fault'
+JOB_TEMPLATE_REQUIRED_FIELDS = ['tag', 'name', 'fund_code', 'job_order']
+# seconds between checks for stop() in the serving thread
+SHUTDOWN_POLL_INTERVAL = 0.01
+
+
+class FakeBespinData(object):
+    """
+    Synthetic bespin-api records stored by collection name (the url segment of their list endpoint) and id.
+    The same arguments always generate the same records.
+    """
+    def __init__(self, num_jobs=10, num_workflows=2, num_versions=2, num_configurations=1, num_share_groups=1,
+                 num_job_strategies=2):
+        """
+        :param num_jobs: int: number of jobs
+        :param num_workflows: int: number of workflows
+        :param num_versions: int: number of versions of each workflow
+        :param num_configurations: int: number of configurations of each workflow
+        :param num_share_groups: int: number of share groups
+        :param num_job_strategies: int: number of job strategies
+        """
+        self._lock = threading.Lock()
+        self.collections = {}
+        self._next_ids = {}
+        for idx in range(num_share_groups):
+            self.create('share-groups', {'name': 'group{}'.format(idx + 1),
+                                         'email': 'group{}@example.com'.format(idx + 1)})
+        for idx in range(num_job_strategies):
+            self.create('job-strategies', {
+                'name': 'strategy{}'.format(idx + 1),
+                'job_flavor': {'name': 'flavor{}'.format(idx + 1), 'cpus': 2 ** idx,
+                               'memory': '{}GiB'.format(4 * 2 ** idx)},
+                'volume_size_base': 100,
+                'volume_size_factor': idx + 1,
+            })
+        self.create('dds-user-credentials', {'dds_id': 'dds-user-1'})
+        workflow_version_ids = []
+        for workflow_idx in range(num_workflows):
+            workflow = self.create('workflows', {'name': 'Workflow {}'.format(workflow_idx + 1),
+                                                 'tag': 'workflow{}'.format(workflow_idx + 1), 'versions': []})
+            for version_idx in range(num_versions):
+                workflow_version = self.create_workflow_version(workflow['id'], version_idx + 1)
+                workflow_version_ids.append(workflow_version['id'])
+            for configuration_idx in range(num_configurations):
+                self.create('workflow-configurations', {
+                    'tag': 'config{}'.format(configuration_idx + 1),
+                    'workflow': workflow['id'],
+                    'share_group': 1,
+                    'default_job_strategy': 1,
+                    'system_job_order': {},
+                })
+        for idx in range(num_jobs):
+            workflow_version_id = None
+            if workflow_version_ids:
+                workflow_version_id = workflow_version_ids[idx % len(workflow_version_ids)]
+            self.create('jobs', {
+                'name': 'job{}'.format(idx + 1),
+                'state': JOB_STATES[idx % len(JOB_STATES)],
+                'step': JOB_STEPS[idx % len(JOB_STEPS)],
+                'last_updated': '2019-01-01T{:02d}:{:02d}:{:02d}Z'.format(idx // 3600 % 24, idx // 60 % 60, idx % 60),
+                'usage': {'vm_hours': round(idx * 0.25, 2)},
+                'workflow_version': workflow_version_id,
+            })
+
+    def create(self, collection, record):
+        """
+        Add a record to a collection giving it the next id
+        :param collection: str: name of the collection
+        :param record: dict: fields of the record
+        :return: dict: record with its id
+        """
+        with self._lock:
+            record_id = self._next_ids.get(collection, 1)
+            self._next_ids[collection] = record_id + 1
+            record = dict(record, id=record_id)
+            self.collections.setdefault(collection, OrderedDict())[record_id] = record
+            return record
+
+    def create_workflow_version(self, workflow_id, version, **fields):
+        workflow = self.get('workflows', workflow_id)
+        workflow_version = dict({
+            'workflow': workflow_id,
+            'version': version,
+            'tag': '{}/v{}'.format(workflow['tag'], version),
+            'description': '{} version {}'.format(workflow['name'], version),
+            'type': 'zipped',
+            'url': 'https://example.com/{}/v{}.zip'.format(workflow['tag'], version),
+            'workflow_path': '{}.cwl'.format(workflow['tag']),
+            'version_info_url': None,
+            'fields': [],
+        }, **fields)
+        workflow_version = self.create('workflow-versions', workflow_version)
+        workflow['versions'].append(workflow_version['id'])
+        return workflow_version
+
+    def get(self, collection, record_id):
+        """
+        :return: dict: record or None if there is no record with record_id
+        """
+        return self.collections.get(collection, {}).get(record_id)
+
+    def list(self, collection):
+        return list(self.collections.get(collection, {}).values())
+
+    def get_field(self, record, field):
+        """
+        Look up a field of a record following django style double underscore relationships
+        such as workflow_version__workflow__tag
+        """
+        names = field.split('__')
+        value = record
+        for idx, name in enumerate(names):
+            if value is None:
+                return None
+            value = value.get(name)
+            if idx < len(names) - 1 and value is not None:
+                value = self.get(self._get_related_collection(name), value)
+        return value
+
+    @staticmethod
+    def _get_related_collection(field):
+        return {
+            'workflow': 'workflows',
+            'workflow_version': 'workflow-versions',
+            'share_group': 'share-groups',
+            'default_job_strategy': 'job-strategies',
+        }[field]
+
+    def matches(self, record, name, value):
+        """
+        Determine if a record matches a query parameter filter such as tag=x or last_updated__gte=y
+        """
+        if name.endswith('__gte'):
+            field_value = self.get_field(record, name[:-len('__gte')])
+            return field_value is not None and str(field_value) >= value
+        return str(self.get_field(record, name)) == value
+
+
+class FakeBespinServer(object):
+    """
+    Serves FakeBespinData on a random localhost port from a background thread.
+    Use as a context manager or call start and stop. Point BespinApi at it with create_config().
+    """
+    def __init__(self, data=None, latency=0.0, latency_jitter=0.0, error_rate=0.0, error_status=503,
+                 page_size=None, token=FAKE_TOKEN, seed=0):
+        """
+        :param data: FakeBespinData: records to serve, a small default dataset when None
+        :param latency: float: seconds to wait before answering each request
+        :param latency_jitter: float: up to this many extra seconds are randomly added to each request's latency
+        :param error_rate: float: fraction of requests (0.0 to 1.0) answered with error_status instead
+        :param error_status: int: HTTP status of injected errors
+        :param page_size: int: paginate lists with this many items per page when the request has no limit,
+        lists are returned as plain arrays when None
+        :param token: str: required Authorization token, any token is accepted when None
+        :param seed: int: seed for the latency jitter and injected errors
+        """
+        self.data = data if data is not None else FakeBespinData()
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.page_size = page_size
+        self.token = token
+        self.request_counts = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._http_server = None
+        self._thread = None
+        self._routes = [
+            ('GET', r'/(jobs|workflows|workflow-versions|workflow-version-tool-details|workflow-configurations|'
+                    r'dds-user-credentials|share-groups|job-strategies)/', self._list),
+            ('GET', r'/(jobs|workflows|workflow-versions|workflow-configurations|share-groups|job-strategies)/'
+                    r'(\d+)/', self._get),
+            ('POST', r'/admin/workflows/', self._create_workflow),
+            ('POST', r'/admin/workflow-versions/', self._create_workflow_version),
+            ('POST', r'/admin/(workflow-version-tool-details|workflow-configurations)/', self._create),
+            ('POST', r'/(job-file-stage-groups)/', self._create),
+            ('POST', r'/dds-job-input-files/', self._create_dds_job_input_file),
+            ('POST', r'/job-templates/init/', self._init_job_template),
+            ('POST', r'/job-templates/validate/', self._validate_job_template),
+            ('POST', r'/job-templates/create-job/', self._create_job),
+            ('POST', r'/jobs/(\d+)/(authorize|start|cancel|restart)/', self._change_job_state),
+            ('DELETE', r'/jobs/(\d+)/?', self._delete_job),
+        ]
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/api/v2'.format(self._http_server.server_address[1])
+
+    def create_config(self):
+        """
+        :return: Config: config for a BespinApi that talks to this server
+        """
+        return Config({'url': self.url, 'token': self.token or FAKE_TOKEN})
+
+    @property
+    def total_requests(self):
+        with self._lock:
+            return sum(self.request_counts.values())
+
+    def reset_request_counts(self):
+        with self._lock:
+            self.request_counts = {}
+
+    def start(self):
+        self._http_server = FakeHTTPServer(('127.0.0.1', 0), FakeRequestHandler)
+        self._http_server.fake_server = self
+        self._thread = threading.Thread(target=self._http_server.serve_forever,
+                                        kwargs={'poll_interval': SHUTDOWN_POLL_INTERVAL})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def handle_request(self, method, url, headers, body):
+        """
+        Answer one request
+        :param method: str: HTTP method
+        :param url: str: path and query string of the request
+        :param headers: dict: request headers
+        :param body: str: request body
+        :return: (int, object): HTTP status and JSON data to respond with (None for no content)
+        """
+        parsed_url = urlparse(url)
+        path = parsed_url.path.split('/api/v2', 1)[-1]
+        self._count_request(method, path)
+        delay, inject_error = self._get_fault()
+        if delay:
+            time.sleep(delay)
+        if self.token and headers.get('Authorization') != 'Token {}'.format(self.token):
+            return 401, {'detail': 'Invalid token.'}
+        if inject_error:
+            return self.error_status, {'detail': INJECTED_FAULT_DETAIL}
+        for route_method, pattern, handler in self._routes:
+            match = re.match(pattern + '$', path)
+            if route_method == method and match:
+                try:
+                    data = json.loads(body) if body else {}
+                except ValueError:
+                    return 400, {'detail': 'JSON parse error.'}
+                return handler(OrderedDict(parse_qsl(parsed_url.query)), data, *match.groups())
+        return 404, {'detail': 'Not found.'}
+
+    def _count_request(self, method, path):
+        name = '{} {}'.format(method, re.sub(r'/\d+(?=/|$)', '/{id}', path))
+        with self._lock:
+            self.request_counts[name] = self.request_counts.get(name, 0) + 1
+
+    def _get_fault(self):
+        with self._lock:
+            delay = self.latency
+            if self.latency_jitter:
+                delay += self._random.uniform(0, self.latency_jitter)
+            inject_error = self.error_rate and self._random.random() < self.error_rate
+            return delay, inject_error
+
+    def _list(self, query, data, collection):
+        limit = query.pop('limit', self.page_size)
+        offset = int(query.pop('offset', 0))
+        items = [record for record in self.data.list(collection)
+                 if all(self.data.matches(record, name, value) for name, value in query.items())]
+        if limit is None:
+            return 200, items
+        limit = int(limit)
+        next_url = None
+        if offset + limit < len(items):
+            next_params = list(query.items()) + [('limit', limit), ('offset', offset + limit)]
+            next_url = '{}/{}/?{}'.format(self.url, collection, urlencode(next_params))
+        return 200, {'count': len(items), 'next': next_url, 'previous': None,
+                     'results': items[offset:offset + limit]}
+
+    def _get(self, query, data, collection, record_id):
+        record = self.data.get(collection, int(record_id))
+        if record is None:
+            return 404, {'detail': 'Not found.'}
+        return 200, record
+
+    def _create(self, query, data, collection):
+        return 201, self.data.create(collection, data)
+
+    def _create_workflow(self, query, data):
+        return 201, self.data.create('workflows', dict(data, versions=[]))
+
+    def _create_workflow_version(self, query, data):
+        if self.data.get('workflows', data.get('workflow')) is None:
+            return 400, {'workflow': ['Invalid pk "{}" - object does not exist.'.format(data.get('workflow'))]}
+        fields = dict(data)
+        fields.pop('workflow')
+        return 201, self.data.create_workflow_version(data['workflow'], **fields)
+
+    def _create_dds_job_input_file(self, query, data):
+        if self.data.get('job-file-stage-groups', data.get('stage_group')) is None:
+            return 400, {'stage_group': ['Invalid pk "{}" - object does not exist.'.format(data.get('stage_group'))]}
+        return 201, self.data.create('dds-job-input-files', data)
+
+    def _init_job_template(self, query, data):
+        return 201, {
+            'tag': data.get('tag'),
+            'name': 'TODO',
+            'fund_code': 'TODO',
+            'job_order': {'input': {'class': 'File', 'path': 'dds://TODO'}},
+        }
+
+    def _validate_job_template(self, query, data):
+        missing_fields = [field for field in JOB_TEMPLATE_REQUIRED_FIELDS if not data.get(field)]
+        if missing_fields:
+            return 400, OrderedDict((field, ['This field is required.']) for field in missing_fields)
+        return 200, data
+
+    def _create_job(self, query, data):
+        status, response = self._validate_job_template(query, data)
+        if status != 200:
+            return status, response
+        if self.data.get('job-file-stage-groups', data.get('stage_group')) is None:
+            return 400, {'stage_group': ['This field is required.']}
+        job = self.data.create('jobs', {
+            'name': data['name'],
+            'state': 'N',
+            'step': '',
+            'last_updated': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'usage': None,
+            'workflow_version': None,
+        })
+        return 201, dict(data, job=job['id'])
+
+    def _change_job_state(self, query, data, job_id, action):
+        job = self.data.get('jobs', int(job_id))
+        if job is None:
+            return 404, {'detail': 'Not found.'}
+        job['state'] = {'authorize': 'A', 'start': 'R', 'cancel': 'C', 'restart': 'R'}[action]
+        return 200, job
+
+    def _delete_job(self, query, data, job_id):
+        if self.data.collections.get('jobs', {}).pop(int(job_id), None) is None:
+            return 404, {'detail': 'Not found.'}
+        return 204, None
+
+
+class FakeHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops connections from concurrent clients, making them wait to retry
+    request_queue_size = 128
+
+
+class FakeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def do_DELETE(self):
+        self._respond('DELETE')
+
+    def _respond(self, method):
+        content_length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(content_length).decode('utf-8') if content_length else ''
+        status, data = self.server.fake_server.handle_request(method, self.path, self.headers, body)
+        content = b'' if data is None else json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # requests are counted by the fake server instead of logged to stderr
+        pass
@@ -1,10 +1,19 @@
-from bespin.exceptions import WorkflowConfigurationNotFoundException, IncompleteJobTemplateException
-from bespin.dukeds import DDSFileUtil
+from bespin.exceptions import WorkflowConfigurationNotFoundException, IncompleteJobTemplateException, \
+    UserInputException, DDSUserCredentialNotFoundException
+from bespin.dukeds import DDSFileUtil, DDSFileCache
 from bespin.dukeds import PATH_PREFIX as DUKEDS_PATH_PREFIX
-from bespin.api import BespinApi, BespinClientErrorException
+from bespin.api import BespinApi, BespinClientErrorException, first_item
+from bespin.journal import JournalFile, get_idempotency_key
+from bespin.stats import STATS
+from bespin.tracing import TRACER
 import yaml
 import copy
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# maximum number of steps of creating a single job that run at the same time
+CREATE_JOB_MAX_WORKERS = 8
 
 class JobTemplate(object):
     """
@@ -17,86 +26,196 @@ class JobTemplate(object):
         self.job_order = job_order
         self.job_strategy = job_strategy
         self.stage_group_id = None
+        self._formatted_job_order = None
+
+    def _get_formatted_job_order(self):
+        """
+        Format job_order once, remembering the result until job_order is replaced.
+        Changes made inside job_order after the first call are not seen.
+        :return: FormattedJobOrder
+        """
+        formatted_job_order = self._formatted_job_order
+        if formatted_job_order is None or formatted_job_order.source_job_order is not self.job_order:
+            formatted_job_order = FormattedJobOrder(self.job_order)
+            self._formatted_job_order = formatted_job_order
+        return formatted_job_order
 
     def create_user_job_order(self):
         """
-        Format job order replacing dds remote file paths with filenames that will be staged
+        Format job order replacing dds remote file paths with filenames that will be staged.
+        The result is shared between calls so it must not be modified.
         :return: dict: job order for running CWL
         """
-        user_job_order = copy.deepcopy(self.job_order)
-        formatter = JobOrderFormatFiles()
-        formatter.walk(user_job_order)
-        return user_job_order
+        return self._get_formatted_job_order().job_order
 
-    def get_dds_files_details(self):
+    def get_dds_files_details(self, file_finder=None):
         """
         Get dds files info based on job_order
+        :param file_finder: object with find_file_for_path such as DDSFileUtil or JobCreationContext
         :return: [(dds_file, staging_filename)]
         """
-        job_order_details = JobOrderFileDetails()
-        job_order_details.walk(self.job_order)
-        return job_order_details.dds_files
+        file_finder = file_finder or DDSFileUtil()
+        return [(file_finder.find_file_for_path(path), format_file_path(path))
+                for path in self.get_dds_file_paths()]
+
+    def get_dds_file_paths(self):
+        """
+        Get dds file paths referenced by job_order without looking them up
+        :return: [str]: dds://<project_name>/<file_path> paths
+        """
+        return list(self._get_formatted_job_order().dds_file_paths)
 
     def read_workflow_configuration(self, api):
         workflow_tag, version_str, config_tag = self.tag.split('/')
-        workflow_configurations = api.workflow_configurations_list(tag=config_tag, workflow_tag=workflow_tag)
-        if workflow_configurations:
-            return workflow_configurations[0]
+        workflow_configuration = first_item(api.workflow_configurations_list(tag=config_tag, workflow_tag=workflow_tag))
+        if workflow_configuration:
+            return workflow_configuration
         raise WorkflowConfigurationNotFoundException(
             "Unable to find workflow configuration for tag {}".format(self.tag)
         )
 
-    def create_job(self, api):
+    def get_idempotency_key(self, api):
+        return get_idempotency_key({
+            'tag': self.tag,
+            'name': self.name,
+            'fund_code': self.fund_code,
+            'job_order': self.job_order,
+            'job_strategy': self.job_strategy,
+        }, api.config)
+
+    def create_job(self, api, context=None):
         """
-        Create a job using the passed on api
+        Create a job using the passed on api.
+        Each completed step is recorded in the context's journal so running the same job template again after a
+        failure continues from the last completed step, reusing the stage group.
         :param api: BespinApi
+        :param context: JobCreationContext: optional lookups shared with other job templates
         :return: dict: job dictionary returned from bespin api
         """
+        if context is None:
+            context = JobCreationContext(api)
+        journal_file = context.open_journal(self.get_idempotency_key(api))
         try:
-            dds_user_credential = api.dds_user_credentials_list()[0]
-            self.read_workflow_configuration(api)
-            stage_group = api.stage_group_post()
-            self.stage_group_id = stage_group['id']
-            dds_project_ids = set()
-            sequence = 0
-            for dds_file, path in self.get_dds_files_details():
-                file_size = dds_file.current_version['upload']['size']
-                api.dds_job_input_files_post(dds_file.project_id, dds_file.id, path, 0, sequence,
-                                             dds_user_credential['id'], stage_group_id=self.stage_group_id,
-                                             size=file_size)
-                sequence += 1
-                dds_project_ids.add(dds_file.project_id)
-
-            job = api.job_templates_create_job(self.get_formatted_dict(api))
-            dds_file_util = DDSFileUtil()
-            for project_id in dds_project_ids:
-                dds_file_util.give_download_permissions(project_id, dds_user_credential['dds_id'])
+            with STATS.timer('job create'):
+                job = self._create_job_steps(api, context, journal_file)
+            journal_file.remove()
             return job
         except BespinClientErrorException as ex:
             self.format_bespin_client_exception(ex)
+        finally:
+            journal_file.close()
+
+    def _create_job_steps(self, api, context, journal_file):
+        """
+        Run the steps of creating a job as a small dependency graph so independent steps overlap:
+        the DDS credential, workflow configuration and every DukeDS file are looked up at the same time,
+        the stage group is created once the credential and workflow configuration are found
+        and each input file is posted as soon as it is found and the credential and stage group exist.
+        """
+        with ThreadPoolExecutor(max_workers=CREATE_JOB_MAX_WORKERS) as executor:
+            # steps that do not wait on other steps are submitted first so they are never queued behind their waiters
+            credential_future = executor.submit(TRACER.bind(context.get_dds_user_credential))
+            workflow_configuration_future = executor.submit(TRACER.bind(context.get_workflow_configuration), self)
+            stage_group_future = executor.submit(TRACER.bind(self._get_or_create_stage_group), api, journal_file,
+                                                 credential_future, workflow_configuration_future)
+            futures = [credential_future, workflow_configuration_future, stage_group_future]
+            input_file_futures = []
+            for sequence, duke_ds_file_path in enumerate(self.get_dds_file_paths()):
+                input_file_futures.append(executor.submit(TRACER.bind(self._post_input_file), api, context,
+                                                          journal_file, sequence, duke_ds_file_path,
+                                                          credential_future, stage_group_future))
+            futures.extend(input_file_futures)
+            try:
+                dds_files = [future.result() for future in input_file_futures]
+                workflow_configuration_future.result()
+                dds_user_credential = credential_future.result()
+                self.stage_group_id = stage_group_future.result()['id']
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        job = journal_file.get('job')
+        if job is None:
+            with STATS.timer('job create job'):
+                job = api.job_templates_create_job(self.get_formatted_dict(api, context))
+            journal_file.record('job', job)
+        with STATS.timer('job give permissions'):
+            for project_id in sorted(set(dds_file.project_id for dds_file in dds_files)):
+                context.give_download_permissions(project_id, dds_user_credential['dds_id'])
+        return job
 
-    def validate(self, api):
+    @staticmethod
+    def _get_or_create_stage_group(api, journal_file, credential_future, workflow_configuration_future):
+        stage_group = journal_file.get('stage_group')
+        if stage_group is None:
+            # only create a stage group once the job can be created so a failed lookup does not leave one behind
+            credential_future.result()
+            workflow_configuration_future.result()
+            with STATS.timer('job stage group'):
+                stage_group = {'id': api.stage_group_post()['id']}
+            journal_file.record('stage_group', stage_group)
+        return stage_group
+
+    def _post_input_file(self, api, context, journal_file, sequence, duke_ds_file_path, credential_future,
+                         stage_group_future):
+        dds_file = context.find_file_for_path(duke_ds_file_path)
+        step = 'input_file:{}:{}'.format(sequence, dds_file.id)
+        if journal_file.get(step) is None:
+            dds_user_credential = credential_future.result()
+            stage_group = stage_group_future.result()
+            file_size = dds_file.current_version['upload']['size']
+            with STATS.timer('job input file'):
+                api.dds_job_input_files_post(dds_file.project_id, dds_file.id,
+                                             format_file_path(duke_ds_file_path), 0, sequence,
+                                             dds_user_credential['id'], stage_group_id=stage_group['id'],
+                                             size=file_size)
+            journal_file.record(step, {})
+        return dds_file
+
+    def validate(self, api, context=None):
+        """
+        Check the job order with bespin-api while checking that every DukeDS file exists.
+        Problems found by either check are raised together.
+        :param api: BespinApi
+        :param context: JobCreationContext: optional lookups shared with other job templates
+        """
+        if context is None:
+            context = JobCreationContext(api)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            api_future = executor.submit(TRACER.bind(api.job_template_validate), self.get_formatted_dict(api, context))
+            dds_files_future = executor.submit(TRACER.bind(context.prefetch_dds_files), self.get_dds_file_paths(),
+                                               CREATE_JOB_MAX_WORKERS)
+        issues = []
         try:
-            # check with bespin-api to see if the job order is valid
-            api.job_template_validate(self.get_formatted_dict(api))
-            # make sure DukeDS files exist (this takes longer)
-            self.get_dds_files_details()
+            api_future.result()
         except BespinClientErrorException as ex:
-            self.format_bespin_client_exception(ex)
+            issues.append(self.get_bespin_client_exception_message(ex))
+        try:
+            dds_files_future.result()
+        except UserInputException as ex:
+            issues.append(str(ex))
+        if issues:
+            raise IncompleteJobTemplateException('\n'.join(issues))
 
     def format_bespin_client_exception(self, ex):
+        raise IncompleteJobTemplateException(self.get_bespin_client_exception_message(ex))
+
+    @staticmethod
+    def get_bespin_client_exception_message(ex):
         try:
             details = json.loads(str(ex))
             issues = []
             for key in details:
                 for problem in details[key]:
                     issues.append("{}: {}".format(key, problem))
-            error_message = '\n'.join(issues)
+            return '\n'.join(issues)
         except json.JSONDecodeError:
-            error_message = str(ex)
-        raise IncompleteJobTemplateException(error_message)
+            return str(ex)
 
-    def get_formatted_dict(self, api):
+    def get_formatted_dict(self, api, context=None):
+        if context is None:
+            context = JobCreationContext(api)
         formatted_job_order = self.create_user_job_order()
         data = {
             'name': self.name,
@@ -105,85 +224,240 @@ class JobTemplate(object):
             'tag': self.tag,
         }
         if self.job_strategy:
-            job_strategy_details = api.job_strategy_get_for_name(self.job_strategy)
-            data['job_strategy'] = job_strategy_details['id']
+            data['job_strategy'] = context.get_job_strategy_id(self.job_strategy)
         if self.stage_group_id:
             data['stage_group'] = self.stage_group_id
         return data
 
 
-class JobTemplateLoader(object):
+class FormattedJobOrder(object):
     """
-    Creates JobFile based on an input file
+    Job order with dds file paths replaced by the filenames they will be staged as, made in a single pass that also
+    collects the dds file paths.
     """
-    def __init__(self, infile):
-        self.data = yaml.load(infile)
+    def __init__(self, source_job_order):
+        """
+        :param source_job_order: dict: job order containing dds file paths
+        """
+        self.source_job_order = source_job_order
+        formatter = CopyOnWriteJobOrderFormatter()
+        self.job_order = formatter.format(source_job_order)
+        self.dds_file_paths = formatter.dds_file_paths
 
-    def create_job_template(self):
-        job_template = JobTemplate(tag=self.data.get('tag'),
-                                   name=self.data.get('name'),
-                                   fund_code=self.data.get('fund_code'),
-                                   job_order=self.data.get('job_order'),
-                                   job_strategy=self.data.get('job_strategy'))
-        return job_template
 
+class OnceValues(object):
+    """
+    Creates the value for each key once. Concurrent callers for the same key wait for the first one to create it,
+    while values for different keys are created at the same time. A failed creation is tried again by the next caller.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._values = {}
+
+    def get(self, key, create_value):
+        """
+        :param key: hashable key of the value
+        :param create_value: function: called without arguments to create the value when there is none for key
+        :return: object: value for key
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._values:
+                self._values[key] = create_value()
+            return self._values[key]
 
-class JobOrderWalker(object):
-    def walk(self, obj):
-        for key in obj.keys():
-            self._walk_job_order(key, obj[key])
-
-    def _walk_job_order(self, top_level_key, obj):
-        if self._is_list_but_not_string(obj):
-            return [self._walk_job_order(top_level_key, item) for item in obj]
-        elif isinstance(obj, dict):
-            if 'class' in obj.keys():
-                self.on_class_value(top_level_key, obj)
-            else:
-                for key in obj:
-                    self._walk_job_order(top_level_key, obj[key])
-        else:
-            # base object string or int or something
-            self.on_simple_value(top_level_key, obj)
 
-    @staticmethod
-    def _is_list_but_not_string(obj):
-        return isinstance(obj, list) and not isinstance(obj, str)
+class JobCreationContext(object):
+    """
+    Lookups that are the same for every job created by a command, made once and shared between job templates.
+    Safe to use from multiple threads. Different lookups run at the same time, only callers waiting for the same
+    lookup wait for each other.
+    """
+    def __init__(self, api, dds_file_util=None, dds_path_cache=None, journal=None):
+        """
+        :param api: BespinApi: api used for lookups
+        :param dds_file_util: DDSFileUtil: optional util to use instead of creating one when first needed
+        :param dds_path_cache: DDSPathCache: optional cache of files found by previous commands
+        :param journal: JobCreationJournal: optional journal of steps completed when creating jobs
+        """
+        self.api = api
+        self._dds_file_util = dds_file_util
+        self.dds_path_cache = dds_path_cache
+        self.journal = journal
+        self._dds_file_util_lock = threading.Lock()
+        self._lookups = OnceValues()
+        self.dds_file_cache = DDSFileCache(self._find_uncached_file_for_path)
+
+    @property
+    def dds_file_util(self):
+        if self._dds_file_util is None:
+            with self._dds_file_util_lock:
+                if self._dds_file_util is None:
+                    self._dds_file_util = DDSFileUtil(path_cache=self.dds_path_cache)
+        return self._dds_file_util
+
+    def get_dds_user_credential(self):
+        return self._lookups.get('dds_user_credential', self._read_dds_user_credential)
+
+    def _read_dds_user_credential(self):
+        dds_user_credential = first_item(self.api.dds_user_credentials_list())
+        if not dds_user_credential:
+            raise DDSUserCredentialNotFoundException("No DukeDS credential configured in bespin-api.")
+        return dds_user_credential
+
+    def get_workflow_configuration(self, job_template):
+        return self._lookups.get(('workflow_configuration', job_template.tag),
+                                 lambda: job_template.read_workflow_configuration(self.api))
+
+    def get_job_strategy_id(self, job_strategy_name):
+        return self._lookups.get(('job_strategy_id', job_strategy_name),
+                                 lambda: self.api.job_strategy_get_for_name(job_strategy_name)['id'])
+
+    def prefetch_dds_files(self, duke_ds_file_paths, max_workers):
+        """
+        Look up the distinct paths concurrently so job templates sharing this context do not look them up again.
+        :param duke_ds_file_paths: [str]: dds://<project_name>/<file_path> paths, may contain duplicates
+        :param max_workers: int: maximum number of lookups to run at the same time
+        """
+        paths = sorted(set(duke_ds_file_paths))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            errors = [error for error in executor.map(TRACER.bind(self._prefetch_dds_file), paths) if error]
+        if errors:
+            raise UserInputException('\n'.join(errors))
 
-    def on_class_value(self, top_level_key, value):
-        pass
+    def _prefetch_dds_file(self, duke_ds_file_path):
+        try:
+            self.find_file_for_path(duke_ds_file_path)
+        except UserInputException as ex:
+            return str(ex)
+
+    def find_file_for_path(self, duke_ds_file_path):
+        """
+        Find a DukeDS file, looking up each distinct path only once for all job templates sharing this context
+        :param duke_ds_file_path: str: dds://<project_name>/<file_path> path
+        :return: ddsc.sdk.client.File
+        """
+        return self.dds_file_cache.find_file_for_path(duke_ds_file_path)
 
-    def on_simple_value(self, top_level_key, value):
-        pass
+    def _find_uncached_file_for_path(self, duke_ds_file_path):
+        return self.dds_file_util.find_file_for_path(duke_ds_file_path)
+
+    def open_journal(self, key):
+        """
+        :param key: str: idempotency key of the job template being created
+        :return: JournalFile: steps previously completed for key, kept in memory only when there is no journal
+        """
+        if self.journal:
+            return self.journal.open(key)
+        return JournalFile()
+
+    def save_dds_path_cache(self):
+        if self.dds_path_cache:
+            self.dds_path_cache.save()
+
+    def give_download_permissions(self, project_id, dds_user_id):
+        self._lookups.get(('download_permissions', project_id, dds_user_id),
+                          lambda: self.dds_file_util.give_download_permissions(project_id, dds_user_id))
+
+
+class JobTemplateLoader(object):
+    """
+    Creates JobFile based on an input file
+    """
+    def __init__(self, infile):
+        with STATS.timer('yaml load'):
+            self.data = yaml.load(infile)
+
+    def create_job_template(self):
+        return self.create_job_template_for_data(self.data)
 
     @staticmethod
-    def format_file_path(path):
+    def create_job_template_for_data(data):
         """
-        Create a valid file path based on a dds placeholder url
-        :param path: str: format dds://<projectname>/<filepath>
-        :return: str: file path to be used for staging data when running the workflow
+        Create a JobTemplate from a dictionary in the job template file format
+        :param data: dict: job template fields
+        :return: JobTemplate
         """
-        if path.startswith(DUKEDS_PATH_PREFIX):
-            return path.replace(DUKEDS_PATH_PREFIX, "dds_").replace("/", "_").replace(":", "_")
-        return path
+        job_template = JobTemplate(tag=data.get('tag'),
+                                   name=data.get('name'),
+                                   fund_code=data.get('fund_code'),
+                                   job_order=data.get('job_order'),
+                                   job_strategy=data.get('job_strategy'))
+        return job_template
 
 
-class JobOrderFormatFiles(JobOrderWalker):
-    def on_class_value(self, top_level_key, value):
-        if value['class'] == 'File':
-            path = value.get('path')
-            if path:
-                value['path'] = self.format_file_path(path)
+def _is_list_but_not_string(obj):
+    return isinstance(obj, list) and not isinstance(obj, str)
 
 
-class JobOrderFileDetails(JobOrderWalker):
+def format_file_path(path):
+    """
+    Create a valid file path based on a dds placeholder url
+    :param path: str: format dds://<projectname>/<filepath>
+    :return: str: file path to be used for staging data when running the workflow
+    """
+    if path.startswith(DUKEDS_PATH_PREFIX):
+        return path.replace(DUKEDS_PATH_PREFIX, "dds_").replace("/", "_").replace(":", "_")
+    return path
+
+
+class CopyOnWriteJobOrderFormatter(object):
+    """
+    Formats a job order without modifying it, replacing dds file paths with the filenames they will be staged as
+    and collecting the dds file paths found.
+    Only the dicts and lists containing a rewritten File path are copied, everything else is shared with the
+    original job order. Walks with an explicit stack so deeply nested job orders can not hit the recursion limit.
+    """
     def __init__(self):
-        self.dds_file_util = DDSFileUtil()
-        self.dds_files = []
+        self.dds_file_paths = []
 
-    def on_class_value(self, top_level_key, value):
+    def format(self, job_order):
+        """
+        :param job_order: dict: job order containing dds file paths
+        :return: dict: job order with dds file paths replaced, may share values with job_order
+        """
+        # each frame is [container, keys of the container, index of the next key, {key: replaced value}]
+        stack = [[job_order, list(job_order.keys()), 0, {}]]
+        while True:
+            frame = stack[-1]
+            container, keys, idx, replacements = frame
+            if idx < len(keys):
+                frame[2] += 1
+                key = keys[idx]
+                child = container[key]
+                if isinstance(child, dict) and 'class' in child:
+                    formatted_child = self._format_class_value(child)
+                    if formatted_child is not child:
+                        replacements[key] = formatted_child
+                elif isinstance(child, dict):
+                    stack.append([child, list(child.keys()), 0, {}])
+                elif _is_list_but_not_string(child):
+                    stack.append([child, range(len(child)), 0, {}])
+                continue
+            stack.pop()
+            formatted_container = container
+            if replacements:
+                formatted_container = copy.copy(container)
+                for key, value in replacements.items():
+                    formatted_container[key] = value
+            if not stack:
+                return formatted_container
+            if formatted_container is not container:
+                parent_frame = stack[-1]
+                parent_key = parent_frame[1][parent_frame[2] - 1]
+                parent_frame[3][parent_key] = formatted_container
+
+    def _format_class_value(self, value):
         if value['class'] == 'File':
             path = value.get('path')
-            if path and path.startswith(DUKEDS_PATH_PREFIX):
-                dds_file = self.dds_file_util.find_file_for_path(path)
-                self.dds_files.append((dds_file, self.format_file_path(path)))
+            if path:
+                if path.startswith(DUKEDS_PATH_PREFIX):
+                    self.dds_file_paths.append(path)
+                formatted_path = format_file_path(path)
+                if formatted_path != path:
+                    formatted_value = copy.copy(value)
+                    formatted_value['path'] = formatted_path
+                    return formatted_value
+        return value
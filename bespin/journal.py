@@ -0,0 +1,129 @@
+"""
+Records the steps completed while creating a job so a failed job creation can continue where it stopped.
+"""
+import hashlib
+import json
+import os
+import threading
+
+JOURNAL_DIRECTORY_ENV = 'BESPIN_JOURNAL_DIR'
+DEFAULT_JOURNAL_DIRECTORY = '~/.bespin-journal'
+
+
+def get_idempotency_key(data, config):
+    """
+    Create a key that is the same for every run of the same job template data by the same bespin-api user,
+    so steps recorded against one server or account are never reused with another
+    :param data: dict: job template fields
+    :param config: Config: url and token of the bespin-api the job is created with
+    :return: str: hex digest of data and the bespin-api identity
+    """
+    key_data = {
+        'data': data,
+        'url': config.url,
+        'token_sha256': hashlib.sha256(str(config.token).encode('utf-8')).hexdigest(),
+    }
+    canonical_json = json.dumps(key_data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical_json.encode('utf-8')).hexdigest()
+
+
+class JournalFile(object):
+    """
+    Steps completed for one job template, appended to a JSON lines file as they complete.
+    When filename is None steps are only remembered in memory. Steps can be recorded from multiple threads.
+    """
+    def __init__(self, filename=None, on_close=None):
+        """
+        :param filename: str: path of the JSON lines file or None to not write one
+        :param on_close: function: called with this JournalFile when it is closed
+        """
+        self.filename = filename
+        self.on_close = on_close
+        self.steps = {}
+        self._lock = threading.Lock()
+        if filename and os.path.exists(filename):
+            self._read_steps()
+
+    def _read_steps(self):
+        with open(self.filename) as infile:
+            for line in infile:
+                try:
+                    entry = json.loads(line)
+                    self.steps[entry['step']] = entry['data']
+                except (ValueError, KeyError, TypeError):
+                    # the last line may be incomplete if the previous run was killed while writing it
+                    pass
+
+    @property
+    def resumed(self):
+        return bool(self.steps)
+
+    def get(self, step):
+        """
+        :param step: str: name of the step
+        :return: dict: data recorded when the step completed or None if it has not completed
+        """
+        return self.steps.get(step)
+
+    def record(self, step, data):
+        """
+        Record that a step completed
+        :param step: str: name of the step
+        :param data: dict: values needed to continue after this step
+        """
+        with self._lock:
+            self.steps[step] = data
+            if self.filename:
+                with open(self.filename, 'a') as outfile:
+                    outfile.write(json.dumps({'step': step, 'data': data}, sort_keys=True))
+                    outfile.write('\n')
+
+    def remove(self):
+        """
+        Remove the journal once every step is complete
+        """
+        if self.filename and os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.close()
+
+    def close(self):
+        if self.on_close:
+            self.on_close(self)
+            self.on_close = None
+
+
+class JobCreationJournal(object):
+    """
+    Directory of journal files named by the idempotency key of the job template they belong to.
+    Safe to use from multiple threads.
+    """
+    def __init__(self, directory=os.environ.get(JOURNAL_DIRECTORY_ENV, DEFAULT_JOURNAL_DIRECTORY)):
+        """
+        :param directory: str: directory to store journal files in, created when first needed
+        """
+        self.directory = os.path.expanduser(directory)
+        self._lock = threading.Lock()
+        self._open_keys = set()
+
+    def open(self, key):
+        """
+        Open the journal for a job template, containing any steps completed by a previous run
+        :param key: str: idempotency key of the job template
+        :return: JournalFile
+        """
+        with self._lock:
+            if key in self._open_keys:
+                # an identical job template is being created at the same time, it gets its own job
+                return JournalFile()
+            self._open_keys.add(key)
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+        filename = os.path.join(self.directory, '{}.jsonl'.format(key))
+        return JournalFile(filename, on_close=lambda journal_file: self._close(key))
+
+    def _close(self, key):
+        with self._lock:
+            self._open_keys.discard(key)
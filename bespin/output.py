@@ -0,0 +1,200 @@
+import csv
+import json
+import tempfile
+
+DEFAULT_SAMPLE_SIZE = 100
+COLUMN_SEPARATOR = '  '
+# headers are padded so column widths match the output of earlier versions
+HEADER_PADDING = 2
+
+TABLE_OUTPUT_FORMAT = 'table'
+JSON_OUTPUT_FORMAT = 'json'
+NDJSON_OUTPUT_FORMAT = 'ndjson'
+CSV_OUTPUT_FORMAT = 'csv'
+OUTPUT_FORMATS = [TABLE_OUTPUT_FORMAT, JSON_OUTPUT_FORMAT, NDJSON_OUTPUT_FORMAT, CSV_OUTPUT_FORMAT]
+
+
+def format_column_name(column_name):
+    return column_name.replace("_", " ").title()
+
+
+def format_value(value):
+    """
+    Convert a cell value to the string displayed in a table
+    :param value: object: value from a column of an item
+    :return: str: formatted value
+    """
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return format(value, 'g')
+    return str(value)
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class StreamingTable(object):
+    """
+    Writes column headers and rows as items are produced without holding every row in memory.
+    Column widths are sized from the first sample_size items; later values wider than their column are not truncated.
+    In two_pass mode rows are spilled to a temporary file so column widths can be sized from every row.
+    """
+    def __init__(self, column_names, items, sample_size=DEFAULT_SAMPLE_SIZE, two_pass=False):
+        """
+        :param column_names: [str]: names of the columns to display
+        :param items: iterable of dict: items containing a value for each column name
+        :param sample_size: int: number of items used to determine column widths
+        :param two_pass: bool: when true determine column widths from all items using a spill file
+        """
+        self.column_names = column_names
+        self.items = items
+        self.sample_size = sample_size
+        self.two_pass = two_pass
+        self.widths = [len(format_column_name(name)) + HEADER_PADDING for name in column_names]
+        # a column is right aligned when every value seen while sizing is a number
+        self.numeric_columns = [True for _ in column_names]
+        self.non_empty_columns = [False for _ in column_names]
+
+    def write(self, outfile):
+        """
+        Write the table to outfile.
+        :param outfile: file: destination for the table text
+        """
+        if self.two_pass:
+            self._write_two_pass(outfile)
+        else:
+            self._write_sampled(outfile)
+
+    def _write_sampled(self, outfile):
+        sample_rows = []
+        items = iter(self.items)
+        for item in items:
+            sample_rows.append(self._measure_row(item))
+            if len(sample_rows) >= self.sample_size:
+                break
+        self._write_header(outfile)
+        for row in sample_rows:
+            self._write_row(outfile, row)
+        del sample_rows
+        for item in items:
+            self._write_row(outfile, self._get_row(item))
+
+    def _write_two_pass(self, outfile):
+        with tempfile.TemporaryFile(mode='w+') as spill_file:
+            for item in self.items:
+                row = self._measure_row(item)
+                spill_file.write(json.dumps([format_value(value) for value in row]))
+                spill_file.write('\n')
+            spill_file.seek(0)
+            self._write_header(outfile)
+            for line in spill_file:
+                self._write_row(outfile, json.loads(line))
+
+    def _get_row(self, item):
+        return [item[name] for name in self.column_names]
+
+    def _measure_row(self, item):
+        row = self._get_row(item)
+        for idx, value in enumerate(row):
+            self.widths[idx] = max(self.widths[idx], len(format_value(value)))
+            if value is not None:
+                self.non_empty_columns[idx] = True
+                if not is_number(value):
+                    self.numeric_columns[idx] = False
+        return row
+
+    def _is_right_aligned(self, idx):
+        return self.numeric_columns[idx] and self.non_empty_columns[idx]
+
+    def _format_line(self, values):
+        cells = []
+        for idx, value in enumerate(values):
+            if self._is_right_aligned(idx):
+                cells.append(value.rjust(self.widths[idx]))
+            else:
+                cells.append(value.ljust(self.widths[idx]))
+        return COLUMN_SEPARATOR.join(cells).rstrip()
+
+    def _write_header(self, outfile):
+        outfile.write(self._format_line([format_column_name(name) for name in self.column_names]))
+        outfile.write('\n')
+        outfile.write(COLUMN_SEPARATOR.join(['-' * width for width in self.widths]))
+        outfile.write('\n')
+
+    def _write_row(self, outfile, row):
+        outfile.write(self._format_line([format_value(value) for value in row]))
+        outfile.write('\n')
+
+
+def get_records(column_names, items):
+    """
+    Generate machine readable records containing the values of column_names from each item
+    :param column_names: [str]: names of the fields to include in each record
+    :param items: iterable of dict: items containing a value for each column name
+    :return: generator of dict: one record for each item
+    """
+    for item in items:
+        yield dict((name, item[name]) for name in column_names)
+
+
+class JSONWriter(object):
+    """
+    Writes records as a single JSON array, one record at a time.
+    """
+    def __init__(self, column_names, items):
+        self.column_names = column_names
+        self.items = items
+
+    def write(self, outfile):
+        outfile.write('[')
+        separator = '\n'
+        for record in get_records(self.column_names, self.items):
+            outfile.write(separator)
+            outfile.write(json.dumps(record, sort_keys=True, default=str))
+            separator = ',\n'
+        outfile.write('\n]\n')
+
+
+class NDJSONWriter(object):
+    """
+    Writes one JSON record per line, flushing each line so consumers can process records as they arrive.
+    """
+    def __init__(self, column_names, items):
+        self.column_names = column_names
+        self.items = items
+
+    def write(self, outfile):
+        for record in get_records(self.column_names, self.items):
+            outfile.write(json.dumps(record, sort_keys=True, default=str))
+            outfile.write('\n')
+            outfile.flush()
+
+
+class CSVWriter(object):
+    """
+    Writes a header row of column names followed by one row per record.
+    """
+    def __init__(self, column_names, items):
+        self.column_names = column_names
+        self.items = items
+
+    def write(self, outfile):
+        writer = csv.writer(outfile, lineterminator='\n')
+        writer.writerow(self.column_names)
+        for record in get_records(self.column_names, self.items):
+            writer.writerow([self.format_csv_value(record[name]) for name in self.column_names])
+
+    @staticmethod
+    def format_csv_value(value):
+        if value is None:
+            return ''
+        return value
+
+
+RECORD_WRITERS = {
+    JSON_OUTPUT_FORMAT: JSONWriter,
+    NDJSON_OUTPUT_FORMAT: NDJSONWriter,
+    CSV_OUTPUT_FORMAT: CSVWriter,
+}
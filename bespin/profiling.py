@@ -0,0 +1,138 @@
+"""
+Runs a command under cProfile or tracemalloc (see the global --profile and --profile-memory options).
+"""
+import cProfile
+import pstats
+import sys
+import threading
+import tracemalloc
+
+DEFAULT_PROFILE_FILENAME = 'bespin.pstats'
+DEFAULT_TOP_ENTRIES = 25
+TRACEMALLOC_FRAMES = 10
+# seconds between checks for a new memory peak
+PEAK_POLL_INTERVAL = 0.05
+# take a new snapshot once traced memory grows this much past the last one
+PEAK_SNAPSHOT_GROWTH = 1.1
+
+
+def run_with_profile(func, filename, top_entries, outfile):
+    """
+    Run func under cProfile, write a pstats file and print the entries with the highest cumulative time
+    :param func: function: called with no arguments
+    :param filename: str: path of the pstats file to write
+    :param top_entries: int: number of entries to print
+    :param outfile: file: destination for the printed entries
+    :return: object: value returned by func
+    """
+    profile = cProfile.Profile()
+    thread_profiler = ThreadProfiler()
+    thread_profiler.enable()
+    profile.enable()
+    try:
+        return func()
+    finally:
+        profile.disable()
+        thread_profiler.disable()
+        stats = pstats.Stats(profile, stream=outfile)
+        for thread_profile in thread_profiler.profiles:
+            stats.add(thread_profile)
+        stats.dump_stats(filename)
+        outfile.write("Wrote profile to {}\n".format(filename))
+        stats.sort_stats('cumulative').print_stats(top_entries)
+
+
+class ThreadProfiler(object):
+    """
+    Profiles the threads started while it is enabled, such as ThreadPoolExecutor workers, each with its own
+    cProfile.Profile since cProfile only profiles the thread that enabled it.
+    On Python 3.12 and later cProfile already profiles every thread, so no thread profiles are created.
+    """
+    def __init__(self):
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def enable(self):
+        threading.setprofile(self._start_thread_profile)
+
+    def disable(self):
+        threading.setprofile(None)
+
+    def _start_thread_profile(self, frame, event, arg):
+        # called for the first event in each new thread, replaces itself with a profile of that thread
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active for the whole process and already sees this thread
+            return
+        with self._lock:
+            self.profiles.append(profile)
+
+
+class PeakMemoryTracker(object):
+    """
+    Keeps a tracemalloc snapshot taken close to the point where traced memory peaked.
+    A background thread polls traced memory and takes a new snapshot whenever it has grown past the last one.
+    """
+    def __init__(self, poll_interval=PEAK_POLL_INTERVAL, growth=PEAK_SNAPSHOT_GROWTH):
+        self.poll_interval = poll_interval
+        self.growth = growth
+        self.peak_snapshot = None
+        self.peak_snapshot_size = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._poll)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        self.check()
+
+    def _poll(self):
+        while not self._stop_event.wait(self.poll_interval):
+            self.check()
+
+    def check(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self.peak_snapshot is None or current > self.peak_snapshot_size * self.growth:
+            self.peak_snapshot = tracemalloc.take_snapshot()
+            self.peak_snapshot_size = current
+
+
+def run_with_tracemalloc(func, top_entries, outfile, poll_interval=PEAK_POLL_INTERVAL):
+    """
+    Run func while tracing memory allocations and print the peak along with the largest allocation sites
+    :param func: function: called with no arguments
+    :param top_entries: int: number of allocation sites to print
+    :param outfile: file: destination for the report
+    :param poll_interval: float: seconds between checks for a new memory peak
+    :return: object: value returned by func
+    """
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracker = PeakMemoryTracker(poll_interval)
+    tracker.start()
+    try:
+        return func()
+    finally:
+        tracker.stop()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        write_tracemalloc_report(tracker.peak_snapshot, peak, top_entries, outfile)
+
+
+def write_tracemalloc_report(snapshot, peak, top_entries, outfile):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    outfile.write("Peak traced memory: {:.1f} KiB\n".format(peak / 1024.0))
+    outfile.write("Largest allocation sites near the peak:\n")
+    for statistic in snapshot.statistics('lineno')[:top_entries]:
+        frame = statistic.traceback[0]
+        outfile.write("{:>10.1f} KiB {:>8} blocks  {}:{}\n".format(statistic.size / 1024.0, statistic.count,
+                                                                    frame.filename, frame.lineno))
@@ -0,0 +1,135 @@
+"""
+Named timers and counters for finding where a command spends its time.
+Nothing is recorded until STATS is enabled (see the global --stats option).
+"""
+from contextlib import contextmanager
+import json
+import threading
+import time
+from bespin.output import StreamingTable
+from bespin.tracing import TRACER
+
+TIMER_COLUMN_NAMES = ['name', 'count', 'total_seconds', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms', 'bytes']
+COUNTER_COLUMN_NAMES = ['name', 'value']
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of already sorted values
+    :param sorted_values: [float]: values in ascending order, must not be empty
+    :param fraction: float: 0.0 to 1.0
+    :return: float: value at the percentile
+    """
+    idx = max(int(round(fraction * len(sorted_values))) - 1, 0)
+    return sorted_values[min(idx, len(sorted_values) - 1)]
+
+
+class Stats(object):
+    """
+    Collects durations and byte counts per timer name and totals per counter name.
+    Safe to use from multiple threads.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._bytes = {}
+        self._counters = {}
+
+    def enable(self):
+        self.enabled = True
+
+    @property
+    def recording(self):
+        """
+        True when timers are recorded, either by these stats or as TRACER spans
+        """
+        return self.enabled or TRACER.enabled
+
+    def reset(self):
+        with self._lock:
+            self._durations = {}
+            self._bytes = {}
+            self._counters = {}
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Time the body of a with statement under name. Yields a dict where the body can set 'bytes' transferred.
+        The body is also recorded as a span when TRACER is enabled.
+        :param name: str: name of the timer
+        """
+        details = {}
+        if not self.recording:
+            yield details
+            return
+        start = time.time()
+        with TRACER.span(name, details):
+            try:
+                yield details
+            finally:
+                if self.enabled:
+                    self.add_time(name, time.time() - start, details.get('bytes'))
+
+    def add_time(self, name, seconds, num_bytes=None):
+        with self._lock:
+            self._durations.setdefault(name, []).append(seconds)
+            if num_bytes is not None:
+                self._bytes[name] = self._bytes.get(name, 0) + num_bytes
+
+    def increment(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def get_timer_summaries(self):
+        """
+        :return: [dict]: one summary per timer (see TIMER_COLUMN_NAMES) sorted by name
+        """
+        with self._lock:
+            durations_by_name = dict((name, sorted(durations)) for name, durations in self._durations.items())
+            bytes_by_name = dict(self._bytes)
+        summaries = []
+        for name in sorted(durations_by_name):
+            durations = durations_by_name[name]
+            total = sum(durations)
+            summaries.append({
+                'name': name,
+                'count': len(durations),
+                'total_seconds': round(total, 3),
+                'mean_ms': round(total * 1000 / len(durations), 1),
+                'p50_ms': round(percentile(durations, 0.5) * 1000, 1),
+                'p95_ms': round(percentile(durations, 0.95) * 1000, 1),
+                'max_ms': round(durations[-1] * 1000, 1),
+                'bytes': bytes_by_name.get(name),
+            })
+        return summaries
+
+    def get_counters(self):
+        """
+        :return: [dict]: one dict with name and value per counter sorted by name
+        """
+        with self._lock:
+            return [{'name': name, 'value': value} for name, value in sorted(self._counters.items())]
+
+    def to_dict(self):
+        return {
+            'timers': self.get_timer_summaries(),
+            'counters': self.get_counters(),
+        }
+
+    def write_json(self, outfile):
+        json.dump(self.to_dict(), outfile, indent=2, sort_keys=True)
+        outfile.write('\n')
+
+    def write_table(self, outfile):
+        StreamingTable(TIMER_COLUMN_NAMES, self.get_timer_summaries()).write(outfile)
+        counters = self.get_counters()
+        if counters:
+            outfile.write('\n')
+            StreamingTable(COUNTER_COLUMN_NAMES, counters).write(outfile)
+
+
+# process wide stats shared by all bespin modules
+STATS = Stats()
@@ -1,7 +1,8 @@
 from __future__ import absolute_import
 from unittest import TestCase
 from bespin.api import BespinApi, BespinException, BespinClientErrorException, NotFoundException, WorkflowNotFound, requests
-from mock import patch, Mock
+from bespin.exceptions import JobDoesNotExistException
+from mock import patch, call, Mock
 
 
 class BespinApiTestCase(TestCase):
@@ -41,6 +42,37 @@ class BespinApiTestCase(TestCase):
             api._delete_request('test')
         self.assertEqual(str(raised_exception.exception).strip(), 'Failed to connect to someurl\nSome Error')
 
+    @patch('bespin.api.STATS')
+    @patch('bespin.api.requests')
+    def test_requests_are_timed_per_endpoint(self, mock_requests, mock_stats):
+        mock_response = Mock(status_code=200, content=b'{"id": 5}')
+        mock_response.json.return_value = {'id': 5}
+        mock_requests.get.return_value = mock_response
+        mock_requests.post.return_value = mock_response
+        timer_details = mock_stats.timer.return_value.__enter__.return_value = {}
+
+        api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
+        api.job_strategy_get(5)
+        api.stage_group_post()
+
+        mock_stats.timer.assert_has_calls([
+            call('api GET /job-strategies/{id}/'),
+            call('api POST /job-file-stage-groups/'),
+        ], any_order=True)
+        self.assertEqual(timer_details['bytes'], 9)
+
+    @patch('bespin.api.STATS')
+    @patch('bespin.api.requests')
+    def test_response_size_not_read_when_not_recording(self, mock_requests, mock_stats):
+        mock_stats.recording = False
+        mock_requests.get.return_value = Mock(status_code=200)
+        timer_details = mock_stats.timer.return_value.__enter__.return_value = {}
+
+        api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
+        api.job_strategy_get(5)
+
+        self.assertEqual(timer_details, {})
+
     @patch('bespin.api.requests')
     def test_jobs_list(self, mock_requests):
         mock_response = Mock(status_code=200)
@@ -48,11 +80,59 @@ class BespinApiTestCase(TestCase):
         mock_requests.get.return_value = mock_response
 
         api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
-        jobs = api.jobs_list()
+        jobs = list(api.jobs_list())
 
         self.assertEqual(jobs, ['job1', 'job2'])
         mock_requests.get.assert_called_with('someurl/jobs/', headers=self.expected_headers)
 
+    @patch('bespin.api.requests')
+    def test_jobs_list_with_filters(self, mock_requests):
+        mock_response = Mock(status_code=200)
+        mock_response.json.return_value = ['job1']
+        mock_requests.get.return_value = mock_response
+
+        api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
+        jobs = list(api.jobs_list(state='R', since='2019-01-02T03:04:05+00:00', workflow_tag='exomeseq', limit=5))
+
+        self.assertEqual(jobs, ['job1'])
+        mock_requests.get.assert_called_with('someurl/jobs/?state=R&last_updated__gte=2019-01-02T03%3A04%3A05%2B00%3A00'
+                                             '&workflow_version__workflow__tag=exomeseq&limit=5',
+                                             headers=self.expected_headers)
+
+    @patch('bespin.api.requests')
+    def test_jobs_list_follows_pagination(self, mock_requests):
+        page1 = Mock(status_code=200)
+        page1.json.return_value = {'results': ['job1', 'job2'], 'next': 'someurl/jobs/?page=2'}
+        page2 = Mock(status_code=200)
+        page2.json.return_value = {'results': ['job3'], 'next': None}
+        mock_requests.get.side_effect = [page1, page2]
+
+        api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
+        jobs = api.jobs_list()
+
+        self.assertEqual(next(jobs), 'job1')
+        self.assertEqual(mock_requests.get.call_count, 1, "Second page is not requested until it is needed.")
+        self.assertEqual(list(jobs), ['job2', 'job3'])
+        mock_requests.get.assert_has_calls([
+            call('someurl/jobs/', headers=self.expected_headers),
+            call('someurl/jobs/?page=2', headers=self.expected_headers),
+        ])
+
+    @patch('bespin.api.requests')
+    def test_jobs_list_refuses_next_link_to_another_host(self, mock_requests):
+        self.mock_config.url = 'https://bespin.example.com/api'
+        api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
+        for next_url in ['https://other.example.com/api/jobs/?page=2', 'http://bespin.example.com/api/jobs/?page=2']:
+            page1 = Mock(status_code=200)
+            page1.json.return_value = {'results': ['job1'], 'next': next_url}
+            mock_requests.get.side_effect = [page1]
+            with self.assertRaises(BespinException) as raised_exception:
+                list(api.jobs_list())
+            self.assertEqual(str(raised_exception.exception),
+                             'Refusing to follow next link {} that is not on https://bespin.example.com/api'.format(
+                                 next_url))
+        self.assertEqual(mock_requests.get.call_count, 2)
+
     @patch('bespin.api.requests')
     def test_workflows_list(self, mock_requests):
         mock_response = Mock(status_code=200)
@@ -60,7 +140,7 @@ class BespinApiTestCase(TestCase):
         mock_requests.get.return_value = mock_response
 
         api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
-        workflows = api.workflows_list()
+        workflows = list(api.workflows_list())
 
         self.assertEqual(workflows, ['workflow1', 'workflow2'])
         mock_requests.get.assert_called_with('someurl/workflows/', headers=self.expected_headers)
@@ -72,7 +152,7 @@ class BespinApiTestCase(TestCase):
         mock_requests.get.return_value = mock_response
 
         api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
-        workflows = api.workflows_list(tag="mytag")
+        workflows = list(api.workflows_list(tag="mytag"))
 
         self.assertEqual(workflows, ['workflow1', 'workflow2'])
         mock_requests.get.assert_called_with('someurl/workflows/?tag=mytag', headers=self.expected_headers)
@@ -121,7 +201,7 @@ class BespinApiTestCase(TestCase):
         mock_requests.get.return_value = mock_response
 
         api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
-        items = api.workflow_versions_list()
+        items = list(api.workflow_versions_list())
 
         self.assertEqual(items, ['workflowversion1', 'workflowversion2'])
         mock_requests.get.assert_called_with('someurl/workflow-versions/', headers=self.expected_headers)
@@ -133,7 +213,7 @@ class BespinApiTestCase(TestCase):
         mock_requests.get.return_value = mock_response
 
         api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
-        items = api.workflow_versions_list(workflow_tag='exomeseq')
+        items = list(api.workflow_versions_list(workflow_tag='exomeseq'))
 
         self.assertEqual(items, ['workflowversion1', 'workflowversion2'])
         mock_requests.get.assert_called_with('someurl/workflow-versions/?workflow__tag=exomeseq',
@@ -207,6 +287,18 @@ class BespinApiTestCase(TestCase):
         mock_requests.post.assert_called_with('someurl/admin/workflow-versions/', headers=self.expected_headers,
                                               json=expected_post_payload)
 
+    @patch('bespin.api.requests')
+    def test_workflow_version_tool_details_list(self, mock_requests):
+        mock_response = Mock(status_code=200)
+        mock_response.json.return_value = [{'id': 1, 'workflow_version': 3}]
+        mock_requests.get.return_value = mock_response
+
+        api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
+        items = list(api.workflow_version_tool_details_list())
+
+        self.assertEqual(items, [{'id': 1, 'workflow_version': 3}])
+        mock_requests.get.assert_called_with('someurl/workflow-version-tool-details/', headers=self.expected_headers)
+
     @patch('bespin.api.requests')
     def test_workflow_version_tool_details_post(self, mock_requests):
         mock_response = Mock(status_code=201)
@@ -272,6 +364,23 @@ class BespinApiTestCase(TestCase):
         mock_requests.post.assert_called_with('someurl/jobs/123/authorize/',
                                               headers=self.expected_headers, json={'token': 'secret'})
 
+    @patch('bespin.api.requests')
+    def test_job_get(self, mock_requests):
+        mock_response = Mock(status_code=200, content=b'{}')
+        mock_response.json.return_value = {'id': 123}
+        mock_requests.get.return_value = mock_response
+
+        api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
+        self.assertEqual(api.job_get(job_id=123), {'id': 123})
+        mock_requests.get.assert_called_with('someurl/jobs/123/', headers=self.expected_headers)
+
+    def test_job_get_not_found(self):
+        api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
+        with patch.object(api, '_get_request') as mock_get_request:
+            mock_get_request.side_effect = NotFoundException('not found')
+            with self.assertRaises(JobDoesNotExistException):
+                api.job_get(job_id=123)
+
     @patch('bespin.api.requests')
     def test_start_job(self, mock_requests):
         mock_response = Mock(status_code=200)
@@ -328,7 +437,7 @@ class BespinApiTestCase(TestCase):
         mock_requests.get.return_value = mock_response
 
         api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
-        items = api.dds_user_credentials_list()
+        items = list(api.dds_user_credentials_list())
 
         self.assertEqual(items, ['agentcred1'])
         mock_requests.get.assert_called_with('someurl/dds-user-credentials/', headers=self.expected_headers)
@@ -340,7 +449,7 @@ class BespinApiTestCase(TestCase):
         mock_requests.get.return_value = mock_response
 
         api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
-        items = api.workflow_configurations_list()
+        items = list(api.workflow_configurations_list())
         mock_requests.get.assert_called_with('someurl/workflow-configurations/', headers=self.expected_headers)
         self.assertEqual(items, ['workflowconfig1'])
 
@@ -351,7 +460,7 @@ class BespinApiTestCase(TestCase):
         mock_requests.get.return_value = mock_response
 
         api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
-        items = api.workflow_configurations_list(tag="sometag", workflow=1, workflow_tag="wftag")
+        items = list(api.workflow_configurations_list(tag="sometag", workflow=1, workflow_tag="wftag"))
         mock_requests.get.assert_called_with('someurl/workflow-configurations/?'
                                              'tag=sometag&'
                                              'workflow=1&'
@@ -431,7 +540,7 @@ class BespinApiTestCase(TestCase):
         mock_requests.get.return_value = mock_response
 
         api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
-        response = api.share_groups_list(name='somename')
+        response = list(api.share_groups_list(name='somename'))
 
         self.assertEqual(response, ['sharegroup1'])
         mock_requests.get.assert_called_with('someurl/share-groups/?name=somename', headers=self.expected_headers)
@@ -467,7 +576,7 @@ class BespinApiTestCase(TestCase):
         mock_requests.get.return_value = mock_response
 
         api = BespinApi(config=self.mock_config, user_agent_str=self.mock_user_agent_str)
-        response = api.job_strategies_list(name='somename')
+        response = list(api.job_strategies_list(name='somename'))
 
         self.assertEqual(response, ['jobstrategy1'])
         mock_requests.get.assert_called_with('someurl/job-strategies/?name=somename', headers=self.expected_headers)
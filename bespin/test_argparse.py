@@ -1,7 +1,10 @@
 from __future__ import absolute_import
 from unittest import TestCase
 from bespin.argparser import ArgParser
+from bespin.tracing import Tracer
 from mock import patch, Mock, ANY, mock_open
+import io
+import json
 import sys
 
 
@@ -10,17 +13,112 @@ class ArgParserTestCase(TestCase):
         self.target_object = Mock()
         self.arg_parser = ArgParser(version_str='1.0', target_object=self.target_object)
 
+    @patch('bespin.argparser.STATS')
+    def test_stats(self, mock_stats):
+        mock_stats.enabled = False
+        self.arg_parser.parse_and_run_commands(["job", "list"])
+        mock_stats.enable.assert_not_called()
+
+        mock_stats.enable.side_effect = lambda: setattr(mock_stats, 'enabled', True)
+        self.arg_parser.parse_and_run_commands(["--stats", "job", "list"])
+        mock_stats.enable.assert_called_with()
+        mock_stats.write_table.assert_called_with(sys.stderr)
+        self.target_object.jobs_list.assert_called_with(state=None, since=None, workflow_tag=None, limit=None,
+                                                        output_format='table')
+
+    @patch('bespin.argparser.STATS')
+    def test_stats_file_written_when_command_fails(self, mock_stats):
+        mock_stats.enable.side_effect = lambda: setattr(mock_stats, 'enabled', True)
+        self.target_object.jobs_list.side_effect = ValueError("Failed")
+        with patch("bespin.argparser.open", mock_open(), create=True) as mock_file:
+            with self.assertRaises(ValueError):
+                self.arg_parser.parse_and_run_commands(["--stats-file", "stats.json", "job", "list"])
+        mock_file.assert_called_with('stats.json', 'w')
+        mock_stats.write_json.assert_called_with(mock_file.return_value)
+        mock_stats.write_table.assert_not_called()
+
+    @patch('bespin.argparser.TRACER')
+    def test_trace(self, mock_tracer):
+        with patch("bespin.argparser.open", mock_open(), create=True) as mock_file:
+            self.arg_parser.parse_and_run_commands(["--trace", "trace.json", "job", "list"])
+        mock_tracer.enable.assert_called_with()
+        mock_tracer.span.assert_called_with('command', {'command': 'job list'})
+        mock_file.assert_called_with('trace.json', 'w')
+        mock_tracer.write_chrome_trace.assert_called_with(mock_file.return_value)
+
+    def test_trace_leaves_out_token(self):
+        tracer = Tracer()
+        outfile = io.StringIO()
+        outfile.close = Mock()
+        with patch('bespin.argparser.TRACER', tracer), patch("bespin.argparser.open", create=True) as mock_open_file:
+            mock_open_file.return_value.__enter__.return_value = outfile
+            self.arg_parser.parse_and_run_commands(["--trace", "trace.json", "job", "run", "job1.yml",
+                                                    "--token", "SECRET123"])
+        self.target_object.job_run.assert_called_with(job_template_paths=['job1.yml'], token='SECRET123',
+                                                      max_workers=ANY)
+        trace = outfile.getvalue()
+        self.assertNotIn('SECRET123', trace)
+        command_spans = [event for event in json.loads(trace)['traceEvents'] if event['name'] == 'command']
+        self.assertEqual(command_spans[0]['args']['command'], 'job run')
+
+    @patch('bespin.argparser.replay_http')
+    @patch('bespin.argparser.record_http')
+    def test_http_cassette(self, mock_record_http, mock_replay_http):
+        self.arg_parser.parse_and_run_commands(["--record-http", "cassette.json", "job", "list"])
+        mock_record_http.assert_called_with('cassette.json')
+        mock_replay_http.assert_not_called()
+
+        self.arg_parser.parse_and_run_commands(["--replay-http", "cassette.json", "job", "list"])
+        mock_replay_http.assert_called_with('cassette.json', realtime=True)
+        self.arg_parser.parse_and_run_commands(["--replay-http", "cassette.json", "--replay-full-speed",
+                                                "job", "list"])
+        mock_replay_http.assert_called_with('cassette.json', realtime=False)
+        self.assertEqual(self.target_object.jobs_list.call_count, 3)
+
+    @patch('bespin.argparser.run_with_profile')
+    def test_profile(self, mock_run_with_profile):
+        self.arg_parser.parse_and_run_commands(["--profile", "job", "list"])
+        mock_run_with_profile.assert_called_with(ANY, 'bespin.pstats', 25, sys.stderr)
+        self.target_object.jobs_list.assert_not_called()
+        run_func = mock_run_with_profile.call_args[0][0]
+        run_func()
+        self.target_object.jobs_list.assert_called_with(state=None, since=None, workflow_tag=None, limit=None,
+                                                        output_format='table')
+
+        self.arg_parser.parse_and_run_commands(["--profile=list.pstats", "--profile-top", "5", "job", "list"])
+        mock_run_with_profile.assert_called_with(ANY, 'list.pstats', 5, sys.stderr)
+
+    @patch('bespin.argparser.run_with_tracemalloc')
+    def test_profile_memory(self, mock_run_with_tracemalloc):
+        self.arg_parser.parse_and_run_commands(["--profile-memory", "job", "list"])
+        mock_run_with_tracemalloc.assert_called_with(ANY, 25, sys.stderr)
+
+    @patch('bespin.argparser.run_with_tracemalloc')
+    @patch('bespin.argparser.run_with_profile')
+    def test_profile_and_profile_memory_are_exclusive(self, mock_run_with_profile, mock_run_with_tracemalloc):
+        with patch('sys.stderr', new_callable=io.StringIO) as mock_stderr:
+            with self.assertRaises(SystemExit):
+                self.arg_parser.parse_and_run_commands(["--profile", "--profile-memory", "job", "list"])
+        self.assertIn('not allowed with argument', mock_stderr.getvalue())
+        mock_run_with_profile.assert_not_called()
+        mock_run_with_tracemalloc.assert_not_called()
+        self.target_object.jobs_list.assert_not_called()
+
+    def test_expand_bare_profile_option_only_before_command(self):
+        self.assertEqual(self.arg_parser._expand_bare_profile_option(["--profile", "job", "list", "--profile"]),
+                         ["--profile=bespin.pstats", "job", "list", "--profile"])
+
     def test_workflows_list_current_versions(self):
         self.arg_parser.parse_and_run_commands(["workflow", "list"])
-        self.target_object.workflows_list.assert_called_with(all_versions=False, short_format=False, tag=None)
+        self.target_object.workflows_list.assert_called_with(all_versions=False, short_format=False, tag=None, output_format='table')
 
     def test_workflow_list_all_versions(self):
         self.arg_parser.parse_and_run_commands(["workflow", "list", "--all"])
-        self.target_object.workflows_list.assert_called_with(all_versions=True, short_format=False, tag=None)
+        self.target_object.workflows_list.assert_called_with(all_versions=True, short_format=False, tag=None, output_format='table')
 
     def test_workflow_list_short(self):
         self.arg_parser.parse_and_run_commands(["workflow", "list", "--short"])
-        self.target_object.workflows_list.assert_called_with(all_versions=False, short_format=True, tag=None)
+        self.target_object.workflows_list.assert_called_with(all_versions=False, short_format=True, tag=None, output_format='table')
 
     def test_workflows_create(self):
         self.arg_parser.parse_and_run_commands(["workflow", "create", "--name", "MyWF", "--tag", "sometag"])
@@ -28,11 +126,11 @@ class ArgParserTestCase(TestCase):
 
     def test_workflow_versions_list(self):
         self.arg_parser.parse_and_run_commands(["workflow-version", "list"])
-        self.target_object.workflow_versions_list.assert_called_with(workflow_tag=None)
+        self.target_object.workflow_versions_list.assert_called_with(workflow_tag=None, output_format='table')
 
     def test_workflow_versions_list_with_filter(self):
         self.arg_parser.parse_and_run_commands(["workflow-version", "list", "--workflow", "sometag"])
-        self.target_object.workflow_versions_list.assert_called_with(workflow_tag="sometag")
+        self.target_object.workflow_versions_list.assert_called_with(workflow_tag="sometag", output_format='table')
 
     def test_workflow_versions_create_only_required(self):
         self.arg_parser.parse_and_run_commands(["workflow-version", "create",
@@ -95,7 +193,8 @@ class ArgParserTestCase(TestCase):
             workflow_type="packed",
             workflow_path="#main",
             expected_tag=None,
-            expected_version=None
+            expected_version=None,
+            strict=False
         )
 
     def test_workflow_versions_validate_with_explicit_version_and_tag(self):
@@ -110,7 +209,8 @@ class ArgParserTestCase(TestCase):
             workflow_type="packed",
             workflow_path="#main",
             expected_tag='expected-tag',
-            expected_version='vE.X.P'
+            expected_version='vE.X.P',
+            strict=False
         )
 
     def test_workflow_versions_validate_direct_without_path(self):
@@ -122,7 +222,23 @@ class ArgParserTestCase(TestCase):
             workflow_type="direct",
             workflow_path=None,
             expected_tag=None,
-            expected_version=None
+            expected_version=None,
+            strict=False
+        )
+
+    def test_workflow_versions_validate_strict(self):
+        self.arg_parser.parse_and_run_commands(['workflow-version', 'validate',
+                                                '--url', 'someurl',
+                                                '--type', 'packed',
+                                                '--path', '#main',
+                                                '--strict'])
+        self.target_object.workflow_version_validate.assert_called_with(
+            url="someurl",
+            workflow_type="packed",
+            workflow_path="#main",
+            expected_tag=None,
+            expected_version=None,
+            strict=True
         )
 
     def test_workflow_version_tool_details_create_without_override(self):
@@ -135,7 +251,8 @@ class ArgParserTestCase(TestCase):
             workflow_type='zipped',
             workflow_path='extracted/file.cwl',
             override_tag=None,
-            override_version=None
+            override_version=None,
+            strict=False
         )
 
     def test_workflow_version_tool_details_create_with_override(self):
@@ -150,7 +267,36 @@ class ArgParserTestCase(TestCase):
             workflow_type='zipped',
             workflow_path='extracted/file.cwl',
             override_tag='tag',
-            override_version='v3'
+            override_version='v3',
+            strict=False
+        )
+
+    def test_workflow_version_tool_details_diff(self):
+        self.arg_parser.parse_and_run_commands(['tool-details', 'diff', 'exomeseq', 'v1.0.0', 'v1.1.0',
+                                                '--format', 'json'])
+        self.target_object.workflow_version_tool_details_diff.assert_called_with(
+            workflow_tag='exomeseq',
+            old_version='v1.0.0',
+            new_version='v1.1.0',
+            strict=False,
+            output_format='json'
+        )
+
+    def test_workflow_version_tool_details_backfill(self):
+        self.arg_parser.parse_and_run_commands(['tool-details', 'backfill'])
+        self.target_object.workflow_version_tool_details_backfill.assert_called_with(
+            workflow_tag=None,
+            max_processes=4,
+            max_posts=4,
+            strict=False
+        )
+        self.arg_parser.parse_and_run_commands(['tool-details', 'backfill', '--workflow', 'exomeseq',
+                                                '--processes', '2', '--max-workers', '8', '--strict'])
+        self.target_object.workflow_version_tool_details_backfill.assert_called_with(
+            workflow_tag='exomeseq',
+            max_processes=2,
+            max_posts=8,
+            strict=True
         )
 
     def test_workflow_version_tool_details_preview(self):
@@ -162,15 +308,29 @@ class ArgParserTestCase(TestCase):
             url='preview-url',
             workflow_type='zipped',
             workflow_path='extracted/file.cwl',
+            strict=False
+        )
+
+    def test_workflow_version_tool_details_preview_strict(self):
+        self.arg_parser.parse_and_run_commands(['tool-details', 'preview',
+                                                '--url', 'preview-url',
+                                                '--type', 'zipped',
+                                                '--path', 'extracted/file.cwl',
+                                                '--strict'])
+        self.target_object.workflow_version_tool_details_preview.assert_called_with(
+            url='preview-url',
+            workflow_type='zipped',
+            workflow_path='extracted/file.cwl',
+            strict=True
         )
 
     def test_workflow_config_list(self):
         self.arg_parser.parse_and_run_commands(["workflow-config", "list"])
-        self.target_object.workflow_configs_list.assert_called_with(workflow_tag=None)
+        self.target_object.workflow_configs_list.assert_called_with(workflow_tag=None, output_format='table')
 
     def test_workflow_config_list_with_filter(self):
         self.arg_parser.parse_and_run_commands(["workflow-config", "list", "--workflow", "sometag"])
-        self.target_object.workflow_configs_list.assert_called_with(workflow_tag="sometag")
+        self.target_object.workflow_configs_list.assert_called_with(workflow_tag="sometag", output_format='table')
 
     def test_workflow_config_config_show_job_order(self):
         self.arg_parser.parse_and_run_commands(["workflow-config", "show-job-order",
@@ -197,11 +357,11 @@ class ArgParserTestCase(TestCase):
 
     def test_share_group_list(self):
         self.arg_parser.parse_and_run_commands(["share-group", "list"])
-        self.target_object.share_groups_list.assert_called_with()
+        self.target_object.share_groups_list.assert_called_with(output_format='table')
 
     def test_job_config_list(self):
         self.arg_parser.parse_and_run_commands(["job-config", "list"])
-        self.target_object.job_configs_list.assert_called_with()
+        self.target_object.job_configs_list.assert_called_with(output_format='table')
 
     def test_job_template_create(self):
         self.arg_parser.parse_and_run_commands(["job-template", "create", "sometag/v1/human"])
@@ -209,28 +369,69 @@ class ArgParserTestCase(TestCase):
 
     def test_job_list(self):
         self.arg_parser.parse_and_run_commands(["job", "list"])
-        self.target_object.jobs_list.assert_called_with()
+        self.target_object.jobs_list.assert_called_with(state=None, since=None, workflow_tag=None, limit=None,
+                                                        output_format='table')
+
+    def test_list_output_formats(self):
+        for output_format in ['json', 'ndjson', 'csv']:
+            self.arg_parser.parse_and_run_commands(["share-group", "list", "--format", output_format])
+            self.target_object.share_groups_list.assert_called_with(output_format=output_format)
+            self.arg_parser.parse_and_run_commands(["job", "list", "--format", output_format])
+            self.target_object.jobs_list.assert_called_with(state=None, since=None, workflow_tag=None, limit=None,
+                                                            output_format=output_format)
+
+    def test_job_list_with_filters(self):
+        self.arg_parser.parse_and_run_commands(["job", "list", "--state", "R", "--since", "2019-01-01",
+                                                "--workflow-tag", "exomeseq", "--limit", "20"])
+        self.target_object.jobs_list.assert_called_with(state='R', since='2019-01-01', workflow_tag='exomeseq',
+                                                        limit=20, output_format='table')
 
     def test_job_create(self):
-        with patch("builtins.open", mock_open(read_data="data")) as mock_file:
-            self.arg_parser.parse_and_run_commands(["job", "create", "job_template.yaml"])
-        self.target_object.job_create.assert_called_with(job_template_infile=mock_file.return_value)
+        self.arg_parser.parse_and_run_commands(["job", "create", "job_template.yaml"])
+        self.target_object.job_create.assert_called_with(job_template_paths=["job_template.yaml"], max_workers=4)
+
+    def test_job_create_many(self):
+        self.arg_parser.parse_and_run_commands(["job", "create", "job1.yaml", "samples/*.yaml", "--max-workers", "8"])
+        self.target_object.job_create.assert_called_with(job_template_paths=["job1.yaml", "samples/*.yaml"],
+                                                         max_workers=8)
+
+    def test_job_create_from_stdin(self):
+        self.arg_parser.parse_and_run_commands(["job", "create", "-"])
+        self.target_object.job_create.assert_called_with(job_template_paths=["-"], max_workers=4)
 
     def test_job_run(self):
-        with patch("builtins.open", mock_open(read_data="data")) as mock_file:
-            self.arg_parser.parse_and_run_commands(["job", "run", "job_template.yaml"])
-        self.target_object.job_run.assert_called_with(job_template_infile=mock_file.return_value, token=None)
+        self.arg_parser.parse_and_run_commands(["job", "run", "job_template.yaml"])
+        self.target_object.job_run.assert_called_with(job_template_paths=["job_template.yaml"], token=None,
+                                                      max_workers=4)
 
     def test_job_run_with_token(self):
+        self.arg_parser.parse_and_run_commands(["job", "run", "job_template.yaml", "--token", "secret"])
+        self.target_object.job_run.assert_called_with(job_template_paths=["job_template.yaml"], token="secret",
+                                                      max_workers=4)
+
+    def test_job_cohort(self):
         with patch("builtins.open", mock_open(read_data="data")) as mock_file:
-            self.arg_parser.parse_and_run_commands(["job", "run", "job_template.yaml", "--token", "secret"])
-        self.target_object.job_run.assert_called_with(job_template_infile=mock_file.return_value, token="secret")
+            self.arg_parser.parse_and_run_commands(["job", "cohort", "base.yml", "samples.csv", "--run",
+                                                    "--max-workers", "8"])
+        self.target_object.job_cohort.assert_called_with(base_job_template_infile=mock_file.return_value,
+                                                         sample_sheet_infile=mock_file.return_value,
+                                                         create=False, run=True, token=None, max_workers=8)
+
+    def test_job_cohort_create_and_run_are_exclusive(self):
+        with patch("builtins.open", mock_open(read_data="data")):
+            with self.assertRaises(SystemExit):
+                self.arg_parser.parse_and_run_commands(["job", "cohort", "base.yml", "samples.csv", "--create",
+                                                        "--run"])
 
     def test_job_validate(self):
         with patch("builtins.open", mock_open(read_data="data")) as mock_file:
             self.arg_parser.parse_and_run_commands(["job", "validate", "job_template.yaml"])
         self.target_object.job_validate.assert_called_with(job_template_infile=mock_file.return_value)
 
+    def test_job_watch(self):
+        self.arg_parser.parse_and_run_commands(["job", "watch", "12", "13", "--interval", "2"])
+        self.target_object.jobs_watch.assert_called_with(job_ids=[12, 13], min_interval=2, max_interval=60)
+
     def test_start_job(self):
         self.arg_parser.parse_and_run_commands(["job", "start", "123"])
         self.target_object.start_job.assert_called_with(job_id=123, token=None)
@@ -0,0 +1,78 @@
+from unittest import TestCase
+from unittest.mock import Mock
+from bespin.api import BespinApi
+from bespin.backfill import ToolDetailsBackfill, extract_tool_details
+from bespin.fakeserver import FakeBespinServer, FakeBespinData
+from bespin.test_cwlmetadata import WORKFLOW_CWL, SUBWORKFLOW_CWL, ALIGN_CWL, ECHO_CWL
+from bespin.tool_details import ToolDetailsCache
+import os
+import shutil
+import tempfile
+
+
+class ToolDetailsBackfillTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = os.path.realpath(tempfile.mkdtemp())
+        self.cache = ToolDetailsCache(os.path.join(self.temp_dir, 'cache.json'))
+        self.data = FakeBespinData(num_jobs=0, num_workflows=1, num_versions=0)
+        self.data.create_workflow_version(1, 1, **self.direct_workflow_fields('v1', ALIGN_CWL))
+        self.data.create_workflow_version(1, 2, **self.direct_workflow_fields(
+            'v2', ALIGN_CWL.replace('org/aligner:1.2', 'org/aligner:1.3')))
+        self.data.create_workflow_version(1, 3, type='direct', workflow_path=None,
+                                          url='file://{}/missing/workflow.cwl'.format(self.temp_dir))
+        self.data.create_workflow_version(1, 4, **self.direct_workflow_fields('v4', ALIGN_CWL))
+        self.data.create('workflow-version-tool-details', {'workflow_version': 4, 'details': []})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def direct_workflow_fields(self, version, align_cwl):
+        workflow_dir = os.path.join(self.temp_dir, version)
+        os.makedirs(os.path.join(workflow_dir, 'tools'))
+        for path, content in [('workflow.cwl', WORKFLOW_CWL), ('subworkflow.cwl', SUBWORKFLOW_CWL),
+                              ('tools/align.cwl', align_cwl), ('tools/echo.cwl', ECHO_CWL)]:
+            with open(os.path.join(workflow_dir, path), 'w') as outfile:
+                outfile.write(content)
+        return {'type': 'direct', 'workflow_path': None,
+                'url': 'file://{}'.format(os.path.join(workflow_dir, 'workflow.cwl'))}
+
+    def test_find_workflow_versions_skips_versions_with_tool_details(self):
+        with FakeBespinServer(self.data) as server:
+            backfill = ToolDetailsBackfill(BespinApi(server.create_config(), user_agent_str='test'))
+            workflow_versions, skipped = backfill.find_workflow_versions()
+        self.assertEqual([workflow_version['id'] for workflow_version in workflow_versions], [1, 2, 3])
+        self.assertEqual(skipped, 1)
+
+    def test_run(self):
+        on_result = Mock()
+        with FakeBespinServer(self.data) as server:
+            backfill = ToolDetailsBackfill(BespinApi(server.create_config(), user_agent_str='test'), self.cache,
+                                           max_processes=2, max_posts=2)
+            workflow_versions, skipped = backfill.find_workflow_versions()
+            results = backfill.run(workflow_versions, on_result=on_result)
+
+        self.assertEqual([result.label for result in results], ['workflow1/v1', 'workflow1/v2', 'workflow1/v3'])
+        self.assertEqual([result.succeeded for result in results], [True, True, False])
+        self.assertEqual([result.num_tools for result in results], [2, 2, None])
+        self.assertIn('Unable to read CWL document', str(results[2].error))
+        self.assertEqual(sorted(call_args[0][0].label for call_args in on_result.call_args_list),
+                         ['workflow1/v1', 'workflow1/v2', 'workflow1/v3'])
+
+        tool_details = dict((record['workflow_version'], record['details'])
+                            for record in self.data.list('workflow-version-tool-details'))
+        self.assertEqual(sorted(tool_details.keys()), [1, 2, 4])
+        self.assertEqual(tool_details[1][0]['docker_images'], ['org/aligner:1.2'])
+        self.assertEqual(tool_details[2][0]['docker_images'], ['org/aligner:1.3'])
+        # both align.cwl versions and the shared echo.cwl
+        self.assertEqual(len(ToolDetailsCache(self.cache.filename)._load()), 3)
+
+    def test_extract_tool_details_returns_added_cache_records(self):
+        workflow_version = self.data.get('workflow-versions', 1)
+        contents, added_records = extract_tool_details(workflow_version, False, self.cache.filename)
+        self.assertEqual([detail['tool_name'] for detail in contents], ['tools/align.cwl', 'tools/echo.cwl'])
+        self.assertEqual(len(added_records), 2)
+        self.cache.add_records(added_records)
+        self.cache.save()
+        contents_from_cache, added_records = extract_tool_details(workflow_version, False, self.cache.filename)
+        self.assertEqual(contents_from_cache, contents)
+        self.assertEqual(added_records, {})
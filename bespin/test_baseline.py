@@ -0,0 +1,97 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from bespin.baseline import BaselineStore, create_baseline, load_baseline_file, compare_results, \
+    confidence_interval, get_machine_fingerprint, get_t_critical_value, BASELINE_FORMAT_VERSION, \
+    STATUS_REGRESSION, STATUS_IMPROVEMENT, STATUS_NO_CHANGE, STATUS_NEW
+from bespin.exceptions import UserInputException
+import json
+import os
+import shutil
+import tempfile
+
+
+def make_result(name, seconds, requests=None):
+    return {'name': name, 'seconds': seconds, 'requests': requests}
+
+
+class ConfidenceIntervalTestCase(TestCase):
+    def test_t_critical_value(self):
+        self.assertEqual(get_t_critical_value(2.7), 4.303)
+        self.assertEqual(get_t_critical_value(0.5), 12.706)
+        self.assertEqual(get_t_critical_value(100), 1.960)
+
+    def test_confidence_interval(self):
+        low, high = confidence_interval([1.0, 1.1, 0.9], [2.0, 2.1, 1.9])
+        self.assertAlmostEqual((low + high) / 2, 1.0)
+        # equal variances of 0.01 with 3 runs each: standard error 0.0816 and 4 degrees of freedom
+        self.assertAlmostEqual(high - low, 2 * 2.776 * (0.02 / 3) ** 0.5)
+        self.assertEqual(confidence_interval([1.0, 1.0], [2.0, 2.0]), (1.0, 1.0))
+        self.assertIsNone(confidence_interval([1.0], [2.0, 2.1]))
+
+
+class CompareResultsTestCase(TestCase):
+    def setUp(self):
+        self.baseline = create_baseline([
+            make_result('stable', [1.0, 1.02, 0.98], requests=10),
+            make_result('noisy', [1.0, 2.0, 0.5]),
+            make_result('single', [1.0]),
+        ], 'abc123', {'system': 'Linux'})
+
+    def test_compare_results(self):
+        comparisons = compare_results(self.baseline, [
+            make_result('stable', [1.5, 1.52, 1.48], requests=12),
+            make_result('noisy', [1.5, 2.5, 1.0]),
+            make_result('single', [0.5]),
+            make_result('added', [1.0]),
+        ], threshold_percent=10.0)
+        self.assertEqual([comparison['status'] for comparison in comparisons],
+                         [STATUS_REGRESSION, STATUS_NO_CHANGE, STATUS_IMPROVEMENT, STATUS_NEW])
+        stable = comparisons[0]
+        self.assertEqual(stable['baseline_mean_seconds'], 1.0)
+        self.assertEqual(stable['mean_seconds'], 1.5)
+        self.assertEqual(stable['change_percent'], 50.0)
+        self.assertLess(stable['ci_low_percent'], 50.0)
+        self.assertGreater(stable['ci_low_percent'], 0.0)
+        self.assertEqual((stable['baseline_requests'], stable['requests']), (10, 12))
+        self.assertIsNone(comparisons[2]['ci_low_percent'])
+
+    def test_significant_change_below_threshold(self):
+        comparisons = compare_results(self.baseline, [make_result('stable', [1.05, 1.07, 1.03])],
+                                      threshold_percent=10.0)
+        self.assertEqual(comparisons[0]['status'], STATUS_NO_CHANGE)
+        comparisons = compare_results(self.baseline, [make_result('stable', [1.05, 1.07, 1.03])],
+                                      threshold_percent=2.0)
+        self.assertEqual(comparisons[0]['status'], STATUS_REGRESSION)
+
+
+class BaselineStoreTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = BaselineStore(self.temp_dir)
+        self.machine_info = {'system': 'Linux', 'cpu_count': 4}
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_save_and_load(self):
+        baseline = create_baseline([make_result('stable', [1.0])], 'abc123', self.machine_info)
+        fingerprint = get_machine_fingerprint(self.machine_info)
+        self.assertEqual(baseline['fingerprint'], fingerprint)
+        self.assertEqual(baseline['format_version'], BASELINE_FORMAT_VERSION)
+
+        filename = self.store.save(baseline)
+
+        self.assertEqual(filename, os.path.join(self.temp_dir, fingerprint, 'abc123.json'))
+        self.assertEqual(self.store.load(fingerprint, 'abc123'), baseline)
+        with self.assertRaises(UserInputException):
+            self.store.load(fingerprint, 'def456')
+        with self.assertRaises(UserInputException):
+            self.store.load(get_machine_fingerprint({'system': 'Darwin'}), 'abc123')
+
+    def test_load_baseline_file_checks_format_version(self):
+        filename = os.path.join(self.temp_dir, 'old.json')
+        with open(filename, 'w') as outfile:
+            json.dump({'format_version': 0, 'results': []}, outfile)
+        with self.assertRaises(UserInputException) as raised_exception:
+            load_baseline_file(filename)
+        self.assertIn('format version 0', str(raised_exception.exception))
@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from bespin.batch import JobBatch, InMemoryJobTemplate, JobTemplateFile, expand_job_template_paths
+from bespin.exceptions import UserInputException
+from mock import patch, call, Mock
+import io
+import os
+import shutil
+import tempfile
+
+
+class ExpandJobTemplatePathsTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        for name in ['sample_2.yml', 'sample_1.yml', 'other.txt']:
+            with open(os.path.join(self.temp_dir, name), 'w') as outfile:
+                outfile.write('')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_expands_globs_in_order(self):
+        paths = expand_job_template_paths(['job.yml', os.path.join(self.temp_dir, 'sample_*.yml')])
+        self.assertEqual(paths, [
+            'job.yml',
+            os.path.join(self.temp_dir, 'sample_1.yml'),
+            os.path.join(self.temp_dir, 'sample_2.yml'),
+        ])
+
+    def test_raises_when_glob_matches_nothing(self):
+        with self.assertRaises(UserInputException):
+            expand_job_template_paths([os.path.join(self.temp_dir, '*.json')])
+
+
+class JobTemplateFileTestCase(TestCase):
+    def test_load_missing_file(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        path = os.path.join(temp_dir, 'missing.yml')
+        with self.assertRaises(UserInputException) as raised_exception:
+            JobTemplateFile(path).load()
+        self.assertEqual(str(raised_exception.exception),
+                         "Unable to read job template file {}: No such file or directory".format(path))
+
+    @patch('bespin.batch.JobTemplateLoader')
+    def test_load_reads_stdin_for_dash(self, mock_job_template_loader):
+        stdin = io.StringIO("name: job1")
+        with patch('bespin.batch.sys.stdin', stdin):
+            job_template = JobTemplateFile('-').load()
+        mock_job_template_loader.assert_called_with(stdin)
+        self.assertEqual(job_template, mock_job_template_loader.return_value.create_job_template.return_value)
+
+
+@patch('bespin.batch.open', create=True)
+@patch('bespin.batch.JobTemplateLoader')
+class JobBatchTestCase(TestCase):
+    def test_run_creates_jobs_with_shared_context(self, mock_job_template_loader, mock_open):
+        mock_job_template = mock_job_template_loader.return_value.create_job_template.return_value
+        mock_job_template.create_job.side_effect = [{'job': 1}, {'job': 2}]
+        mock_api = Mock()
+        mock_context = Mock()
+        on_result = Mock()
+
+        job_batch = JobBatch(mock_api, ['job1.yml', 'job2.yml'], max_workers=1, context=mock_context)
+        results = job_batch.run(on_result=on_result)
+
+        self.assertEqual([(result.label, result.job_id, result.succeeded) for result in results], [
+            ('job1.yml', 1, True),
+            ('job2.yml', 2, True),
+        ])
+        mock_open.assert_has_calls([call('job1.yml'), call('job2.yml')], any_order=True)
+        mock_job_template.create_job.assert_has_calls([call(mock_api, mock_context), call(mock_api, mock_context)])
+        on_result.assert_has_calls([call(results[0]), call(results[1])])
+        mock_api.start_job.assert_not_called()
+        self.assertIsNotNone(job_batch.elapsed_seconds)
+
+    def test_run_starts_jobs(self, mock_job_template_loader, mock_open):
+        mock_job_template = mock_job_template_loader.return_value.create_job_template.return_value
+        mock_job_template.create_job.return_value = {'job': 5}
+        mock_api = Mock()
+
+        results = JobBatch(mock_api, ['job1.yml'], context=Mock()).run(start_jobs=True, token='secret')
+
+        self.assertTrue(results[0].authorized)
+        self.assertTrue(results[0].started)
+        mock_api.authorize_job.assert_called_with(5, 'secret')
+        mock_api.start_job.assert_called_with(5)
+
+    def test_run_records_failures_and_continues(self, mock_job_template_loader, mock_open):
+        mock_job_template = mock_job_template_loader.return_value.create_job_template.return_value
+        error = ValueError("Bad data")
+        mock_job_template.create_job.side_effect = [error, {'job': 2}]
+
+        results = JobBatch(Mock(), ['job1.yml', 'job2.yml'], max_workers=1, context=Mock()).run()
+
+        self.assertFalse(results[0].succeeded)
+        self.assertEqual(results[0].error, error)
+        self.assertTrue(results[1].succeeded)
+        self.assertEqual(results[1].job_id, 2)
+
+    def test_run_in_memory_job_templates(self, mock_job_template_loader, mock_open):
+        mock_job_template = Mock()
+        mock_job_template.create_job.return_value = {'job': 7}
+        mock_api = Mock()
+        mock_context = Mock()
+
+        results = JobBatch(mock_api, [InMemoryJobTemplate('row 1: S1', mock_job_template)], context=mock_context).run()
+
+        self.assertEqual([(result.label, result.job_id) for result in results], [('row 1: S1', 7)])
+        mock_job_template.create_job.assert_called_with(mock_api, mock_context)
+        mock_open.assert_not_called()
@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from bespin.benchmark import Benchmark, BenchmarkRunner, CreateJobBenchmark, JobsListBenchmark, \
+    ToolDetailsBuilderBenchmark, FakeWorkflow, create_job_order, select_benchmarks, get_default_benchmarks, main, \
+    REGRESSION_EXIT_STATUS
+from bespin.exceptions import UserInputException
+from bespin.jobtemplate import FormattedJobOrder
+from bespin.tool_details import ToolDetailsBuilder
+from mock import patch, Mock
+import json
+import os
+import shutil
+import tempfile
+import time
+
+
+class CountingBenchmark(Benchmark):
+    name = 'counting'
+
+    def __init__(self):
+        self.calls = []
+
+    def setup(self):
+        self.calls.append('setup')
+
+    def run(self):
+        self.calls.append('run')
+
+    def teardown(self):
+        self.calls.append('teardown')
+
+    def get_request_count(self):
+        return 7
+
+
+class BenchmarkRunnerTestCase(TestCase):
+    def test_run_benchmark(self):
+        benchmark = CountingBenchmark()
+        result = BenchmarkRunner(repeat=3).run_benchmark(benchmark)
+        self.assertEqual(benchmark.calls, ['setup', 'run', 'run', 'run', 'run', 'teardown'])
+        self.assertEqual(result['name'], 'counting')
+        self.assertEqual(result['repeat'], 3)
+        self.assertEqual(len(result['seconds']), 3)
+        self.assertLessEqual(result['min_seconds'], result['max_seconds'])
+        self.assertEqual(result['requests'], 7)
+        self.assertIsNotNone(result['peak_kib'])
+
+    def test_run_benchmark_without_memory(self):
+        benchmark = CountingBenchmark()
+        result = BenchmarkRunner(repeat=1, measure_memory=False).run_benchmark(benchmark)
+        self.assertEqual(benchmark.calls, ['setup', 'run', 'teardown'])
+        self.assertIsNone(result['peak_kib'])
+
+    def test_teardown_after_failure(self):
+        benchmark = CountingBenchmark()
+        benchmark.run = Mock(side_effect=ValueError("Failed"))
+        with self.assertRaises(ValueError):
+            BenchmarkRunner(repeat=1).run_benchmark(benchmark)
+        self.assertEqual(benchmark.calls, ['setup', 'teardown'])
+
+
+class BenchmarksTestCase(TestCase):
+    def test_create_job_order(self):
+        self.assertEqual(len(FormattedJobOrder(create_job_order(10)).dds_file_paths), 10)
+
+    def test_create_job_request_count(self):
+        result = BenchmarkRunner(repeat=1, measure_memory=False).run_benchmark(CreateJobBenchmark(4))
+        # credential, configuration, stage group, 4 input files and the job plus 4 DukeDS lookups and 1 permission
+        self.assertEqual(result['requests'], 13)
+
+    def test_jobs_list_request_count(self):
+        result = BenchmarkRunner(repeat=1, measure_memory=False).run_benchmark(JobsListBenchmark(250))
+        # 3 pages of jobs plus one lookup per workflow version
+        self.assertEqual(result['requests'], 53)
+
+    def test_fake_workflow(self):
+        builder = ToolDetailsBuilder('file:///tmp/workflow/')
+        builder.accept(FakeWorkflow(num_nodes=10, num_tools=3))
+        self.assertEqual([detail['tool_name'] for detail in builder.build()],
+                         ['tools/tool0.cwl', 'tools/tool1.cwl', 'tools/tool2.cwl'])
+
+    def test_select_benchmarks(self):
+        benchmarks = get_default_benchmarks()
+        self.assertEqual(select_benchmarks(benchmarks, []), benchmarks)
+        self.assertEqual([benchmark.name for benchmark in select_benchmarks(benchmarks, ['create job', 'cold'])],
+                         ['create job 10 files', 'create job 100 files', 'create job 1000 files', 'cli cold start'])
+
+
+class MainTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @patch('bespin.benchmark.get_default_benchmarks')
+    @patch('bespin.benchmark.sys')
+    def test_main_writes_json(self, mock_sys, mock_get_default_benchmarks):
+        mock_get_default_benchmarks.return_value = [ToolDetailsBuilderBenchmark(num_nodes=10, num_tools=2),
+                                                    CountingBenchmark()]
+        json_filename = os.path.join(self.temp_dir, 'results.json')
+
+        status = main(['--repeat', '2', '--filter', 'tool', '--json', json_filename])
+
+        self.assertEqual(status, 0)
+        with open(json_filename) as infile:
+            baseline = json.load(infile)
+        self.assertEqual([result['name'] for result in baseline['results']], ['tool details 10 nodes'])
+        self.assertEqual(len(baseline['results'][0]['seconds']), 2)
+        mock_sys.stderr.write.assert_called_with('Running tool details 10 nodes\n')
+
+    @patch('bespin.benchmark.get_git_revision')
+    @patch('bespin.benchmark.get_default_benchmarks')
+    @patch('bespin.benchmark.sys')
+    def test_main_save_and_compare_baseline(self, mock_sys, mock_get_default_benchmarks, mock_get_git_revision):
+        benchmark = CountingBenchmark()
+        mock_get_default_benchmarks.return_value = [benchmark]
+        mock_get_git_revision.return_value = 'abc123'
+        baseline_dir = os.path.join(self.temp_dir, 'baselines')
+
+        self.assertEqual(main(['--save-baseline', '--baseline-dir', baseline_dir, '--no-memory']), 0)
+        self.assertEqual(main(['--compare', 'abc123', '--baseline-dir', baseline_dir, '--no-memory']), 0)
+
+        def slow_run():
+            time.sleep(0.02)
+        benchmark.run = slow_run
+        self.assertEqual(main(['--compare', 'abc123', '--baseline-dir', baseline_dir, '--no-memory']),
+                         REGRESSION_EXIT_STATUS)
+
+    @patch('bespin.benchmark.get_default_benchmarks')
+    def test_main_compare_missing_baseline(self, mock_get_default_benchmarks):
+        with self.assertRaises(UserInputException):
+            main(['--compare', 'abc123', '--baseline-dir', self.temp_dir])
+        mock_get_default_benchmarks.assert_not_called()
@@ -0,0 +1,122 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from bespin.cassette import Cassette, HTTPReplayer, record_http, replay_http, scrub_data, scrub_headers, \
+    scrub_request_body, encode_response_body, decode_response_body, CassetteMismatchException, SCRUBBED_VALUE, \
+    BODY_ENCODING_BASE64
+from bespin.fakeserver import FakeBespinServer, FakeBespinData
+from bespin.api import BespinApi
+from bespin.exceptions import UserInputException
+import json
+import os
+import shutil
+import tempfile
+import time
+
+
+class ScrubTestCase(TestCase):
+    def test_scrub_data(self):
+        data = {'token': 'secret1', 'agent_key': 'secret2', 'items': [{'api_token': 'secret3', 'id': 1}], 'name': 'x'}
+        self.assertEqual(scrub_data(data), {'token': SCRUBBED_VALUE, 'agent_key': SCRUBBED_VALUE,
+                                            'items': [{'api_token': SCRUBBED_VALUE, 'id': 1}], 'name': 'x'})
+
+    def test_scrub_headers(self):
+        self.assertEqual(scrub_headers({'Authorization': 'Token secret', 'Content-Type': 'application/json'}),
+                         {'Authorization': SCRUBBED_VALUE, 'Content-Type': 'application/json'})
+
+    def test_scrub_request_body(self):
+        self.assertIsNone(scrub_request_body(None))
+        self.assertEqual(scrub_request_body(b'{"user_key": "secret", "b": 1, "a": 2}'),
+                         '{"a": 2, "b": 1, "user_key": "SCRUBBED"}')
+        self.assertEqual(scrub_request_body('name=value'), 'name=value')
+
+    def test_response_body_encoding(self):
+        self.assertEqual(encode_response_body(b'{"token": "secret"}'), ('text', '{"token": "SCRUBBED"}'))
+        body_encoding, body = encode_response_body(b'PK\x03\x04\xff')
+        self.assertEqual(body_encoding, BODY_ENCODING_BASE64)
+        self.assertEqual(decode_response_body(body_encoding, body), b'PK\x03\x04\xff')
+
+
+class RecordReplayTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cassette_filename = os.path.join(self.temp_dir, 'cassette.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def record(self, func, **server_kwargs):
+        with FakeBespinServer(FakeBespinData(num_jobs=15), page_size=10, **server_kwargs) as server:
+            config = server.create_config()
+            with record_http(self.cassette_filename):
+                result = func(BespinApi(config, user_agent_str='test'))
+        return config, result
+
+    def test_record_and_replay(self):
+        def list_and_authorize(api):
+            job_ids = [job['id'] for job in api.jobs_list()]
+            api.authorize_job(3, 'secret-job-token')
+            return job_ids
+
+        config, recorded_job_ids = self.record(list_and_authorize)
+        with open(self.cassette_filename) as infile:
+            cassette_text = infile.read()
+        self.assertNotIn(config.token, cassette_text)
+        self.assertNotIn('secret-job-token', cassette_text)
+        self.assertEqual([interaction['status'] for interaction in json.loads(cassette_text)['interactions']],
+                         [200, 200, 200])
+
+        # the server is gone so these are answered from the cassette
+        api = BespinApi(config, user_agent_str='test')
+        with replay_http(self.cassette_filename, realtime=False) as replayer:
+            self.assertEqual([job['id'] for job in api.jobs_list()], recorded_job_ids)
+            self.assertEqual(api.authorize_job(3, 'secret-job-token')['state'], 'A')
+            self.assertEqual(replayer.unused_interaction_count, 0)
+            with self.assertRaises(CassetteMismatchException):
+                api.workflow_get(1)
+
+    def test_replay_repeats_last_matching_response(self):
+        config, _ = self.record(lambda api: api.workflow_get(1))
+        api = BespinApi(config, user_agent_str='test')
+        with replay_http(self.cassette_filename, realtime=False):
+            self.assertEqual(api.workflow_get(1)['tag'], 'workflow1')
+            self.assertEqual(api.workflow_get(1)['tag'], 'workflow1')
+
+    def test_replay_at_recorded_timing(self):
+        config, _ = self.record(lambda api: api.workflow_get(1), latency=0.05)
+        api = BespinApi(config, user_agent_str='test')
+        with replay_http(self.cassette_filename, realtime=True):
+            start = time.time()
+            api.workflow_get(1)
+            self.assertGreaterEqual(time.time() - start, 0.05)
+
+    def test_cassette_saved_when_command_fails(self):
+        with self.assertRaises(ValueError):
+            with record_http(self.cassette_filename):
+                raise ValueError("Failed")
+        self.assertEqual(Cassette.load(self.cassette_filename).interactions, [])
+
+    def test_load_checks_format_version(self):
+        with open(self.cassette_filename, 'w') as outfile:
+            json.dump({'format_version': 0, 'interactions': []}, outfile)
+        with self.assertRaises(UserInputException):
+            Cassette.load(self.cassette_filename)
+
+    def test_replayer_matches_concurrent_requests_by_body(self):
+        cassette = Cassette([
+            {'method': 'POST', 'url': 'http://x/files/', 'request_body': '{"sequence": 1}', 'status': 201,
+             'reason': 'Created', 'headers': {}, 'body_encoding': 'text', 'body': '{"id": 1}', 'started': 0,
+             'elapsed': 0},
+            {'method': 'POST', 'url': 'http://x/files/', 'request_body': '{"sequence": 2}', 'status': 201,
+             'reason': 'Created', 'headers': {}, 'body_encoding': 'text', 'body': '{"id": 2}', 'started': 0,
+             'elapsed': 0},
+        ])
+        replayer = HTTPReplayer(cassette, realtime=False)
+
+        class Request(object):
+            def __init__(self, body):
+                self.method = 'POST'
+                self.url = 'http://x/files/'
+                self.body = body
+
+        self.assertEqual(replayer.send(None, None, Request(b'{"sequence": 2}')).json(), {'id': 2})
+        self.assertEqual(replayer.send(None, None, Request(b'{"sequence": 1}')).json(), {'id': 1})
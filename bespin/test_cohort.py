@@ -0,0 +1,102 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from bespin.cohort import CohortBuilder, read_sample_sheet, get_sample_sheet_delimiter
+from bespin.exceptions import UserInputException
+import io
+
+
+class NamedStringIO(io.StringIO):
+    def __init__(self, text, name):
+        super(NamedStringIO, self).__init__(text)
+        self.name = name
+
+
+class ReadSampleSheetTestCase(TestCase):
+    def test_get_sample_sheet_delimiter(self):
+        self.assertEqual(get_sample_sheet_delimiter('samples.TSV', ''), '\t')
+        self.assertEqual(get_sample_sheet_delimiter('samples.csv', 'a\tb\n'), ',')
+        self.assertEqual(get_sample_sheet_delimiter('samples', 'a\tb\n1\t2\n'), '\t')
+        self.assertEqual(get_sample_sheet_delimiter('samples', 'a,b\n1,2\n'), ',')
+
+    def test_read_sample_sheet_csv(self):
+        infile = NamedStringIO('sample,read1\nS1,dds://mouse/s1.fastq\n\nS2,dds://mouse/s2.fastq\n', 'samples.csv')
+        self.assertEqual(read_sample_sheet(infile), [
+            {'sample': 'S1', 'read1': 'dds://mouse/s1.fastq'},
+            {'sample': 'S2', 'read1': 'dds://mouse/s2.fastq'},
+        ])
+
+    def test_read_sample_sheet_tsv_keeps_values_as_strings(self):
+        infile = NamedStringIO('sample\tlane\nS1\t007\n', 'samples.tsv')
+        self.assertEqual(read_sample_sheet(infile), [{'sample': 'S1', 'lane': '007'}])
+
+    def test_read_sample_sheet_rejects_short_rows(self):
+        infile = NamedStringIO('sample,read1,lane\nS1,dds://mouse/s1.fastq,1\nS2\nS3,dds://mouse/s3.fastq\n',
+                               'samples.csv')
+        with self.assertRaises(UserInputException) as raised_exception:
+            read_sample_sheet(infile)
+        self.assertEqual(str(raised_exception.exception).split('\n'), [
+            "Sample sheet samples.csv line 3: missing value for column read1, lane.",
+            "Sample sheet samples.csv line 4: missing value for column lane.",
+        ])
+
+    def test_read_sample_sheet_rejects_long_rows(self):
+        infile = NamedStringIO('sample,lane\nS1,1\nS2,2,dds://mouse/s2.fastq\nS3,3,,\n', 'samples.csv')
+        with self.assertRaises(UserInputException) as raised_exception:
+            read_sample_sheet(infile)
+        self.assertEqual(str(raised_exception.exception),
+                         "Sample sheet samples.csv line 3: 3 values but the header has 2 columns.")
+
+    def test_read_sample_sheet_ignores_empty_trailing_cells(self):
+        infile = NamedStringIO('sample,lane\nS1,1,,\n,,,\n', 'samples.csv')
+        self.assertEqual(read_sample_sheet(infile), [{'sample': 'S1', 'lane': '1'}])
+
+    def test_read_sample_sheet_without_samples(self):
+        with self.assertRaises(UserInputException):
+            read_sample_sheet(NamedStringIO('sample,read1\n', 'samples.csv'))
+
+
+class CohortBuilderTestCase(TestCase):
+    def setUp(self):
+        self.base_data = {
+            'tag': 'exome/v1/human',
+            'name': 'Exome ${sample}',
+            'fund_code': '001',
+            'job_order': {
+                'sample_name': '${sample}',
+                'threads': 4,
+                'reads': [{'class': 'File', 'path': 'dds://mouse/${sample}_R1.fastq'}],
+                'cost': '$$5',
+            },
+        }
+
+    def test_create_job_templates(self):
+        rows = [{'sample': 'S1'}, {'sample': 'S2'}]
+        job_templates = CohortBuilder(self.base_data, rows).create_job_templates()
+
+        self.assertEqual([label for label, job_template in job_templates], ['row 1: Exome S1', 'row 2: Exome S2'])
+        label, job_template = job_templates[1]
+        self.assertEqual(job_template.tag, 'exome/v1/human')
+        self.assertEqual(job_template.name, 'Exome S2')
+        self.assertEqual(job_template.job_order, {
+            'sample_name': 'S2',
+            'threads': 4,
+            'reads': [{'class': 'File', 'path': 'dds://mouse/S2_R1.fastq'}],
+            'cost': '$5',
+        })
+        self.assertEqual(job_template.get_dds_file_paths(), ['dds://mouse/S2_R1.fastq'])
+        self.assertEqual(self.base_data['name'], 'Exome ${sample}', "Base job template is not modified.")
+
+    def test_create_job_templates_reports_all_bad_rows(self):
+        rows = [{'other': 'S1'}, {'sample': 'S2'}, {'other': 'S3'}]
+        with self.assertRaises(UserInputException) as raised_exception:
+            CohortBuilder(self.base_data, rows).create_job_templates()
+        lines = str(raised_exception.exception).split('\n')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith("Sample sheet row 1: missing sample sheet column 'sample'"))
+        self.assertTrue(lines[1].startswith("Sample sheet row 3:"))
+
+    def test_create_job_templates_invalid_placeholder(self):
+        self.base_data['fund_code'] = '$5'
+        with self.assertRaises(UserInputException) as raised_exception:
+            CohortBuilder(self.base_data, [{'sample': 'S1'}]).create_job_templates()
+        self.assertEqual(str(raised_exception.exception), "Sample sheet row 1: invalid placeholder in '$5'")
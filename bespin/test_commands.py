@@ -1,9 +1,13 @@
 from __future__ import absolute_import
 from unittest import TestCase
-from bespin.commands import Commands, Table, ShortWorkflowDetails, FullWorkflowDetails, JobsList, \
-    WorkflowVersionsList, WorkflowConfigurationsList, ShareGroupsList, JobStrategiesList
-from bespin.exceptions import UserInputException
-from mock import patch, call, Mock
+from bespin.commands import Commands, ShortWorkflowDetails, FullWorkflowDetails, JobsList, \
+    WorkflowVersionsList, WorkflowConfigurationsList, ShareGroupsList, JobStrategiesList, JobWatcher
+from bespin.exceptions import UserInputException, JobBatchException, ToolDetailsBackfillException, \
+    JobDoesNotExistException
+import io
+import sys
+import datetime
+from mock import patch, call, Mock, ANY
 
 
 class CommandsTestCase(TestCase):
@@ -14,7 +18,7 @@ class CommandsTestCase(TestCase):
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
     @patch('bespin.commands.FullWorkflowDetails')
-    @patch('bespin.commands.Table')
+    @patch('bespin.commands.StreamingTable')
     @patch('bespin.commands.print')
     def test_workflows_list_latest_versions(self, mock_print, mock_table, mock_workflow_details, mock_bespin_api,
                                             mock_config_file):
@@ -23,13 +27,13 @@ class CommandsTestCase(TestCase):
         workflow_details = mock_workflow_details.return_value
         mock_table.assert_called_with(workflow_details.column_names,
                                       workflow_details.get_column_data.return_value)
-        mock_print.assert_called_with(mock_table.return_value)
+        mock_table.return_value.write.assert_called_with(sys.stdout)
         mock_workflow_details.assert_called_with(mock_bespin_api.return_value, False, None)
 
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
     @patch('bespin.commands.FullWorkflowDetails')
-    @patch('bespin.commands.Table')
+    @patch('bespin.commands.StreamingTable')
     @patch('bespin.commands.print')
     def test_workflows_list_all_versions(self, mock_print, mock_table, mock_workflow_details, mock_bespin_api,
                                          mock_config_file):
@@ -38,21 +42,44 @@ class CommandsTestCase(TestCase):
         workflow_details = mock_workflow_details.return_value
         mock_table.assert_called_with(workflow_details.column_names,
                                       workflow_details.get_column_data.return_value)
-        mock_print.assert_called_with(mock_table.return_value)
+        mock_table.return_value.write.assert_called_with(sys.stdout)
         mock_workflow_details.assert_called_with(mock_bespin_api.return_value, True, None)
 
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
     @patch('bespin.commands.JobsList')
-    @patch('bespin.commands.Table')
+    @patch('bespin.commands.StreamingTable')
     @patch('bespin.commands.print')
     def test_jobs_list(self, mock_print, mock_table, mock_jobs_list, mock_bespin_api, mock_config_file):
         commands = Commands(self.version_str, self.user_agent_str)
         commands.jobs_list()
-        mock_jobs_list.assert_called_with(mock_bespin_api.return_value)
+        mock_jobs_list.assert_called_with(mock_bespin_api.return_value, state=None, since=None, workflow_tag=None,
+                                          limit=None)
         mock_table.assert_called_with(mock_jobs_list.return_value.column_names,
                                       mock_jobs_list.return_value.get_column_data.return_value)
-        mock_print.assert_called_with(mock_table.return_value)
+        mock_table.return_value.write.assert_called_with(sys.stdout)
+
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    @patch('bespin.commands.JobWatcher')
+    @patch('bespin.commands.print')
+    def test_jobs_watch(self, mock_print, mock_job_watcher, mock_bespin_api, mock_config_file):
+        mock_job_watcher.return_value.watch.side_effect = KeyboardInterrupt()
+        commands = Commands(self.version_str, self.user_agent_str)
+        commands.jobs_watch(job_ids=[1], min_interval=2, max_interval=30)
+        mock_job_watcher.assert_called_with(mock_bespin_api.return_value, [1], min_interval=2, max_interval=30)
+        mock_print.assert_called_with("Stopped watching jobs.")
+
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    def test_share_groups_list_ndjson(self, mock_bespin_api, mock_config_file):
+        mock_bespin_api.return_value.share_groups_list.return_value = [
+            {'id': 1, 'name': "GroupName", "email": "com@com.com"}
+        ]
+        commands = Commands(self.version_str, self.user_agent_str)
+        with patch('bespin.commands.sys.stdout', new_callable=io.StringIO) as mock_stdout:
+            commands.share_groups_list(output_format='ndjson')
+        self.assertEqual(mock_stdout.getvalue(), '{"email": "com@com.com", "id": 1, "name": "GroupName"}\n')
 
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
@@ -69,40 +96,155 @@ class CommandsTestCase(TestCase):
 
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
-    @patch('bespin.commands.JobTemplateLoader')
+    @patch('bespin.batch.JobTemplateLoader')
+    @patch('bespin.batch.open', create=True)
     @patch('bespin.commands.print')
-    def test_job_create(self, mock_print, mock_job_template_loader, mock_bespin_api, mock_config_file):
-        mock_infile = Mock()
+    def test_job_create(self, mock_print, mock_open, mock_job_template_loader, mock_bespin_api, mock_config_file):
         mock_job_template_loader.return_value.create_job_template.return_value.create_job.return_value = {'job': 1}
 
         commands = Commands(self.version_str, self.user_agent_str)
-        commands.job_create(job_template_infile=mock_infile)
+        commands.job_create(job_template_paths=['job.yml'])
 
-        mock_job_template_loader.assert_called_with(mock_infile)
+        mock_open.assert_called_with('job.yml')
+        mock_job_template_loader.assert_called_with(mock_open.return_value.__enter__.return_value)
         mock_print.assert_has_calls([
             call("Created job 1"),
             call("To start this job run `bespin job start 1` .")])
         mock_job_template = mock_job_template_loader.return_value.create_job_template.return_value
-        mock_job_template.create_job.assert_called_with(mock_bespin_api.return_value)
+        mock_job_template.create_job.assert_called_with(mock_bespin_api.return_value, ANY)
 
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
-    @patch('bespin.commands.JobTemplateLoader')
+    @patch('bespin.batch.JobTemplateLoader')
+    @patch('bespin.batch.open', create=True)
     @patch('bespin.commands.print')
-    def test_job_run(self, mock_print, mock_job_template_loader, mock_bespin_api, mock_config_file):
-        mock_infile = Mock()
+    def test_job_create_raises_single_failure(self, mock_print, mock_open, mock_job_template_loader, mock_bespin_api,
+                                              mock_config_file):
+        mock_job_template = mock_job_template_loader.return_value.create_job_template.return_value
+        mock_job_template.create_job.side_effect = UserInputException("Bad data")
+
+        commands = Commands(self.version_str, self.user_agent_str)
+        with self.assertRaises(UserInputException) as raised_exception:
+            commands.job_create(job_template_paths=['job.yml'])
+        self.assertEqual(str(raised_exception.exception), "Bad data")
+
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    @patch('bespin.batch.JobTemplateLoader')
+    @patch('bespin.batch.open', create=True)
+    @patch('bespin.commands.print')
+    def test_job_create_many_prints_summary(self, mock_print, mock_open, mock_job_template_loader, mock_bespin_api,
+                                            mock_config_file):
+        mock_job_template = mock_job_template_loader.return_value.create_job_template.return_value
+        mock_job_template.create_job.side_effect = [{'job': 1}, UserInputException("Bad data")]
+
+        commands = Commands(self.version_str, self.user_agent_str)
+        with patch('bespin.commands.sys.stdout', new_callable=io.StringIO) as mock_stdout:
+            with self.assertRaises(JobBatchException) as raised_exception:
+                commands.job_create(job_template_paths=['job1.yml', 'job2.yml'], max_workers=1)
+        self.assertEqual(str(raised_exception.exception), "Failed to process 1 of 2 job templates.")
+        mock_print.assert_has_calls([
+            call("Created job 1"),
+            call("Failed to process job2.yml: Bad data")])
+        self.assertEqual(mock_stdout.getvalue().split('\n'), [
+            'Job Template      Job  Status',
+            '--------------  -----  --------',
+            'job1.yml            1  created',
+            'job2.yml               failed',
+            '',
+        ])
+        contexts = [args[1] for args, kwargs in mock_job_template.create_job.call_args_list]
+        self.assertIs(contexts[0], contexts[1], "Job templates share lookups.")
+
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    @patch('bespin.commands.print')
+    def test_job_create_missing_file(self, mock_print, mock_bespin_api, mock_config_file):
+        commands = Commands(self.version_str, self.user_agent_str)
+        with self.assertRaises(UserInputException) as raised_exception:
+            commands.job_create(job_template_paths=['/nonexistent/job.yml'])
+        self.assertEqual(str(raised_exception.exception),
+                         "Unable to read job template file /nonexistent/job.yml: No such file or directory")
+
+    @patch('bespin.commands.print')
+    def test_print_job_batch_summary_reports_dds_file_cache(self, mock_print):
+        result = Mock(label='job1.yml', job_id=1, started=False, succeeded=True)
+        with patch('bespin.commands.sys.stdout', new_callable=io.StringIO):
+            Commands._print_job_batch_summary([result], 2.0, Mock(hits=9, misses=3))
+        mock_print.assert_has_calls([
+            call("Processed 1 job templates (0 failed) in 2.0 seconds."),
+            call("Looked up 3 distinct DukeDS files (9 cache hits)."),
+        ])
+
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    @patch('bespin.batch.JobTemplateLoader')
+    @patch('bespin.batch.open', create=True)
+    @patch('bespin.commands.print')
+    def test_job_run(self, mock_print, mock_open, mock_job_template_loader, mock_bespin_api, mock_config_file):
         mock_job_template_loader.return_value.create_job_template.return_value.create_job.return_value = {'job': 1}
 
         commands = Commands(self.version_str, self.user_agent_str)
-        commands.job_run(job_template_infile=mock_infile, token='mytoken')
+        commands.job_run(job_template_paths=['job.yml'], token='mytoken')
 
-        mock_job_template_loader.assert_called_with(mock_infile)
         mock_print.assert_has_calls([
             call("Created job 1"),
             call("Set run token for job 1"),
             call("Started job 1")])
         mock_job_template = mock_job_template_loader.return_value.create_job_template.return_value
-        mock_job_template.create_job.assert_called_with(mock_bespin_api.return_value)
+        mock_job_template.create_job.assert_called_with(mock_bespin_api.return_value, ANY)
+        mock_bespin_api.return_value.authorize_job.assert_called_with(1, 'mytoken')
+        mock_bespin_api.return_value.start_job.assert_called_with(1)
+
+    def cohort_files(self):
+        base_infile = io.StringIO("name: Exome ${sample}\n"
+                                  "tag: exome/v1/human\n"
+                                  "fund_code: '001'\n"
+                                  "job_order:\n"
+                                  "  reads:\n"
+                                  "    class: File\n"
+                                  "    path: dds://mouse/${sample}.fastq\n")
+        sample_sheet_infile = io.StringIO("sample\nS1\nS2\n")
+        sample_sheet_infile.name = 'samples.csv'
+        return base_infile, sample_sheet_infile
+
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    @patch('bespin.commands.print')
+    def test_job_cohort_preview(self, mock_print, mock_bespin_api, mock_config_file):
+        base_infile, sample_sheet_infile = self.cohort_files()
+        commands = Commands(self.version_str, self.user_agent_str)
+        with patch('bespin.commands.sys.stdout', new_callable=io.StringIO) as mock_stdout:
+            commands.job_cohort(base_infile, sample_sheet_infile)
+        self.assertEqual(mock_stdout.getvalue().split('\n'), [
+            'Job Template     Tag             Fund Code      Dds Files',
+            '---------------  --------------  -----------  -----------',
+            'row 1: Exome S1  exome/v1/human  001                    1',
+            'row 2: Exome S2  exome/v1/human  001                    1',
+            '',
+        ])
+        mock_print.assert_called_with("Run with --create or --run to submit these 2 jobs.")
+        mock_bespin_api.assert_not_called()
+
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    @patch('bespin.commands.JobCreationContext')
+    @patch('bespin.commands.JobBatch')
+    @patch('bespin.commands.print')
+    def test_job_cohort_run(self, mock_print, mock_job_batch, mock_job_creation_context, mock_bespin_api,
+                            mock_config_file):
+        mock_job_batch.return_value.run.return_value = [Mock(error=None)]
+        base_infile, sample_sheet_infile = self.cohort_files()
+        commands = Commands(self.version_str, self.user_agent_str)
+        commands.job_cohort(base_infile, sample_sheet_infile, run=True, token='secret', max_workers=3)
+
+        mock_context = mock_job_creation_context.return_value
+        mock_context.prefetch_dds_files.assert_called_with(['dds://mouse/S1.fastq', 'dds://mouse/S2.fastq'], 3)
+        args, kwargs = mock_job_batch.call_args
+        self.assertEqual([job_template.label for job_template in args[1]], ['row 1: Exome S1', 'row 2: Exome S2'])
+        self.assertEqual(args[1][1].job_template.job_order['reads']['path'], 'dds://mouse/S2.fastq')
+        self.assertEqual(kwargs, {'max_workers': 3, 'context': mock_context})
+        mock_job_batch.return_value.run.assert_called_with(start_jobs=True, token='secret', on_result=ANY)
 
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
@@ -116,9 +258,27 @@ class CommandsTestCase(TestCase):
 
         mock_job_template_loader.assert_called_with(mock_infile)
         mock_job_template = mock_job_template_loader.return_value.create_job_template.return_value
-        mock_job_template.validate.assert_called_with(mock_bespin_api.return_value)
+        mock_job_template.validate.assert_called_with(mock_bespin_api.return_value, ANY)
         mock_print.assert_called_with('Job file is valid.')
 
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    @patch('bespin.commands.JobTemplateLoader')
+    @patch('bespin.commands.DDSPathCache')
+    @patch('bespin.commands.print')
+    def test_job_validate_saves_dds_path_cache(self, mock_print, mock_dds_path_cache, mock_job_template_loader,
+                                               mock_bespin_api, mock_config_file):
+        mock_job_template = mock_job_template_loader.return_value.create_job_template.return_value
+        mock_job_template.validate.side_effect = UserInputException("Bad data")
+
+        commands = Commands(self.version_str, self.user_agent_str)
+        with self.assertRaises(UserInputException):
+            commands.job_validate(job_template_infile=Mock())
+
+        args, kwargs = mock_job_template.validate.call_args
+        self.assertEqual(args[1].dds_path_cache, mock_dds_path_cache.return_value)
+        mock_dds_path_cache.return_value.save.assert_called_with()
+
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
     @patch('bespin.commands.JobTemplateLoader')
@@ -217,7 +377,7 @@ class CommandsTestCase(TestCase):
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
     @patch('bespin.commands.WorkflowVersionsList')
-    @patch('bespin.commands.Table')
+    @patch('bespin.commands.StreamingTable')
     @patch('bespin.commands.print')
     def test_workflow_versions_list(self, mock_print, mock_table, mock_workflow_versions_list, mock_bespin_api,
                                     mock_config_file):
@@ -226,7 +386,7 @@ class CommandsTestCase(TestCase):
         mock_workflow_versions_list.assert_called_with(mock_bespin_api.return_value, 'sometag')
         mock_table.assert_called_with(mock_workflow_versions_list.return_value.column_names,
                                       mock_workflow_versions_list.return_value.get_column_data.return_value)
-        mock_print.assert_called_with(mock_table.return_value)
+        mock_table.return_value.write.assert_called_with(sys.stdout)
 
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
@@ -253,7 +413,8 @@ class CommandsTestCase(TestCase):
         mock_cwl_workflow_version.return_value.validate_workflow.return_value = Mock(tag='workflow-tag',version='v1.2.3')
         commands.workflow_version_validate(url='someurl', workflow_type='zipped', workflow_path='extracted/workflow.cwl',
                                            expected_tag='workflow-tag', expected_version='v1.2.3')
-        mock_cwl_workflow_version.assert_called_with('someurl','zipped','extracted/workflow.cwl', validate=True)
+        mock_cwl_workflow_version.assert_called_with('someurl','zipped','extracted/workflow.cwl', validate=True,
+                                                     strict=False)
         mock_print.assert_has_calls([
             call("Validated someurl as 'workflow-tag/v1.2.3'")
         ])
@@ -276,22 +437,46 @@ class CommandsTestCase(TestCase):
     @patch('bespin.commands.json')
     @patch('bespin.commands.CWLWorkflowVersion')
     @patch('bespin.commands.ToolDetails')
-    def test_workflow_version_tool_details_preview(self, mock_tool_details, mock_cwl_workflow_version, mock_json, mock_print):
+    @patch('bespin.commands.ToolDetailsCache')
+    def test_workflow_version_tool_details_preview(self, mock_tool_details_cache, mock_tool_details,
+                                                   mock_cwl_workflow_version, mock_json, mock_print):
         commands = Commands(self.version_str, self.user_agent_str)
         mock_cwl_workflow_version.return_value.validate_workflow.return_value = Mock(tag='workflow-tag',version='v1.2.3')
         commands.workflow_version_tool_details_preview(url='someurl', workflow_type='zipped', workflow_path='extracted/workflow.cwl')
         mock_cwl_workflow_version.assert_called_with('someurl','zipped','extracted/workflow.cwl',
-                                                     override_tag=None, override_version=None, validate=False)
-        mock_tool_details.assert_called_with(mock_cwl_workflow_version.return_value)
+                                                     override_tag=None, override_version=None, validate=False,
+                                                     strict=False)
+        mock_tool_details.assert_called_with(mock_cwl_workflow_version.return_value,
+                                             mock_tool_details_cache.return_value)
+        mock_tool_details_cache.return_value.save.assert_called_with()
         mock_json.dumps.assert_called_with(mock_tool_details.return_value.contents, indent=2)
         mock_print.assert_called_with(mock_json.dumps.return_value)
 
+    @patch('bespin.commands.print')
+    @patch('bespin.commands.json')
+    @patch('bespin.commands.CWLWorkflowVersion')
+    @patch('bespin.commands.ToolDetails')
+    @patch('bespin.commands.ToolDetailsCache')
+    def test_workflow_version_tool_details_preview_strict(self, mock_tool_details_cache, mock_tool_details,
+                                                          mock_cwl_workflow_version, mock_json, mock_print):
+        commands = Commands(self.version_str, self.user_agent_str)
+        commands.workflow_version_tool_details_preview(url='someurl', workflow_type='zipped',
+                                                       workflow_path='extracted/workflow.cwl', strict=True)
+        mock_cwl_workflow_version.assert_called_with('someurl','zipped','extracted/workflow.cwl',
+                                                     override_tag=None, override_version=None, validate=False,
+                                                     strict=True)
+        mock_tool_details.assert_called_with(mock_cwl_workflow_version.return_value, None)
+        self.assertFalse(mock_tool_details_cache.called)
+
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
     @patch('bespin.commands.print')
     @patch('bespin.commands.CWLWorkflowVersion')
     @patch('bespin.commands.ToolDetails')
-    def test_workflow_version_tool_details_create(self, mock_tool_details, mock_cwl_workflow_version, mock_print, mock_bespin_api, mock_config_file):
+    @patch('bespin.commands.ToolDetailsCache')
+    def test_workflow_version_tool_details_create(self, mock_tool_details_cache, mock_tool_details,
+                                                  mock_cwl_workflow_version, mock_print, mock_bespin_api,
+                                                  mock_config_file):
         commands = Commands(self.version_str, self.user_agent_str)
         mock_create = mock_tool_details.return_value.create
         mock_create.return_value = {'id': '5'}
@@ -299,14 +484,104 @@ class CommandsTestCase(TestCase):
                                                       workflow_path='extracted/workflow.cwl', override_tag='tagg',
                                                       override_version='v1')
         mock_cwl_workflow_version.assert_called_with('someurl','zipped','extracted/workflow.cwl',
-                                                     override_tag='tagg', override_version='v1', validate=False)
+                                                     override_tag='tagg', override_version='v1', validate=False,
+                                                     strict=False)
+        mock_tool_details.assert_called_with(mock_cwl_workflow_version.return_value,
+                                             mock_tool_details_cache.return_value)
         mock_create.assert_called_with(mock_bespin_api.return_value)
         mock_print.assert_called_with("Created workflow version tool details 5.")
 
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    @patch('bespin.commands.CWLWorkflowVersion')
+    @patch('bespin.commands.ToolDetails')
+    @patch('bespin.commands.ToolDetailsCache')
+    @patch('bespin.commands.ToolDetailsDiff')
+    @patch('bespin.commands.StreamingTable')
+    def test_workflow_version_tool_details_diff(self, mock_table, mock_tool_details_diff, mock_tool_details_cache,
+                                                mock_tool_details, mock_cwl_workflow_version, mock_bespin_api,
+                                                mock_config_file):
+        mock_bespin_api.return_value.workflow_version_find_by_tag_version.side_effect = [
+            {'url': 'url1', 'type': 'zipped', 'workflow_path': 'exomeseq/workflow.cwl'},
+            {'url': 'url2', 'type': 'packed', 'workflow_path': '#main'},
+        ]
+        mock_tool_details.side_effect = [Mock(contents=['old']), Mock(contents=['new'])]
+        commands = Commands(self.version_str, self.user_agent_str)
+        commands.workflow_version_tool_details_diff('exomeseq', 'v1', 'v2')
+        mock_bespin_api.return_value.workflow_version_find_by_tag_version.assert_has_calls([
+            call('exomeseq', 'v1'), call('exomeseq', 'v2')])
+        mock_cwl_workflow_version.assert_has_calls([
+            call('url1', 'zipped', 'exomeseq/workflow.cwl', validate=False, strict=False),
+            call('url2', 'packed', '#main', validate=False, strict=False),
+        ])
+        mock_tool_details_cache.return_value.save.assert_called_with()
+        mock_tool_details_diff.assert_called_with(['old'], ['new'])
+        mock_table.assert_called_with(mock_tool_details_diff.return_value.column_names,
+                                      mock_tool_details_diff.return_value.get_column_data.return_value)
+
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    @patch('bespin.commands.ToolDetailsCache')
+    @patch('bespin.commands.ToolDetailsBackfill')
+    @patch('bespin.commands.print')
+    def test_workflow_version_tool_details_backfill(self, mock_print, mock_backfill, mock_tool_details_cache,
+                                                    mock_bespin_api, mock_config_file):
+        results = [Mock(error=None, succeeded=True, label='exomeseq/v1', tool_details_id=7, num_tools=3),
+                   Mock(error=None, succeeded=True, label='exomeseq/v2', tool_details_id=8, num_tools=4)]
+
+        def run(workflow_versions, on_result):
+            for result in results:
+                on_result(result)
+            return results
+        mock_backfill.return_value.find_workflow_versions.return_value = (['v1', 'v2'], 1)
+        mock_backfill.return_value.run.side_effect = run
+        mock_backfill.return_value.elapsed_seconds = 2.5
+        commands = Commands(self.version_str, self.user_agent_str)
+        commands.workflow_version_tool_details_backfill(workflow_tag='exomeseq', max_processes=2, max_posts=3)
+        mock_backfill.assert_called_with(mock_bespin_api.return_value, mock_tool_details_cache.return_value,
+                                         max_processes=2, max_posts=3, strict=False)
+        mock_backfill.return_value.find_workflow_versions.assert_called_with('exomeseq')
+        mock_tool_details_cache.return_value.save.assert_called_with()
+        mock_print.assert_has_calls([
+            call("Found 2 workflow versions without tool details (1 already have them)."),
+            call("[1/2] Created tool details 7 for exomeseq/v1 (3 tools)"),
+            call("[2/2] Created tool details 8 for exomeseq/v2 (4 tools)"),
+            call(""),
+            call("Created tool details for 2 workflow versions (0 failed, 1 skipped) in 2.5 seconds."),
+        ])
+
+    @patch('bespin.commands.ConfigFile')
+    @patch('bespin.commands.BespinApi')
+    @patch('bespin.commands.ToolDetailsCache')
+    @patch('bespin.commands.ToolDetailsBackfill')
+    @patch('bespin.commands.print')
+    def test_workflow_version_tool_details_backfill_failures(self, mock_print, mock_backfill, mock_tool_details_cache,
+                                                             mock_bespin_api, mock_config_file):
+        results = [Mock(error=ValueError('bad url'), succeeded=False, label='exomeseq/v1')]
+
+        def run(workflow_versions, on_result):
+            for result in results:
+                on_result(result)
+            return results
+        mock_backfill.return_value.find_workflow_versions.return_value = (['v1'], 0)
+        mock_backfill.return_value.run.side_effect = run
+        mock_backfill.return_value.elapsed_seconds = 1.0
+        commands = Commands(self.version_str, self.user_agent_str)
+        with self.assertRaises(ToolDetailsBackfillException) as raised_exception:
+            commands.workflow_version_tool_details_backfill()
+        self.assertEqual(str(raised_exception.exception),
+                         "Failed to create tool details for 1 of 1 workflow versions.")
+        mock_print.assert_has_calls([
+            call("[1/1] Failed to create tool details for exomeseq/v1: bad url"),
+            call(""),
+            call("Created tool details for 0 workflow versions (1 failed, 0 skipped) in 1.0 seconds."),
+        ])
+        mock_tool_details_cache.return_value.save.assert_called_with()
+
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
     @patch('bespin.commands.WorkflowConfigurationsList')
-    @patch('bespin.commands.Table')
+    @patch('bespin.commands.StreamingTable')
     @patch('bespin.commands.print')
     def test_workflow_configs_list(self, mock_print, mock_table, mock_workflow_configs_list, mock_bespin_api,
                                     mock_config_file):
@@ -315,7 +590,7 @@ class CommandsTestCase(TestCase):
         mock_workflow_configs_list.assert_called_with(mock_bespin_api.return_value, 'sometag')
         mock_table.assert_called_with(mock_workflow_configs_list.return_value.column_names,
                                       mock_workflow_configs_list.return_value.get_column_data.return_value)
-        mock_print.assert_called_with(mock_table.return_value)
+        mock_table.return_value.write.assert_called_with(sys.stdout)
 
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
@@ -360,7 +635,7 @@ class CommandsTestCase(TestCase):
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
     @patch('bespin.commands.ShareGroupsList')
-    @patch('bespin.commands.Table')
+    @patch('bespin.commands.StreamingTable')
     @patch('bespin.commands.print')
     def test_share_groups_list(self, mock_print, mock_table, mock_share_groups_list, mock_bespin_api, mock_config_file):
         commands = Commands(self.version_str, self.user_agent_str)
@@ -368,12 +643,12 @@ class CommandsTestCase(TestCase):
         mock_share_groups_list.assert_called_with(mock_bespin_api.return_value)
         mock_table.assert_called_with(mock_share_groups_list.return_value.column_names,
                                       mock_share_groups_list.return_value.get_column_data.return_value)
-        mock_print.assert_called_with(mock_table.return_value)
+        mock_table.return_value.write.assert_called_with(sys.stdout)
 
     @patch('bespin.commands.ConfigFile')
     @patch('bespin.commands.BespinApi')
     @patch('bespin.commands.JobStrategiesList')
-    @patch('bespin.commands.Table')
+    @patch('bespin.commands.StreamingTable')
     @patch('bespin.commands.print')
     def test_job_configs_list(self, mock_print, mock_table, mock_job_strategies_list, mock_bespin_api, mock_config_file):
         commands = Commands(self.version_str, self.user_agent_str)
@@ -381,18 +656,7 @@ class CommandsTestCase(TestCase):
         mock_job_strategies_list.assert_called_with(mock_bespin_api.return_value)
         mock_table.assert_called_with(mock_job_strategies_list.return_value.column_names,
                                       mock_job_strategies_list.return_value.get_column_data.return_value)
-        mock_print.assert_called_with(mock_table.return_value)
-
-
-class TableTestCase(TestCase):
-    @patch('bespin.commands.tabulate')
-    def test_str(self, mock_tabulate):
-        table = Table(column_names=['col_1', 'col_2'], items=[
-            {'col_1': 'A', 'col_2': 'B'},
-            {'col_1': 'C', 'col_2': 'D'},
-        ])
-        self.assertEqual(table.__str__(), mock_tabulate.return_value)
-        mock_tabulate.assert_called_with([['A', 'B'], ['C', 'D']], headers=['Col 1', 'Col 2'])
+        mock_table.return_value.write.assert_called_with(sys.stdout)
 
 
 class FullWorkflowDetailsTestCase(TestCase):
@@ -414,7 +678,7 @@ class FullWorkflowDetailsTestCase(TestCase):
                           'tag': 'exome',
                           'name': 'exome',
                           'versions': [1, 2]}]
-        column_data = details.get_column_data()
+        column_data = list(details.get_column_data())
         self.assertEqual(len(column_data), 1)
         self.assertEqual(column_data, expected_data)
         mock_api.workflow_configurations_list.assert_called_with(workflow_tag='exome')
@@ -441,7 +705,7 @@ class FullWorkflowDetailsTestCase(TestCase):
                 'versions': [1, 2]
             },
         ]
-        column_data = details.get_column_data()
+        column_data = list(details.get_column_data())
         self.assertEqual(len(column_data), 2)
         self.assertEqual(column_data, expected_data)
         mock_api.workflow_configurations_list.assert_has_calls([
@@ -455,7 +719,7 @@ class FullWorkflowDetailsTestCase(TestCase):
             {'id': 1, 'name': 'no-versions', 'versions': []},
         ]
         details = FullWorkflowDetails(mock_api, all_versions=False, tag=None)
-        column_data = details.get_column_data()
+        column_data = list(details.get_column_data())
         self.assertEqual(len(column_data), 0)
         mock_api.questionnaires_list.assert_not_called()
 
@@ -465,7 +729,7 @@ class FullWorkflowDetailsTestCase(TestCase):
             {'id': 1, 'name': 'no-versions', 'versions': []},
         ]
         details = FullWorkflowDetails(mock_api, all_versions=True, tag=None)
-        column_data = details.get_column_data()
+        column_data = list(details.get_column_data())
         self.assertEqual(len(column_data), 0)
         mock_api.questionnaires_list.assert_not_called()
 
@@ -501,7 +765,7 @@ class JobsListTestCase(TestCase):
         jobs_list.get_elapsed_hours = Mock()
         jobs_list.get_elapsed_hours.return_value = 1.2
 
-        column_data = jobs_list.get_column_data()
+        column_data = list(jobs_list.get_column_data())
         self.assertEqual(len(column_data), 1)
         self.assertEqual(column_data[0]['id'], 123)
         self.assertEqual(column_data[0]['workflow_version_tag'], 'sometag/v1')
@@ -510,6 +774,112 @@ class JobsListTestCase(TestCase):
         jobs_list.get_elapsed_hours.assert_called_with(mock_api.jobs_list.return_value[0]['usage'])
 
 
+    def test_get_column_data_passes_filters_and_limits_enrichment(self):
+        mock_api = Mock()
+        mock_api.jobs_list.return_value = iter([
+            {'id': 1, 'workflow_version': 456},
+            {'id': 2, 'workflow_version': 456},
+            {'id': 3, 'workflow_version': 456},
+        ])
+        jobs_list = JobsList(api=mock_api, state='R', since='2019-01-01', workflow_tag='exome', limit=2)
+        jobs_list.get_workflow_version_tag = Mock()
+        jobs_list.get_workflow_version_tag.return_value = 'exome/v1'
+
+        column_data = list(jobs_list.get_column_data())
+
+        self.assertEqual([job['id'] for job in column_data], [1, 2])
+        self.assertEqual(jobs_list.get_workflow_version_tag.call_count, 2)
+        mock_api.jobs_list.assert_called_with(state='R', since='2019-01-01', workflow_tag='exome', limit=2)
+
+
+    def test_get_workflow_version_tag_is_cached(self):
+        mock_api = Mock()
+        mock_api.workflow_version_get.return_value = {'tag': 'sometag/v1'}
+        jobs_list = JobsList(api=mock_api)
+        self.assertEqual(jobs_list.get_workflow_version_tag(123), 'sometag/v1')
+        self.assertEqual(jobs_list.get_workflow_version_tag(123), 'sometag/v1')
+        self.assertEqual(mock_api.workflow_version_get.call_count, 1)
+
+
+class JobWatcherTestCase(TestCase):
+    @staticmethod
+    def make_job(job_id, state, step, last_updated):
+        return {'id': job_id, 'name': 'job{}'.format(job_id), 'state': state, 'step': step,
+                'last_updated': last_updated, 'workflow_version': 4}
+
+    def setUp(self):
+        self.mock_api = Mock()
+        self.mock_api.workflow_version_get.return_value = {'tag': 'exome/v1'}
+
+    def test_poll_all_jobs_starts_from_now(self):
+        self.mock_api.jobs_list.side_effect = [
+            [self.make_job(1, 'R', 'S', '2019-01-01T00:00:01Z'), self.make_job(2, 'N', '', '2019-01-01T00:00:00Z')],
+            [self.make_job(1, 'R', 'S', '2019-01-01T00:00:01Z')],
+            [self.make_job(1, 'R', 'R', '2019-01-01T00:00:05Z')],
+        ]
+        watcher = JobWatcher(self.mock_api, utcnow_func=Mock(return_value=datetime.datetime(2019, 1, 1)))
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.poll(), [
+            "2019-01-01T00:00:01Z Job 1 'job1' (exome/v1) state: R step: S",
+            "2019-01-01T00:00:00Z Job 2 'job2' (exome/v1) state: N step: ",
+        ])
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.poll(), [
+            "2019-01-01T00:00:05Z Job 1 'job1' (exome/v1) state: R -> R step: S -> R",
+        ])
+        self.mock_api.jobs_list.assert_has_calls([
+            call(since='2019-01-01T00:00:00.000000Z'),
+            call(since='2019-01-01T00:00:01Z'),
+            call(since='2019-01-01T00:00:01Z'),
+        ])
+        self.mock_api.job_get.assert_not_called()
+        self.assertEqual(self.mock_api.workflow_version_get.call_count, 1)
+
+    def test_poll_fetches_watched_jobs_by_id_first(self):
+        self.mock_api.job_get.side_effect = [
+            self.make_job(1, 'R', 'S', '2019-01-01T00:00:01Z'),
+            self.make_job(2, 'N', '', '2019-01-01T00:00:00Z'),
+        ]
+        self.mock_api.jobs_list.side_effect = [
+            [self.make_job(1, 'R', 'R', '2019-01-01T00:00:05Z'), self.make_job(3, 'N', '', '2019-01-01T00:00:05Z')],
+        ]
+        watcher = JobWatcher(self.mock_api, job_ids=[2, 1])
+        self.assertEqual(watcher.poll(), [
+            "2019-01-01T00:00:01Z Job 1 'job1' (exome/v1) state: R step: S",
+            "2019-01-01T00:00:00Z Job 2 'job2' (exome/v1) state: N step: ",
+        ])
+        self.assertEqual(watcher.poll(), [
+            "2019-01-01T00:00:05Z Job 1 'job1' (exome/v1) state: R -> R step: S -> R",
+        ])
+        self.mock_api.job_get.assert_has_calls([call(1), call(2)])
+        self.mock_api.jobs_list.assert_called_once_with(since='2019-01-01T00:00:01Z')
+
+    def test_poll_unknown_job_id(self):
+        self.mock_api.job_get.side_effect = JobDoesNotExistException("No job found for id: 5.")
+        watcher = JobWatcher(self.mock_api, job_ids=[5])
+        with self.assertRaises(JobDoesNotExistException):
+            watcher.poll()
+        self.mock_api.jobs_list.assert_not_called()
+
+    @patch('bespin.commands.print')
+    def test_watch_backs_off_until_jobs_finish(self, mock_print):
+        self.mock_api.job_get.side_effect = [
+            self.make_job(1, 'R', 'S', '2019-01-01T00:00:01Z'),
+            self.make_job(2, 'R', 'S', '2019-01-01T00:00:01Z'),
+        ]
+        self.mock_api.jobs_list.side_effect = [
+            [],
+            [],
+            [self.make_job(1, 'F', '', '2019-01-01T00:00:09Z')],
+            [self.make_job(2, 'E', '', '2019-01-01T00:00:10Z'), self.make_job(3, 'N', '', '2019-01-01T00:00:10Z')],
+        ]
+        mock_sleep = Mock()
+        watcher = JobWatcher(self.mock_api, job_ids=[1, 2], min_interval=2, max_interval=5, sleep_func=mock_sleep)
+        watcher.watch()
+        mock_sleep.assert_has_calls([call(2), call(4), call(5), call(2)])
+        self.assertEqual(mock_print.call_count, 4)
+
+
 class ShortWorkflowDetailsTestCase(TestCase):
     def test_get_column_data(self):
         mock_api = Mock()
@@ -522,7 +892,7 @@ class ShortWorkflowDetailsTestCase(TestCase):
         ]
         details = ShortWorkflowDetails(mock_api, tag="exome")
         self.assertEqual(details.column_names, ["id", "name", "tag"])
-        self.assertEqual(details.get_column_data(), [
+        self.assertEqual(list(details.get_column_data()), [
             {'id': 1, 'name': 'Exome Seq', 'tag': 'exome'}
         ])
         mock_api.workflows_list.assert_called_with("exome")
@@ -547,7 +917,7 @@ class WorkflowVersionsListTestCase(TestCase):
         }
         details = WorkflowVersionsList(mock_api, workflow_tag='sometag')
         self.assertEqual(details.column_names, ["id", "description", "workflow tag", "version", "url", "workflow_path"])
-        self.assertEqual(details.get_column_data(), [
+        self.assertEqual(list(details.get_column_data()), [
             {
                 'description': 'Exome Seq',
                 'id': 1,
@@ -583,7 +953,7 @@ class WorkflowConfigurationsListTestCase(TestCase):
         }
         wfc_list = WorkflowConfigurationsList(mock_api, workflow_tag='mytag')
         self.assertEqual(wfc_list.column_names, ['id', 'tag', 'workflow', 'share group', 'Default Job Strategy'])
-        self.assertEqual(wfc_list.get_column_data(), [
+        self.assertEqual(list(wfc_list.get_column_data()), [
             {
                 'Default Job Strategy': 'default',
                 'default_job_strategy': 3,
@@ -603,7 +973,7 @@ class ShareGroupsListTestCase(TestCase):
         ]
         sg_list = ShareGroupsList(mock_api)
         self.assertEqual(sg_list.column_names, ["id", "name", "email"])
-        self.assertEqual(sg_list.get_column_data(), [
+        self.assertEqual(list(sg_list.get_column_data()), [
             {'id': 1, 'name': "GroupName", "email": "com@com.com"}
         ])
 
@@ -626,7 +996,7 @@ class JobStrategiesListTestCase(TestCase):
         ]
         job_strategies_list = JobStrategiesList(mock_api)
         self.assertEqual(job_strategies_list.column_names, ['id', 'name', 'type', 'cpus', 'memory', 'volume size (g)'])
-        self.assertEqual(job_strategies_list.get_column_data(), [
+        self.assertEqual(list(job_strategies_list.get_column_data()), [
             {
                 'cpus': 22,
                 'memory': '1MB',
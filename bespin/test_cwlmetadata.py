@@ -0,0 +1,324 @@
+from unittest import TestCase
+from bespin.cwlmetadata import CWLMetadataLoader, load_cwl_metadata, normalize_id_map, expand_type, \
+    expand_namespaces, shortname, to_uri
+from bespin.exceptions import InvalidWorkflowFileException
+from bespin.tool_details import ToolDetailsBuilder
+from bespin.workflow import BespinWorkflowLoader, BespinWorkflowParser, BespinWorkflowValidator, CWLWorkflowVersion
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+WORKFLOW_CWL = """
+cwlVersion: v1.0
+class: Workflow
+label: exomeseq/v1.0.0
+doc: Exome sequencing - v1.0.0
+requirements:
+  - class: ScatterFeatureRequirement
+  - class: SubworkflowFeatureRequirement
+inputs:
+  reads: File[]
+  reference:
+    type: File
+    format: edam:format_1929
+  threads: int?
+  sample_name: string
+  mode:
+    type: int
+    default: 3
+    doc: the mode
+outputs:
+  out:
+    type: File[]
+    outputSource: align/out
+steps:
+  align:
+    run: tools/align.cwl
+    scatter: reads
+    in:
+      reads: reads
+      reference: reference
+    out: [out]
+  sub:
+    run: subworkflow.cwl
+    in:
+      text: sample_name
+      reference: reference
+    out: [result]
+$namespaces:
+  edam: http://edamontology.org/
+"""
+
+SUBWORKFLOW_CWL = """
+cwlVersion: v1.0
+class: Workflow
+inputs:
+  text: string
+  reference: File
+outputs:
+  result:
+    type: File
+    outputSource: echo/out
+steps:
+  echo:
+    run: tools/echo.cwl
+    in: {text: text}
+    out: [out]
+  align_again:
+    run: tools/align.cwl
+    in: {reads: reference, reference: reference}
+    out: [out]
+"""
+
+ALIGN_CWL = """
+cwlVersion: v1.0
+class: CommandLineTool
+$namespaces:
+  s: https://schema.org/
+requirements:
+  DockerRequirement:
+    dockerPull: org/aligner:1.2
+hints:
+  SoftwareRequirement:
+    packages:
+      bwa:
+        version: ["0.7.17"]
+        s:citation: https://doi.org/10.1093/bioinformatics/btp324
+      samtools:
+        version: ["1.9"]
+baseCommand: bwa
+inputs:
+  reads: File
+  reference: File
+outputs:
+  out: stdout
+"""
+
+ECHO_CWL = """
+cwlVersion: v1.0
+class: CommandLineTool
+hints:
+  - class: DockerRequirement
+    dockerPull: ubuntu:18.04
+baseCommand: echo
+inputs:
+  text:
+    type: string
+    inputBinding: {position: 1}
+outputs:
+  out: stdout
+"""
+
+PACKED_CWL = {
+    'cwlVersion': 'v1.0',
+    '$namespaces': {'s': 'https://schema.org/'},
+    '$graph': [
+        {
+            'class': 'CommandLineTool',
+            'id': '#align.cwl',
+            'requirements': [{'class': 'DockerRequirement', 'dockerPull': 'org/aligner:1.2'}],
+            'hints': [{'class': 'SoftwareRequirement', 'packages': [
+                {'package': 'bwa', 'version': ['0.7.17'], 's:citation': 'https://doi.org/10.1093/bioinformatics/btp324'}
+            ]}],
+            'baseCommand': 'bwa',
+            'inputs': [{'id': '#align.cwl/reads', 'type': 'File'}],
+            'outputs': [{'id': '#align.cwl/out', 'type': 'stdout'}],
+        },
+        {
+            'class': 'Workflow',
+            'id': '#main',
+            'label': 'packedseq/v2.0.0',
+            'doc': 'Packed sequencing - v2.0.0',
+            'inputs': [
+                {'id': '#main/reads', 'type': 'File'},
+                {'id': '#main/names', 'type': {'type': 'array', 'items': 'string'}},
+            ],
+            'outputs': [{'id': '#main/out', 'type': 'File', 'outputSource': '#main/align/out'}],
+            'steps': [{
+                'id': '#main/align',
+                'run': '#align.cwl',
+                'in': [{'id': '#main/align/reads', 'source': '#main/reads'}],
+                'out': ['#main/align/out'],
+            }],
+        },
+    ],
+}
+
+
+def remove_cwl_namespace(cwl_type):
+    # newer versions of cwltool report File types as 'org.w3id.cwl.cwl.File'
+    if isinstance(cwl_type, str):
+        return cwl_type.replace('org.w3id.cwl.cwl.', '')
+    if isinstance(cwl_type, list):
+        return [remove_cwl_namespace(item) for item in cwl_type]
+    if isinstance(cwl_type, dict):
+        return dict((key, remove_cwl_namespace(value)) for key, value in cwl_type.items())
+    return cwl_type
+
+
+class CWLMetadataFunctionsTestCase(TestCase):
+    def test_normalize_id_map(self):
+        self.assertEqual(normalize_id_map({'b': 'File', 'a': {'type': 'int'}}, 'inputs'),
+                         [{'id': 'a', 'type': 'int'}, {'id': 'b', 'type': 'File'}])
+        self.assertEqual(normalize_id_map({'DockerRequirement': {'dockerPull': 'x'}}, 'requirements'),
+                         [{'class': 'DockerRequirement', 'dockerPull': 'x'}])
+        self.assertEqual(normalize_id_map([{'id': 'a'}], 'inputs'), [{'id': 'a'}])
+        self.assertEqual(normalize_id_map(None, 'steps'), [])
+
+    def test_expand_type(self):
+        self.assertEqual(expand_type('File'), 'File')
+        self.assertEqual(expand_type('File?'), ['null', 'File'])
+        self.assertEqual(expand_type('File[]'), {'type': 'array', 'items': 'File'})
+        self.assertEqual(expand_type('File[]?'), ['null', {'type': 'array', 'items': 'File'}])
+        self.assertEqual(expand_type(['null', 'string[]']), ['null', {'type': 'array', 'items': 'string'}])
+        self.assertEqual(expand_type({'type': 'record', 'fields': {'name': 'string?'}}),
+                         {'type': 'record', 'fields': [{'id': 'name', 'type': ['null', 'string']}]})
+
+    def test_expand_namespaces(self):
+        self.assertEqual(expand_namespaces([{'s:citation': 'x', 'version': ['1']}], {'s': 'https://schema.org/'}),
+                         [{'https://schema.org/citation': 'x', 'version': ['1']}])
+
+    def test_shortname(self):
+        self.assertEqual(shortname('file:///workflow.cwl#main/reads'), 'reads')
+        self.assertEqual(shortname('reads'), 'reads')
+
+    def test_to_uri(self):
+        self.assertEqual(to_uri('file:///data/workflow.cwl'), 'file:///data/workflow.cwl')
+        self.assertEqual(to_uri('/'), 'file:///')
+
+
+class CWLMetadataLoaderTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = os.path.realpath(tempfile.mkdtemp())
+        self.workflow_dir = os.path.join(self.temp_dir, 'workflow')
+        os.makedirs(os.path.join(self.workflow_dir, 'tools'))
+        for path, content in [('workflow.cwl', WORKFLOW_CWL), ('subworkflow.cwl', SUBWORKFLOW_CWL),
+                              ('tools/align.cwl', ALIGN_CWL), ('tools/echo.cwl', ECHO_CWL)]:
+            with open(os.path.join(self.workflow_dir, path), 'w') as outfile:
+                outfile.write(content)
+        self.workflow_path = os.path.join(self.workflow_dir, 'workflow.cwl')
+        self.packed_path = os.path.join(self.temp_dir, 'packed.cwl')
+        with open(self.packed_path, 'w') as outfile:
+            json.dump(PACKED_CWL, outfile)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_load(self):
+        workflow = load_cwl_metadata(self.workflow_path)
+        self.assertEqual(workflow.tool['class'], 'Workflow')
+        self.assertEqual(workflow.tool['cwlVersion'], 'v1.0')
+        self.assertEqual(workflow.tool['label'], 'exomeseq/v1.0.0')
+        fields = dict((field['name'], field) for field in workflow.inputs_record_schema['fields'])
+        self.assertEqual(fields['reads']['type'], {'type': 'array', 'items': 'File'})
+        self.assertEqual(fields['reference']['format'], 'http://edamontology.org/format_1929')
+        self.assertEqual(fields['mode']['type'], ['null', 'int'])
+        visited = []
+        workflow.visit(lambda node: visited.append(node['id']))
+        prefix = 'file://{}/'.format(self.workflow_dir)
+        self.assertEqual(visited, [prefix + 'workflow.cwl', prefix + 'tools/align.cwl', prefix + 'subworkflow.cwl',
+                                   prefix + 'tools/align.cwl', prefix + 'tools/echo.cwl'])
+
+    def test_load_reads_each_document_once(self):
+        loader = CWLMetadataLoader()
+        workflow = loader.load(self.workflow_path)
+        self.assertIs(workflow.step_processes[0], workflow.step_processes[1].step_processes[0])
+
+    def test_load_packed(self):
+        workflow = load_cwl_metadata(self.packed_path + '#main')
+        self.assertEqual(workflow.tool['cwlVersion'], 'v1.0')
+        self.assertEqual(workflow.tool['id'], 'file://{}#main'.format(self.packed_path))
+        tool = workflow.step_processes[0].tool
+        self.assertEqual(tool['id'], 'file://{}#align.cwl'.format(self.packed_path))
+        self.assertEqual(tool['hints'][0]['packages'][0]['https://schema.org/citation'],
+                         'https://doi.org/10.1093/bioinformatics/btp324')
+
+    def test_load_follows_imports(self):
+        with open(os.path.join(self.workflow_dir, 'docker.yml'), 'w') as outfile:
+            outfile.write('class: DockerRequirement\ndockerPull: org/imported:1.0\n')
+        with open(os.path.join(self.workflow_dir, 'tools', 'echo.cwl'), 'w') as outfile:
+            outfile.write(ECHO_CWL.replace('hints:\n  - class: DockerRequirement\n    dockerPull: ubuntu:18.04',
+                                           'hints:\n  - $import: ../docker.yml'))
+        workflow = load_cwl_metadata(os.path.join(self.workflow_dir, 'tools', 'echo.cwl'))
+        self.assertEqual(workflow.tool['hints'], [{'class': 'DockerRequirement', 'dockerPull': 'org/imported:1.0'}])
+
+    def test_load_raises_on_missing_run_file(self):
+        os.remove(os.path.join(self.workflow_dir, 'tools', 'echo.cwl'))
+        with self.assertRaises(InvalidWorkflowFileException):
+            load_cwl_metadata(self.workflow_path)
+
+    def test_load_raises_on_missing_graph_id(self):
+        with self.assertRaises(InvalidWorkflowFileException):
+            load_cwl_metadata(self.packed_path + '#other')
+
+
+class CWLMetadataMatchesCWLToolTestCase(TestCase):
+    """
+    The fast path must produce the same parse results and tool details as loading with cwltool
+    """
+    def setUp(self):
+        self.temp_dir = os.path.realpath(tempfile.mkdtemp())
+        self.zip_path = os.path.join(self.temp_dir, 'exomeseq.zip')
+        with zipfile.ZipFile(self.zip_path, 'w') as archive:
+            for path, content in [('workflow.cwl', WORKFLOW_CWL), ('subworkflow.cwl', SUBWORKFLOW_CWL),
+                                  ('tools/align.cwl', ALIGN_CWL), ('tools/echo.cwl', ECHO_CWL)]:
+                archive.writestr('exomeseq/' + path, content)
+        self.packed_path = os.path.join(self.temp_dir, 'packed.cwl')
+        with open(self.packed_path, 'w') as outfile:
+            json.dump(PACKED_CWL, outfile)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def load_and_extract(url, workflow_type, workflow_path, strict):
+        workflow_version = CWLWorkflowVersion(url, workflow_type, workflow_path, strict=strict)
+        loader = BespinWorkflowLoader(workflow_version)
+        loaded = loader.load()
+        parser = BespinWorkflowParser(loaded)
+        builder = ToolDetailsBuilder(loader.get_prefix())
+        builder.accept(loaded)
+        validator = BespinWorkflowValidator(loaded)
+        validator.validate(parser.tag, parser.version)
+        fields = [{'name': field['name'], 'type': remove_cwl_namespace(field['type']), 'default': field.get('default')}
+                  for field in parser.input_fields]
+        return {
+            'class': loaded.tool['class'],
+            'tag': parser.tag,
+            'version': parser.version,
+            'description': parser.description,
+            'fields': sorted(fields, key=lambda field: field['name']),
+            'tool_details': sorted(builder.build(), key=lambda detail: detail['tool_name']),
+            # cwlVersion differs between cwltool releases that upgrade documents when loading them
+            'errors': [error for error in validator.errors if 'cwlVersion' not in error],
+        }
+
+    def assert_matches_cwltool(self, url, workflow_type, workflow_path):
+        fast = self.load_and_extract(url, workflow_type, workflow_path, strict=False)
+        full = self.load_and_extract(url, workflow_type, workflow_path, strict=True)
+        self.assertEqual(fast, full)
+        return fast
+
+    def test_zipped(self):
+        extracted = self.assert_matches_cwltool('file://' + self.zip_path, BespinWorkflowLoader.TYPE_ZIPPED,
+                                                'exomeseq/workflow.cwl')
+        self.assertEqual(extracted['tag'], 'exomeseq')
+        self.assertEqual([detail['tool_name'] for detail in extracted['tool_details']],
+                         ['tools/align.cwl', 'tools/echo.cwl'])
+        self.assertEqual(extracted['tool_details'][0]['packages'][0]['citation'],
+                         'https://doi.org/10.1093/bioinformatics/btp324')
+
+    def test_packed(self):
+        extracted = self.assert_matches_cwltool('file://' + self.packed_path, BespinWorkflowLoader.TYPE_PACKED,
+                                                '#main')
+        self.assertEqual(extracted['version'], 'v2.0.0')
+        self.assertEqual([detail['tool_name'] for detail in extracted['tool_details']], ['align.cwl'])
+
+    def test_direct(self):
+        with zipfile.ZipFile(self.zip_path) as archive:
+            archive.extractall(self.temp_dir)
+        extracted = self.assert_matches_cwltool('file://' + os.path.join(self.temp_dir, 'exomeseq', 'workflow.cwl'),
+                                                BespinWorkflowLoader.TYPE_DIRECT, None)
+        self.assertEqual(extracted['errors'], [])
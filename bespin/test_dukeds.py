@@ -1,8 +1,15 @@
 from __future__ import absolute_import
 from unittest import TestCase
-from bespin.dukeds import DDSFileUtil, InvalidFilePathException, ProjectDoesNotExistException, \
+from bespin.dukeds import DDSFileUtil, DDSFileCache, DDSPathCache, DDSFileRecord, InvalidFilePathException, ProjectDoesNotExistException, \
     FileDoesNotExistException, ItemNotFound, DUKEDS_FILE_PATH_MISSING_PREFIX, DUKEDS_FILE_PATH_MISSING_SLASH
+from ddsc.core.ddsapi import DataServiceError
 from mock import patch, Mock
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import json
+import os
+import shutil
+import tempfile
 
 
 class DDSFileUtilTestCase(TestCase):
@@ -53,6 +60,7 @@ class DDSFileUtilTestCase(TestCase):
         self.assertEqual(util.find_project_for_name('mouse'), project1)
         self.assertEqual(util.find_project_for_name('rat'), project2)
         self.assertEqual(util.find_project_for_name('cheese'), None)
+        self.assertEqual(util.client.get_projects.call_count, 1)
 
     @patch('bespin.dukeds.Client')
     def test_give_download_permissions(self, mock_client):
@@ -75,3 +83,216 @@ class DDSFileUtilTestCase(TestCase):
         with self.assertRaises(InvalidFilePathException) as raised_exception:
             DDSFileUtil.get_project_name_and_file_path('dds://mouse')
         self.assertEqual(str(raised_exception.exception), DUKEDS_FILE_PATH_MISSING_SLASH + ": dds://mouse")
+
+
+class DDSFileCacheTestCase(TestCase):
+    def test_find_file_for_path_looks_up_each_path_once(self):
+        mock_find_file_for_path = Mock(side_effect=lambda path: 'file:' + path)
+        cache = DDSFileCache(mock_find_file_for_path)
+
+        for _ in range(3):
+            self.assertEqual(cache.find_file_for_path('dds://mouse/genome.fa'), 'file:dds://mouse/genome.fa')
+        self.assertEqual(cache.find_file_for_path('dds://mouse/s1.fastq'), 'file:dds://mouse/s1.fastq')
+
+        self.assertEqual(mock_find_file_for_path.call_count, 2)
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 2)
+
+    def test_find_file_for_path_caches_errors(self):
+        mock_find_file_for_path = Mock(side_effect=FileDoesNotExistException("File does not exist"))
+        cache = DDSFileCache(mock_find_file_for_path)
+
+        for _ in range(2):
+            with self.assertRaises(FileDoesNotExistException):
+                cache.find_file_for_path('dds://mouse/missing.txt')
+
+        self.assertEqual(mock_find_file_for_path.call_count, 1)
+        self.assertEqual(cache.hits, 1)
+
+    def test_find_file_for_path_concurrent_lookups_of_same_path(self):
+        lookup_started = threading.Event()
+        release_lookup = threading.Event()
+
+        def slow_find_file_for_path(path):
+            lookup_started.set()
+            release_lookup.wait(5)
+            return 'file'
+
+        mock_find_file_for_path = Mock(side_effect=slow_find_file_for_path)
+        cache = DDSFileCache(mock_find_file_for_path)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(cache.find_file_for_path, 'dds://mouse/genome.fa') for _ in range(4)]
+            lookup_started.wait(5)
+            release_lookup.set()
+            self.assertEqual([future.result() for future in futures], ['file'] * 4)
+
+        self.assertEqual(mock_find_file_for_path.call_count, 1)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+
+def make_dds_file(file_id='777', version_id='v1', size=4002, name='data.txt', is_deleted=False, folder_names=()):
+    ancestors = [{'kind': 'dds-project', 'name': 'mouse'}]
+    ancestors.extend({'kind': 'dds-folder', 'name': folder_name} for folder_name in folder_names)
+    dds_file = Mock(project_id='666', current_version={'id': version_id, 'upload': {'size': size}},
+                    is_deleted=is_deleted, ancestors=ancestors)
+    dds_file.id = file_id
+    dds_file.name = name
+    return dds_file
+
+
+class DDSPathCacheTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'cache.json')
+        self.now = 1000.0
+        self.dds_config = Mock(url='https://dds.example.com/api/v1', agent_key='agent1', user_key='user1')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_cache(self):
+        return DDSPathCache(self.filename, ttl_seconds=60, time_func=lambda: self.now)
+
+    def test_put_save_and_get(self):
+        cache = self.create_cache()
+        cache.put('dds://mouse/data.txt', self.dds_config, make_dds_file())
+        cache.save()
+
+        record = self.create_cache().get('dds://mouse/data.txt', self.dds_config)
+        self.assertEqual((record.project_id, record.id, record.current_version, record.checked_at),
+                         ('666', '777', {'id': 'v1', 'upload': {'size': 4002}}, 1000.0))
+        self.assertIsNone(self.create_cache().get('dds://mouse/other.txt', self.dds_config))
+
+    def test_records_are_kept_per_dukeds_identity(self):
+        cache = self.create_cache()
+        cache.put('dds://mouse/data.txt', self.dds_config, make_dds_file())
+        cache.save()
+
+        cache = self.create_cache()
+        for other_dds_config in [
+                Mock(url='https://dds.example.com/api/v1', agent_key='agent1', user_key='user2'),
+                Mock(url='https://dds.example.com/api/v1', agent_key='agent2', user_key='user1'),
+                Mock(url='https://other-dds.example.com/api/v1', agent_key='agent1', user_key='user1')]:
+            self.assertIsNone(cache.get('dds://mouse/data.txt', other_dds_config))
+        with open(self.filename) as infile:
+            self.assertNotIn('user1', infile.read(), "Keys are not written to the cache file.")
+
+    def test_save_only_writes_changes(self):
+        self.create_cache().save()
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_unreadable_cache_is_empty(self):
+        for contents in ['not json', json.dumps({'version': 0, 'records': {}}), json.dumps([1])]:
+            with open(self.filename, 'w') as outfile:
+                outfile.write(contents)
+            self.assertIsNone(self.create_cache().get('dds://mouse/data.txt', self.dds_config))
+
+    def test_is_expired(self):
+        cache = self.create_cache()
+        record = DDSFileRecord('666', '777', 'v1', 10, checked_at=1000.0)
+        self.assertFalse(cache.is_expired(record))
+        self.now = 1060.0
+        self.assertTrue(cache.is_expired(record))
+
+
+class DDSFileUtilPathCacheTestCase(TestCase):
+    def setUp(self):
+        self.path_cache = Mock()
+        self.path_cache.get.return_value = DDSFileRecord('666', '777', 'v1', 10, checked_at=1000.0)
+
+    @patch('bespin.dukeds.Client')
+    def test_find_file_for_path_uses_fresh_record(self, mock_client):
+        self.path_cache.is_expired.return_value = False
+        util = DDSFileUtil(path_cache=self.path_cache)
+        util.find_project_for_name = Mock()
+
+        dds_file = util.find_file_for_path('dds://mouse/data.txt')
+
+        self.assertEqual(dds_file, self.path_cache.get.return_value)
+        self.path_cache.get.assert_called_with('dds://mouse/data.txt', util.client.dds_connection.config)
+        util.find_project_for_name.assert_not_called()
+        util.client.get_file_by_id.assert_not_called()
+
+    @patch('bespin.dukeds.Client')
+    def test_find_file_for_path_revalidates_expired_record(self, mock_client):
+        self.path_cache.is_expired.return_value = True
+        util = DDSFileUtil(path_cache=self.path_cache)
+        util.find_project_for_name = Mock()
+        util.client.get_file_by_id.return_value = make_dds_file(version_id='v2')
+
+        dds_file = util.find_file_for_path('dds://mouse/data.txt')
+
+        self.assertEqual(dds_file, util.client.get_file_by_id.return_value)
+        util.client.get_file_by_id.assert_called_with('777')
+        util.find_project_for_name.assert_not_called()
+        self.path_cache.put.assert_called_with('dds://mouse/data.txt', util.client.dds_connection.config, dds_file)
+
+    @patch('bespin.dukeds.Client')
+    def test_find_file_for_path_finds_renamed_file_again(self, mock_client):
+        self.path_cache.is_expired.return_value = True
+        util = DDSFileUtil(path_cache=self.path_cache)
+        util.client.get_file_by_id.return_value = make_dds_file(name='renamed.txt')
+        util.find_project_for_name = Mock()
+        found_file = util.find_project_for_name.return_value.get_child_for_path.return_value
+
+        dds_file = util.find_file_for_path('dds://mouse/data.txt')
+
+        self.assertEqual(dds_file, found_file)
+        util.find_project_for_name.assert_called_with('mouse')
+        self.path_cache.put.assert_called_with('dds://mouse/data.txt', util.client.dds_connection.config,
+                                               found_file)
+
+    @patch('bespin.dukeds.Client')
+    def test_find_file_for_path_finds_file_moved_to_another_folder_again(self, mock_client):
+        self.path_cache.is_expired.return_value = True
+        util = DDSFileUtil(path_cache=self.path_cache)
+        util.client.get_file_by_id.return_value = make_dds_file(folder_names=['old'])
+        util.find_project_for_name = Mock()
+        found_file = util.find_project_for_name.return_value.get_child_for_path.return_value
+
+        self.assertEqual(util.find_file_for_path('dds://mouse/data.txt'), found_file)
+        util.find_project_for_name.return_value.get_child_for_path.assert_called_with('data.txt')
+
+    @patch('bespin.dukeds.Client')
+    def test_find_file_for_path_revalidates_file_in_folder(self, mock_client):
+        self.path_cache.is_expired.return_value = True
+        util = DDSFileUtil(path_cache=self.path_cache)
+        util.client.get_file_by_id.return_value = make_dds_file(folder_names=['run1', 'reads'])
+        util.find_project_for_name = Mock()
+
+        dds_file = util.find_file_for_path('dds://mouse/run1/reads/data.txt')
+
+        self.assertEqual(dds_file, util.client.get_file_by_id.return_value)
+        util.find_project_for_name.assert_not_called()
+
+    @patch('bespin.dukeds.Client')
+    def test_find_file_for_path_finds_deleted_file_again(self, mock_client):
+        self.path_cache.is_expired.return_value = True
+        util = DDSFileUtil(path_cache=self.path_cache)
+        util.client.get_file_by_id.side_effect = DataServiceError(Mock(status_code=404), '/files/777', {})
+        util.find_project_for_name = Mock()
+        found_file = util.find_project_for_name.return_value.get_child_for_path.return_value
+
+        self.assertEqual(util.find_file_for_path('dds://mouse/data.txt'), found_file)
+
+    @patch('bespin.dukeds.Client')
+    def test_find_file_for_path_raises_revalidation_errors(self, mock_client):
+        self.path_cache.is_expired.return_value = True
+        util = DDSFileUtil(path_cache=self.path_cache)
+        util.client.get_file_by_id.side_effect = DataServiceError(Mock(status_code=401), '/files/777', {})
+        util.find_project_for_name = Mock()
+
+        with self.assertRaises(DataServiceError):
+            util.find_file_for_path('dds://mouse/data.txt')
+        util.find_project_for_name.assert_not_called()
+
+    @patch('bespin.dukeds.Client')
+    def test_find_file_for_path_not_cached(self, mock_client):
+        self.path_cache.get.return_value = None
+        util = DDSFileUtil(path_cache=self.path_cache)
+        util.find_project_for_name = Mock()
+        found_file = util.find_project_for_name.return_value.get_child_for_path.return_value
+
+        self.assertEqual(util.find_file_for_path('dds://mouse/data.txt'), found_file)
+        self.path_cache.put.assert_called_with('dds://mouse/data.txt', util.client.dds_connection.config,
+                                               found_file)
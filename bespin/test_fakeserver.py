@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+from unittest import TestCase
+import time
+from bespin.fakeserver import FakeBespinServer, FakeBespinData
+from bespin.api import BespinApi, BespinException, BespinClientErrorException
+from bespin.config import Config
+from bespin.exceptions import JobDoesNotExistException, WorkflowNotFound
+from bespin.jobtemplate import JobTemplate, JobCreationContext
+from mock import Mock
+
+
+class FakeBespinDataTestCase(TestCase):
+    def test_dataset_size(self):
+        data = FakeBespinData(num_jobs=25, num_workflows=3, num_versions=4, num_configurations=2)
+        self.assertEqual(len(data.list('jobs')), 25)
+        self.assertEqual(len(data.list('workflows')), 3)
+        self.assertEqual(len(data.list('workflow-versions')), 12)
+        self.assertEqual(len(data.list('workflow-configurations')), 6)
+        self.assertEqual(data.get('workflows', 2)['versions'], [5, 6, 7, 8])
+        self.assertEqual(data.get('workflow-versions', 5)['tag'], 'workflow2/v1')
+
+    def test_matches(self):
+        data = FakeBespinData()
+        job = data.get('jobs', 2)
+        self.assertTrue(data.matches(job, 'workflow_version__workflow__tag', 'workflow1'))
+        self.assertFalse(data.matches(job, 'workflow_version__workflow__tag', 'workflow2'))
+        self.assertTrue(data.matches(job, 'last_updated__gte', job['last_updated']))
+        self.assertFalse(data.matches(data.get('jobs', 1), 'last_updated__gte', job['last_updated']))
+
+
+class FakeBespinServerTestCase(TestCase):
+    def setUp(self):
+        self.server = FakeBespinServer(FakeBespinData(num_jobs=25)).start()
+        self.api = BespinApi(self.server.create_config(), user_agent_str='test')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_list_and_get(self):
+        self.assertEqual(len(list(self.api.jobs_list())), 25)
+        self.assertEqual([job['id'] for job in self.api.jobs_list(state='R')], [4, 11, 18, 25])
+        self.assertEqual(self.api.workflow_get_for_tag('workflow2')['versions'], [3, 4])
+        self.assertEqual(self.api.workflow_version_find_by_tag_version('workflow2', 1)['id'], 3)
+        self.assertEqual(self.api.job_strategy_get_for_name('strategy2')['job_flavor']['cpus'], 2)
+        self.assertEqual(self.api.share_group_get(1)['name'], 'group1')
+        with self.assertRaises(WorkflowNotFound):
+            self.api.workflow_get_for_tag('missing')
+
+    def test_paginated_list(self):
+        self.server.page_size = 10
+        self.assertEqual([job['id'] for job in self.api.jobs_list()], list(range(1, 26)))
+        self.assertEqual(self.server.request_counts, {'GET /jobs/': 3})
+        self.server.reset_request_counts()
+        self.assertEqual([job['id'] for job in self.api.jobs_list(state='R', limit=2)], [4, 11, 18, 25])
+        self.assertEqual(self.server.total_requests, 2)
+
+    def test_job_actions(self):
+        self.api.start_job(3)
+        self.assertEqual(self.server.data.get('jobs', 3)['state'], 'R')
+        self.api.delete_job(3)
+        self.assertIsNone(self.server.data.get('jobs', 3))
+        with self.assertRaises(JobDoesNotExistException):
+            self.api.cancel_job(3)
+        self.assertEqual(self.server.request_counts['POST /jobs/{id}/cancel/'], 1)
+
+    def test_create_job(self):
+        mock_dds_file_util = Mock()
+        mock_file = Mock(project_id=666, current_version={'upload': {'size': 4002}})
+        mock_file.id = 777
+        mock_dds_file_util.find_file_for_path.return_value = mock_file
+        job_template = JobTemplate(tag='workflow1/v1/config1', name='myjob', fund_code='001', job_order={
+            'myfile': {'class': 'File', 'path': 'dds://project/somepath.txt'},
+        })
+
+        job = job_template.create_job(self.api, JobCreationContext(self.api, mock_dds_file_util))
+
+        self.assertEqual(job['job'], 26)
+        self.assertEqual(self.server.data.get('jobs', 26)['name'], 'myjob')
+        input_file = self.server.data.get('dds-job-input-files', 1)
+        self.assertEqual(input_file['file_id'], 777)
+        self.assertEqual(input_file['destination_path'], 'dds_project_somepath.txt')
+        self.assertEqual(self.server.request_counts['POST /job-templates/create-job/'], 1)
+
+    def test_client_errors(self):
+        with self.assertRaises(BespinClientErrorException) as raised_exception:
+            self.api.job_template_validate({'tag': 'workflow1/v1/config1'})
+        self.assertIn('This field is required.', str(raised_exception.exception))
+        api = BespinApi(Config({'url': self.server.url, 'token': 'wrong'}), user_agent_str='test')
+        with self.assertRaises(BespinClientErrorException) as raised_exception:
+            list(api.jobs_list())
+        self.assertEqual(str(raised_exception.exception), 'Invalid token.')
+
+
+class FakeBespinServerFaultsTestCase(TestCase):
+    def test_error_rate(self):
+        with FakeBespinServer(error_rate=1.0) as server:
+            api = BespinApi(server.create_config(), user_agent_str='test')
+            with self.assertRaises(BespinException) as raised_exception:
+                api.workflow_get(1)
+        self.assertEqual(str(raised_exception.exception), 'Injected fault')
+
+    def test_error_rate_is_reproducible(self):
+        def get_failures(seed):
+            server = FakeBespinServer(error_rate=0.5, seed=seed)
+            return [server.handle_request('GET', '/api/v2/workflows/1/', {'Authorization': 'Token fake-token'},
+                                          '')[0] for _ in range(20)]
+        self.assertEqual(get_failures(seed=1), get_failures(seed=1))
+        self.assertEqual(set(get_failures(seed=1)), {200, 503})
+
+    def test_latency(self):
+        with FakeBespinServer(latency=0.05) as server:
+            api = BespinApi(server.create_config(), user_agent_str='test')
+            start = time.time()
+            api.workflow_get(1)
+            self.assertGreaterEqual(time.time() - start, 0.05)
@@ -2,14 +2,32 @@ from __future__ import absolute_import
 from unittest import TestCase
 import yaml
 import json
-from bespin.jobtemplate import JobTemplate, JobTemplateLoader, JobOrderWalker, JobOrderFileDetails, JobOrderFormatFiles
-from bespin.exceptions import IncompleteJobTemplateException
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import copy
+import tracemalloc
+from bespin.jobtemplate import JobTemplate, JobTemplateLoader, JobCreationContext, \
+    CopyOnWriteJobOrderFormatter, format_file_path
+from bespin.exceptions import IncompleteJobTemplateException, UserInputException, \
+    DDSUserCredentialNotFoundException, WorkflowConfigurationNotFoundException
 from bespin.dukeds import ProjectDoesNotExistException, FileDoesNotExistException
 from bespin.api import BespinException, BespinClientErrorException
+from bespin.journal import JobCreationJournal
+from bespin.tracing import Tracer
 from mock import patch, call, Mock
 
 
 class JobTemplateTestCase(TestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
     def test_constructor__job_strategy(self):
         job_template = JobTemplate(tag='sometag', name='myjob', fund_code='001', job_order={})
         self.assertEqual(job_template.job_strategy, None)
@@ -113,6 +131,21 @@ class JobTemplateTestCase(TestCase):
                 'location': 'https://github.com/datafile1.dat'
         }, "URL file paths should not be modified.")
 
+    def test_formatted_job_order_is_memoized(self):
+        job_template = JobTemplate(tag='sometag', name='myjob', fund_code='001', job_order={
+            'myfile': {'class': 'File', 'path': 'dds://project/somepath.txt'},
+        })
+        with patch('bespin.jobtemplate.CopyOnWriteJobOrderFormatter',
+                   wraps=CopyOnWriteJobOrderFormatter) as mock_formatter:
+            user_job_order = job_template.create_user_job_order()
+            self.assertEqual(job_template.get_dds_file_paths(), ['dds://project/somepath.txt'])
+            self.assertIs(job_template.create_user_job_order(), user_job_order)
+            self.assertEqual(mock_formatter.call_count, 1)
+
+            job_template.job_order = {'myfile': {'class': 'File', 'path': 'dds://project/other.txt'}}
+            self.assertEqual(job_template.get_dds_file_paths(), ['dds://project/other.txt'])
+            self.assertEqual(mock_formatter.call_count, 2)
+
     def test_create_user_job_order_does_not_modify_original(self):
         job_template = JobTemplate(tag='sometag', name='myjob', fund_code='001', job_order={
             'myfile': {
@@ -141,6 +174,15 @@ class JobTemplateTestCase(TestCase):
         file_details = job_template.get_dds_files_details()
         self.assertEqual(file_details, [('filedata1', 'dds_project_somepath.txt')])
 
+    def test_get_dds_file_paths(self):
+        job_template = JobTemplate(tag='sometag', name='myjob', fund_code='001', job_order={
+            'myfile': {'class': 'File', 'path': 'dds://project/somepath.txt'},
+            'myfiles': [{'class': 'File', 'path': 'dds://project/other.txt'}, {'class': 'File', 'path': 'local.txt'}],
+            'myint': 123
+        })
+        self.assertEqual(sorted(job_template.get_dds_file_paths()),
+                         ['dds://project/other.txt', 'dds://project/somepath.txt'])
+
     @patch('bespin.jobtemplate.DDSFileUtil')
     def test_create_job(self, mock_dds_file_util):
         mock_dds_file_util.return_value.find_file_for_path.return_value = 'filedata1'
@@ -161,16 +203,16 @@ class JobTemplateTestCase(TestCase):
             },
             'myint': 555
         })
-        job_template.get_dds_files_details = Mock()
         mock_file = Mock(project_id=666, current_version={'upload': {'size': 4002}})
         mock_file.id = 777
-        job_template.get_dds_files_details.return_value = [[mock_file, 'somepath']]
+        mock_dds_file_util.return_value.find_file_for_path.return_value = mock_file
 
         job_template.create_job(mock_api)
 
         mock_api.workflow_configurations_list.assert_called_with(tag='human', workflow_tag='sometag')
-        mock_api.dds_job_input_files_post.assert_called_with(666, 777, 'somepath', 0, 0, 111, stage_group_id=333,
-                                                             size=4002)
+        mock_dds_file_util.return_value.find_file_for_path.assert_called_with('dds://project_somepath.txt')
+        mock_api.dds_job_input_files_post.assert_called_with(666, 777, 'dds_project_somepath.txt', 0, 0, 111,
+                                                             stage_group_id=333, size=4002)
         mock_api.job_templates_create_job.assert_called_with({
             'name': 'myjob',
             'fund_code': '001',
@@ -186,9 +228,128 @@ class JobTemplateTestCase(TestCase):
         })
         mock_dds_file_util.return_value.give_download_permissions.assert_called_with(666, 112)
 
+    def test_create_job_resumes_from_journal(self):
+        mock_api = Mock()
+        mock_api.dds_user_credentials_list.return_value = [{'id': 111, 'dds_id': 112}]
+        mock_api.workflow_configurations_list.return_value = [{'id': 222}]
+        mock_api.stage_group_post.return_value = {'id': 333}
+        mock_api.job_templates_create_job.return_value = {'job': 444}
+        mock_dds_file_util = Mock()
+        mock_files = {}
+        for file_id in [701, 702, 703]:
+            mock_file = Mock(project_id=666, current_version={'upload': {'size': 10}})
+            mock_file.id = file_id
+            mock_files['dds://mouse/{}.txt'.format(file_id)] = mock_file
+        mock_dds_file_util.find_file_for_path.side_effect = lambda path: mock_files[path]
+        job_template = JobTemplate(tag='sometag/v1/human', name='myjob', fund_code='001', job_order={
+            'files': [{'class': 'File', 'path': path} for path in sorted(mock_files)]
+        })
+
+        def post_input_file(project_id, file_id, *args, **kwargs):
+            if file_id == 702 and not failed:
+                failed.append(file_id)
+                raise BespinClientErrorException('Server error')
+
+        failed = []
+        mock_api.dds_job_input_files_post.side_effect = post_input_file
+        journal = JobCreationJournal(self.journal_dir)
+        context = JobCreationContext(mock_api, mock_dds_file_util, journal=journal)
+
+        with self.assertRaises(IncompleteJobTemplateException):
+            job_template.create_job(mock_api, context)
+        journal_filename = os.path.join(self.journal_dir, job_template.get_idempotency_key(mock_api) + '.jsonl')
+        self.assertTrue(os.path.exists(journal_filename))
+        mock_api.job_templates_create_job.assert_not_called()
+
+        job = job_template.create_job(mock_api, JobCreationContext(mock_api, mock_dds_file_util, journal=journal))
+
+        self.assertEqual(job, {'job': 444})
+        self.assertEqual(mock_api.stage_group_post.call_count, 1, "Stage group is reused.")
+        posted_file_ids = [args[1] for args, kwargs in mock_api.dds_job_input_files_post.call_args_list]
+        self.assertEqual(sorted(posted_file_ids), [701, 702, 702, 703], "Only the failed file is posted twice.")
+        self.assertFalse(os.path.exists(journal_filename), "Journal is removed once the job is created.")
+
+    def test_create_job_traces_steps(self):
+        tracer = Tracer()
+        tracer.enable()
+        mock_api = Mock()
+        mock_api.dds_user_credentials_list.return_value = [{'id': 111, 'dds_id': 112}]
+        mock_api.workflow_configurations_list.return_value = [{'id': 222}]
+        mock_api.stage_group_post.return_value = {'id': 333}
+        mock_dds_file_util = Mock()
+        mock_file = Mock(project_id=666, current_version={'upload': {'size': 10}})
+        mock_file.id = 777
+        mock_dds_file_util.find_file_for_path.return_value = mock_file
+        job_template = JobTemplate(tag='sometag/v1/human', name='myjob', fund_code='001', job_order={
+            'myfile': {'class': 'File', 'path': 'dds://project/somepath.txt'}
+        })
+
+        with patch('bespin.stats.TRACER', tracer), patch('bespin.jobtemplate.TRACER', tracer):
+            job_template.create_job(mock_api, JobCreationContext(mock_api, mock_dds_file_util))
+
+        spans = dict((event['name'], event) for event in tracer.get_events() if event['ph'] == 'X')
+        job_create_id = spans['job create']['args']['span_id']
+        for name in ['job stage group', 'job input file', 'job create job', 'job give permissions']:
+            self.assertEqual(spans[name]['args']['parent_id'], job_create_id, name)
+        self.assertNotEqual(spans['job input file']['tid'], spans['job create']['tid'])
+
+    def test_create_job_overlaps_dds_lookups_with_api_setup(self):
+        # every lookup only returns once the credential, workflow configuration and both DukeDS lookups
+        # are all running at the same time
+        all_steps_started = threading.Barrier(4, timeout=5)
+        mock_api = Mock()
+
+        def wait_for_other_steps(result):
+            def step(*args, **kwargs):
+                all_steps_started.wait()
+                return result
+            return step
+
+        mock_api.dds_user_credentials_list.side_effect = wait_for_other_steps([{'id': 111, 'dds_id': 112}])
+        mock_api.workflow_configurations_list.side_effect = wait_for_other_steps([{'id': 222}])
+        mock_api.stage_group_post.return_value = {'id': 333}
+
+        def find_file_for_path(path):
+            all_steps_started.wait()
+            mock_file = Mock(project_id=666, current_version={'upload': {'size': 10}})
+            mock_file.id = 777 if path == 'dds://mouse/data.txt' else 778
+            return mock_file
+
+        mock_dds_file_util = Mock()
+        mock_dds_file_util.find_file_for_path.side_effect = find_file_for_path
+        job_template = JobTemplate(tag='sometag/v1/human', name='myjob', fund_code='001', job_order={
+            'myfile': {'class': 'File', 'path': 'dds://mouse/data.txt'},
+            'otherfile': {'class': 'File', 'path': 'dds://mouse/other.txt'},
+        })
+
+        job_template.create_job(mock_api, JobCreationContext(mock_api, mock_dds_file_util))
+
+        mock_api.dds_job_input_files_post.assert_has_calls([
+            call(666, 777, 'dds_mouse_data.txt', 0, 0, 111, stage_group_id=333, size=10),
+            call(666, 778, 'dds_mouse_other.txt', 0, 1, 111, stage_group_id=333, size=10),
+        ], any_order=True)
+        self.assertEqual(mock_api.job_templates_create_job.call_args[0][0]['stage_group'], 333)
+
+    def test_create_job_does_not_create_stage_group_when_lookup_fails(self):
+        mock_dds_file_util = Mock()
+        mock_dds_file_util.find_file_for_path.return_value = Mock(project_id=666,
+                                                                  current_version={'upload': {'size': 10}})
+        job_template = JobTemplate(tag='sometag/v1/human', name='myjob', fund_code='001', job_order={
+            'myfile': {'class': 'File', 'path': 'dds://mouse/data.txt'},
+        })
+        for credentials, workflow_configurations, expected_exception in [
+                ([{'id': 111, 'dds_id': 112}], [], WorkflowConfigurationNotFoundException),
+                ([], [{'id': 222}], DDSUserCredentialNotFoundException)]:
+            mock_api = Mock()
+            mock_api.dds_user_credentials_list.return_value = credentials
+            mock_api.workflow_configurations_list.return_value = workflow_configurations
+            with self.assertRaises(expected_exception):
+                job_template.create_job(mock_api, JobCreationContext(mock_api, mock_dds_file_util))
+            mock_api.stage_group_post.assert_not_called()
+            mock_api.dds_job_input_files_post.assert_not_called()
+
     @patch('bespin.jobtemplate.DDSFileUtil')
-    @patch('bespin.jobtemplate.JobOrderFormatFiles')
-    def test_validate(self, mock_job_order_format_files, mock_dds_file_util):
+    def test_validate(self, mock_dds_file_util):
         mock_dds_file_util.return_value.find_file_for_path.return_value = 'filedata1'
         mock_api = Mock()
         mock_api.dds_user_credentials_list.return_value = [{'id': 111, 'dds_id': 112}]
@@ -208,10 +369,6 @@ class JobTemplateTestCase(TestCase):
             'myint': 555
         }
         job_template = JobTemplate(tag='sometag/v1/human', name='myjob', fund_code='001', job_order=job_order)
-        job_template.get_dds_files_details = Mock()
-        mock_file = Mock(project_id=666, current_version={'upload': {'size': 4002}})
-        mock_file.id = 777
-        job_template.get_dds_files_details.return_value = [[mock_file, 'somepath']]
 
         job_template.validate(mock_api)
         mock_api.job_template_validate.assert_called_with({
@@ -220,13 +377,36 @@ class JobTemplateTestCase(TestCase):
             'job_order': {
                 'myfile': {
                     'class': 'File',
-                    'path': 'dds://project_somepath.txt'
+                    'path': 'dds_project_somepath.txt'
                 },
                 'myint': 555},
             'tag': 'sometag/v1/human'
         })
-        job_template.get_dds_files_details.assert_called_with()
-        mock_job_order_format_files.return_value.walk.assert_called_with(job_order)
+        mock_dds_file_util.return_value.find_file_for_path.assert_called_with('dds://project_somepath.txt')
+
+    def test_validate_combines_api_and_missing_file_errors(self):
+        mock_api = Mock()
+        mock_api.job_template_validate.side_effect = BespinClientErrorException(json.dumps({
+            "fund_code": ["This field is required."],
+        }))
+        mock_dds_file_util = Mock()
+
+        def find_file_for_path(path):
+            raise FileDoesNotExistException('File does not exist: {}'.format(path))
+
+        mock_dds_file_util.find_file_for_path.side_effect = find_file_for_path
+        job_template = JobTemplate(tag='sometag/v1/human', name='myjob', fund_code='', job_order={
+            'files': [{'class': 'File', 'path': 'dds://mouse/a.txt'}, {'class': 'File', 'path': 'dds://mouse/b.txt'}],
+        })
+
+        with self.assertRaises(IncompleteJobTemplateException) as raised_exception:
+            job_template.validate(mock_api, JobCreationContext(mock_api, mock_dds_file_util))
+
+        self.assertEqual(str(raised_exception.exception).split('\n'), [
+            'fund_code: This field is required.',
+            'File does not exist: dds://mouse/a.txt',
+            'File does not exist: dds://mouse/b.txt',
+        ])
 
     def test_validate_flattens_bespin_dict_exception(self):
         mock_api = Mock()
@@ -255,6 +435,115 @@ class JobTemplateTestCase(TestCase):
             job_template.validate(mock_api)
         self.assertEqual(str(raised_exception.exception), 'Something failed')
 
+class JobCreationContextTestCase(TestCase):
+    def test_lookups_are_made_once(self):
+        mock_api = Mock()
+        mock_api.dds_user_credentials_list.return_value = [{'id': 111, 'dds_id': 112}]
+        mock_api.workflow_configurations_list.return_value = [{'id': 222}]
+        mock_api.job_strategy_get_for_name.return_value = {'id': 333}
+        mock_dds_file_util = Mock()
+        context = JobCreationContext(mock_api, mock_dds_file_util)
+        job_template = JobTemplate(tag='sometag/v1/human', name='myjob', fund_code='001', job_order={})
+
+        for _ in range(2):
+            self.assertEqual(context.get_dds_user_credential(), {'id': 111, 'dds_id': 112})
+            self.assertEqual(context.get_workflow_configuration(job_template), {'id': 222})
+            self.assertEqual(context.get_job_strategy_id('cloud'), 333)
+            context.give_download_permissions(444, 112)
+
+        self.assertEqual(mock_api.dds_user_credentials_list.call_count, 1)
+        mock_api.workflow_configurations_list.assert_called_once_with(tag='human', workflow_tag='sometag')
+        mock_api.job_strategy_get_for_name.assert_called_once_with('cloud')
+        mock_dds_file_util.give_download_permissions.assert_called_once_with(444, 112)
+
+    def test_concurrent_lookups_of_same_value_are_made_once(self):
+        lookup_started = threading.Event()
+        release_lookup = threading.Event()
+        mock_api = Mock()
+
+        def dds_user_credentials_list():
+            lookup_started.set()
+            self.assertTrue(release_lookup.wait(5))
+            return [{'id': 111, 'dds_id': 112}]
+
+        mock_api.dds_user_credentials_list.side_effect = dds_user_credentials_list
+        mock_api.job_strategy_get_for_name.return_value = {'id': 333}
+        context = JobCreationContext(mock_api, Mock())
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(context.get_dds_user_credential) for _ in range(2)]
+            self.assertTrue(lookup_started.wait(5))
+            # a different lookup is not held up by the credential lookup
+            self.assertEqual(context.get_job_strategy_id('cloud'), 333)
+            release_lookup.set()
+            self.assertEqual([future.result() for future in futures], [{'id': 111, 'dds_id': 112}] * 2)
+        self.assertEqual(mock_api.dds_user_credentials_list.call_count, 1)
+
+    def test_missing_dds_user_credential(self):
+        mock_api = Mock()
+        mock_api.dds_user_credentials_list.return_value = []
+        context = JobCreationContext(mock_api, Mock())
+        with self.assertRaises(DDSUserCredentialNotFoundException) as raised_exception:
+            context.get_dds_user_credential()
+        self.assertEqual(str(raised_exception.exception), "No DukeDS credential configured in bespin-api.")
+
+    def test_missing_workflow_configuration(self):
+        mock_api = Mock()
+        mock_api.workflow_configurations_list.return_value = []
+        context = JobCreationContext(mock_api, Mock())
+        job_template = JobTemplate(tag='sometag/v1/human', name='myjob', fund_code='001', job_order={})
+        with self.assertRaises(WorkflowConfigurationNotFoundException) as raised_exception:
+            context.get_workflow_configuration(job_template)
+        self.assertEqual(str(raised_exception.exception),
+                         "Unable to find workflow configuration for tag sometag/v1/human")
+
+    @patch('bespin.jobtemplate.DDSFileUtil')
+    def test_dds_file_util_created_when_needed(self, mock_dds_file_util):
+        context = JobCreationContext(Mock())
+        mock_dds_file_util.assert_not_called()
+        self.assertEqual(context.dds_file_util, mock_dds_file_util.return_value)
+        self.assertEqual(context.dds_file_util, mock_dds_file_util.return_value)
+        self.assertEqual(mock_dds_file_util.call_count, 1)
+
+    def test_prefetch_dds_files(self):
+        mock_dds_file_util = Mock()
+        mock_dds_file_util.find_file_for_path.side_effect = lambda path: 'file:' + path
+        context = JobCreationContext(Mock(), mock_dds_file_util)
+
+        context.prefetch_dds_files(['dds://mouse/a.txt', 'dds://mouse/b.txt', 'dds://mouse/a.txt'], max_workers=2)
+
+        self.assertEqual(mock_dds_file_util.find_file_for_path.call_count, 2)
+        self.assertEqual(context.find_file_for_path('dds://mouse/a.txt'), 'file:dds://mouse/a.txt')
+        self.assertEqual(mock_dds_file_util.find_file_for_path.call_count, 2)
+        self.assertEqual(context.find_file_for_path('dds://mouse/c.txt'), 'file:dds://mouse/c.txt')
+        self.assertEqual(mock_dds_file_util.find_file_for_path.call_count, 3)
+
+    def test_shared_dds_files_looked_up_once(self):
+        mock_dds_file_util = Mock()
+        context = JobCreationContext(Mock(), mock_dds_file_util)
+        for sample in ['S1', 'S2']:
+            job_template = JobTemplate(tag='sometag', name='myjob', fund_code='001', job_order={
+                'reference': {'class': 'File', 'path': 'dds://mouse/genome.fa'},
+                'reads': {'class': 'File', 'path': 'dds://mouse/{}.fastq'.format(sample)},
+            })
+            job_template.get_dds_files_details(context)
+
+        self.assertEqual(mock_dds_file_util.find_file_for_path.call_count, 3)
+        self.assertEqual((context.dds_file_cache.hits, context.dds_file_cache.misses), (1, 3))
+
+    def test_prefetch_dds_files_reports_all_missing_files(self):
+        mock_dds_file_util = Mock()
+        mock_dds_file_util.find_file_for_path.side_effect = [
+            FileDoesNotExistException('Missing a.txt'),
+            'file',
+            ProjectDoesNotExistException('Missing rat'),
+        ]
+        context = JobCreationContext(Mock(), mock_dds_file_util)
+
+        with self.assertRaises(UserInputException) as raised_exception:
+            context.prefetch_dds_files(['dds://mouse/a.txt', 'dds://mouse/b.txt', 'dds://rat/c.txt'], max_workers=1)
+        self.assertEqual(str(raised_exception.exception), 'Missing a.txt\nMissing rat')
+
+
 class JobFileLoaderTestCase(TestCase):
     @patch('bespin.jobtemplate.yaml')
     def test_create_job_file(self, mock_yaml):
@@ -294,54 +583,7 @@ class JobFileLoaderTestCase(TestCase):
         self.assertEqual(job_template.job_strategy, 'cloud9')
 
 
-class JobOrderWalkerTestCase(TestCase):
-    def test_walk(self):
-        walker = JobOrderWalker()
-        walker.on_class_value = Mock()
-        walker.on_simple_value = Mock()
-        walker.walk({
-            'color': 'red',
-            'weight': 123,
-            'file1': {
-                'class': 'File',
-                'path': 'somepath'
-            },
-            'file_ary': [
-                {
-                    'class': 'File',
-                    'path': 'somepath1'
-                }, {
-                    'class': 'File',
-                    'path': 'somepath2'
-                },
-            ],
-            'nested': {
-                'a': [{
-                    'class': 'File',
-                    'path': 'somepath3'
-                }]
-            },
-            'plain_path_file': {
-                'class': 'File',
-                'path': '/tmp/data.txt'
-            },
-            'url_file': {
-                'class': 'File',
-                'location': 'https://github.com/datafile1.dat'
-            },
-        })
-
-        walker.on_simple_value.assert_has_calls([
-            call('color', 'red'),
-            call('weight', 123),
-        ])
-        walker.on_class_value.assert_has_calls([
-            call('file1', {'class': 'File', 'path': 'somepath'}),
-            call('file_ary', {'class': 'File', 'path': 'somepath1'}),
-            call('file_ary', {'class': 'File', 'path': 'somepath2'}),
-            call('nested', {'class': 'File', 'path': 'somepath3'}),
-        ])
-
+class FormatFilePathTestCase(TestCase):
     def test_format_file_path(self):
         data = [
             # input    expected
@@ -351,91 +593,69 @@ class JobOrderWalkerTestCase(TestCase):
             ('dds://project/dir/somepath.txt', 'dds_project_dir_somepath.txt'),
         ]
         for input_val, expected_val in data:
-            self.assertEqual(JobOrderWalker.format_file_path(input_val), expected_val)
+            self.assertEqual(format_file_path(input_val), expected_val)
 
 
-class JobOrderFormatFilesTestCase(TestCase):
-    def test_walk(self):
+class CopyOnWriteJobOrderFormatterTestCase(TestCase):
+    def test_format_shares_unchanged_values(self):
         job_order = {
-            'good_str': 'a',
-            'good_int': 123,
-            'good_file': {
-                'class': 'File',
-                'path': 'dds://project1/data/somepath.txt',
-            },
-            'good_str_ary': ['a', 'b', 'c'],
-            'good_file_ary': [{
-                'class': 'File',
-                'path': 'dds://project2/data/somepath2.txt',
-            }],
-            'good_file_dict': {
-                'stuff': {
-                    'class': 'File',
-                    'path': 'dds://project3/data/other/somepath.txt',
-                }
-            },
-            'plain_path_file': {
-                'class': 'File',
-                'path': '/tmp/data.txt'
-            },
-            'url_file': {
-                'class': 'File',
-                'location': 'https://github.com/datafile1.dat'
-            },
+            'metadata': {'lanes': [1, 2, 3]},
+            'samples': [
+                {'name': 'S1', 'reads': {'class': 'File', 'path': 'dds://mouse/s1.fastq'}},
+                {'name': 'S2', 'reads': {'class': 'File', 'path': '/tmp/s2.fastq'}},
+            ],
+            'reference': {'class': 'File', 'path': 'dds://mouse/genome.fa'},
         }
+        original = copy.deepcopy(job_order)
+        formatter = CopyOnWriteJobOrderFormatter()
 
-        formatter = JobOrderFormatFiles()
-        formatter.walk(job_order)
+        formatted = formatter.format(job_order)
 
-        self.assertEqual(job_order['good_str'], 'a')
-        self.assertEqual(job_order['good_int'], 123)
-        self.assertEqual(job_order['good_file'],
-                         {'class': 'File', 'path': 'dds_project1_data_somepath.txt'})
-        self.assertEqual(job_order['good_str_ary'], ['a', 'b', 'c'])
-        self.assertEqual(job_order['good_file_ary'],
-                         [{'class': 'File', 'path': 'dds_project2_data_somepath2.txt'}])
-        self.assertEqual(job_order['good_file_dict'],
-                         {'stuff': {'class': 'File', 'path': 'dds_project3_data_other_somepath.txt'}})
+        self.assertEqual(job_order, original, "The original job order is not modified.")
+        self.assertEqual(formatted, {
+            'metadata': {'lanes': [1, 2, 3]},
+            'samples': [
+                {'name': 'S1', 'reads': {'class': 'File', 'path': 'dds_mouse_s1.fastq'}},
+                {'name': 'S2', 'reads': {'class': 'File', 'path': '/tmp/s2.fastq'}},
+            ],
+            'reference': {'class': 'File', 'path': 'dds_mouse_genome.fa'},
+        })
+        self.assertEqual(formatter.dds_file_paths, ['dds://mouse/s1.fastq', 'dds://mouse/genome.fa'])
+        self.assertIs(formatted['metadata'], job_order['metadata'])
+        self.assertIs(formatted['samples'][1], job_order['samples'][1])
+        self.assertIsNot(formatted['samples'], job_order['samples'])
+        self.assertIsNot(formatted['samples'][0], job_order['samples'][0])
 
+    def test_format_without_dds_files_returns_original(self):
+        job_order = {'name': 'S1', 'reads': [{'class': 'File', 'path': '/tmp/s1.fastq'}]}
+        self.assertIs(CopyOnWriteJobOrderFormatter().format(job_order), job_order)
 
-class JobOrderFileDetailsTestCase(TestCase):
-    @patch('bespin.jobtemplate.DDSFileUtil')
-    def test_walk(self, mock_dds_file_util):
-        mock_dds_file_util.return_value.find_file_for_path.return_value = 'ddsfiledata'
+    def test_format_deeply_nested(self):
+        job_order = {'nested': []}
+        inner = job_order['nested']
+        for _ in range(sys.getrecursionlimit() * 2):
+            inner.append([])
+            inner = inner[0]
+        inner.append({'class': 'File', 'path': 'dds://mouse/deep.txt'})
+        formatter = CopyOnWriteJobOrderFormatter()
+        formatter.format(job_order)
+        self.assertEqual(formatter.dds_file_paths, ['dds://mouse/deep.txt'])
+
+    def test_format_uses_less_memory_than_deepcopy(self):
         job_order = {
-            'good_str': 'a',
-            'good_int': 123,
-            'good_file': {
-                'class': 'File',
-                'path': 'dds://project1/data/somepath.txt',
-            },
-            'good_str_ary': ['a', 'b', 'c'],
-            'good_file_ary': [{
-                'class': 'File',
-                'path': 'dds://project2/data/somepath2.txt',
-            }],
-            'good_file_dict': {
-                'stuff': {
-                    'class': 'File',
-                    'path': 'dds://project3/data/other/somepath.txt',
-                }
-            },
-            'plain_path_file': {
-                'class': 'File',
-                'path': '/tmp/data.txt'
-            },
-            'url_file': {
-                'class': 'File',
-                'location': 'https://github.com/datafile1.dat'
-            },
+            'samples': [{'name': 'S{}'.format(idx), 'qualities': list(range(50)), 'intervals': {'start': idx}}
+                        for idx in range(2000)],
+            'reference': {'class': 'File', 'path': 'dds://mouse/genome.fa'},
         }
-        expected_dds_file_info = [
-            ('ddsfiledata', 'dds_project1_data_somepath.txt'),
-            ('ddsfiledata', 'dds_project2_data_somepath2.txt'),
-            ('ddsfiledata', 'dds_project3_data_other_somepath.txt')
-        ]
 
-        details = JobOrderFileDetails()
-        details.walk(job_order)
+        def measure_peak(format_func):
+            tracemalloc.start()
+            try:
+                format_func()
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
 
-        self.assertEqual(details.dds_files, expected_dds_file_info)
+        deepcopy_peak = measure_peak(lambda: copy.deepcopy(job_order))
+        copy_on_write_peak = measure_peak(lambda: CopyOnWriteJobOrderFormatter().format(job_order))
+        self.assertLess(copy_on_write_peak * 10, deepcopy_peak)
@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from bespin.journal import JobCreationJournal, JournalFile, get_idempotency_key
+from bespin.config import Config
+import os
+import shutil
+import tempfile
+
+
+class GetIdempotencyKeyTestCase(TestCase):
+    def setUp(self):
+        self.config = Config({'url': 'https://bespin.example.com/api', 'token': 'token1'})
+
+    def test_same_for_equal_data(self):
+        self.assertEqual(get_idempotency_key({'name': 'job', 'job_order': {'a': 1, 'b': 2}}, self.config),
+                         get_idempotency_key({'job_order': {'b': 2, 'a': 1}, 'name': 'job'}, self.config))
+        self.assertNotEqual(get_idempotency_key({'name': 'job'}, self.config),
+                            get_idempotency_key({'name': 'job2'}, self.config))
+
+    def test_differs_by_server_and_user(self):
+        key = get_idempotency_key({'name': 'job'}, self.config)
+        other_server_config = Config({'url': 'https://other.example.com/api', 'token': 'token1'})
+        other_user_config = Config({'url': 'https://bespin.example.com/api', 'token': 'token2'})
+        self.assertNotEqual(key, get_idempotency_key({'name': 'job'}, other_server_config))
+        self.assertNotEqual(key, get_idempotency_key({'name': 'job'}, other_user_config))
+        self.assertNotIn('token1', key)
+
+
+class JobCreationJournalTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.journal = JobCreationJournal(os.path.join(self.temp_dir, 'journal'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_record_and_resume(self):
+        journal_file = self.journal.open('abc')
+        self.assertFalse(journal_file.resumed)
+        journal_file.record('stage_group', {'id': 5})
+        journal_file.close()
+
+        journal_file = self.journal.open('abc')
+        self.assertTrue(journal_file.resumed)
+        self.assertEqual(journal_file.get('stage_group'), {'id': 5})
+        self.assertEqual(journal_file.get('job'), None)
+
+    def test_remove(self):
+        journal_file = self.journal.open('abc')
+        journal_file.record('stage_group', {'id': 5})
+        journal_file.remove()
+        self.assertFalse(os.path.exists(journal_file.filename))
+        self.assertFalse(self.journal.open('abc').resumed)
+
+    def test_ignores_incomplete_last_line(self):
+        journal_file = self.journal.open('abc')
+        journal_file.record('stage_group', {'id': 5})
+        journal_file.close()
+        with open(journal_file.filename, 'a') as outfile:
+            outfile.write('{"step": "job", "da')
+
+        self.assertEqual(self.journal.open('abc').steps, {'stage_group': {'id': 5}})
+
+    def test_open_same_key_twice_keeps_second_in_memory(self):
+        first_journal_file = self.journal.open('abc')
+        second_journal_file = self.journal.open('abc')
+        self.assertIsNone(second_journal_file.filename)
+        second_journal_file.record('stage_group', {'id': 6})
+        self.assertEqual(second_journal_file.get('stage_group'), {'id': 6})
+        first_journal_file.close()
+        self.assertIsNotNone(self.journal.open('abc').filename)
+
+    def test_in_memory_journal_file(self):
+        journal_file = JournalFile()
+        journal_file.record('job', {'job': 1})
+        self.assertEqual(journal_file.get('job'), {'job': 1})
+        journal_file.remove()
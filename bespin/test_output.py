@@ -0,0 +1,112 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from bespin.output import StreamingTable, JSONWriter, NDJSONWriter, CSVWriter, format_column_name, format_value
+import io
+import json
+
+
+class FormatTestCase(TestCase):
+    def test_format_column_name(self):
+        self.assertEqual(format_column_name('last_updated'), 'Last Updated')
+
+    def test_format_value(self):
+        self.assertEqual(format_value(None), '')
+        self.assertEqual(format_value(2.0), '2')
+        self.assertEqual(format_value(1.5), '1.5')
+        self.assertEqual(format_value('abc'), 'abc')
+
+
+class StreamingTableTestCase(TestCase):
+    def setUp(self):
+        self.column_names = ['id', 'name', 'state']
+        self.items = [
+            {'id': 1, 'name': 'My job', 'state': 'R'},
+            {'id': 22, 'name': 'x', 'state': None},
+        ]
+
+    def write_table(self, items, **kwargs):
+        outfile = io.StringIO()
+        StreamingTable(self.column_names, items, **kwargs).write(outfile)
+        return outfile.getvalue()
+
+    def test_write(self):
+        self.assertEqual(self.write_table(self.items).split('\n'), [
+            '  Id  Name    State',
+            '----  ------  -------',
+            '   1  My job  R',
+            '  22  x',
+            '',
+        ])
+
+    def test_write_no_items(self):
+        self.assertEqual(self.write_table([]), 'Id    Name    State\n----  ------  -------\n')
+
+    def test_write_sizes_columns_from_sample(self):
+        items = self.items + [{'id': 333, 'name': 'a much longer name', 'state': 'F'}]
+        self.assertEqual(self.write_table(items, sample_size=2).split('\n'), [
+            '  Id  Name    State',
+            '----  ------  -------',
+            '   1  My job  R',
+            '  22  x',
+            ' 333  a much longer name  F',
+            '',
+        ])
+
+    def test_write_two_pass_sizes_columns_from_all_rows(self):
+        items = self.items + [{'id': 333, 'name': 'a much longer name', 'state': 'F'}]
+        self.assertEqual(self.write_table(items, sample_size=2, two_pass=True).split('\n'), [
+            '  Id  Name                State',
+            '----  ------------------  -------',
+            '   1  My job              R',
+            '  22  x',
+            ' 333  a much longer name  F',
+            '',
+        ])
+
+    def test_write_consumes_items_lazily(self):
+        consumed = []
+
+        def generate_items():
+            for idx in range(5):
+                consumed.append(idx)
+                yield {'id': idx, 'name': 'job', 'state': 'R'}
+
+        class RecordingFile(io.StringIO):
+            def write(self, text):
+                lines_written.append(list(consumed))
+                return super(RecordingFile, self).write(text)
+
+        lines_written = []
+        StreamingTable(self.column_names, generate_items(), sample_size=2).write(RecordingFile())
+        # header is written after the two sampled items are read, before the rest are produced
+        self.assertEqual(lines_written[0], [0, 1])
+
+
+class RecordWriterTestCase(TestCase):
+    def setUp(self):
+        self.column_names = ['id', 'workflow tag']
+        self.items = [
+            {'id': 1, 'workflow tag': 'exome', 'other': 'skipped'},
+            {'id': 2, 'workflow tag': None, 'other': 'skipped'},
+        ]
+
+    def write(self, writer_class, items):
+        outfile = io.StringIO()
+        writer_class(self.column_names, items).write(outfile)
+        return outfile.getvalue()
+
+    def test_json_writer(self):
+        output = self.write(JSONWriter, self.items)
+        self.assertEqual(json.loads(output), [
+            {'id': 1, 'workflow tag': 'exome'},
+            {'id': 2, 'workflow tag': None},
+        ])
+        self.assertEqual(json.loads(self.write(JSONWriter, [])), [])
+
+    def test_ndjson_writer(self):
+        output = self.write(NDJSONWriter, self.items)
+        self.assertEqual(output, '{"id": 1, "workflow tag": "exome"}\n{"id": 2, "workflow tag": null}\n')
+
+    def test_csv_writer(self):
+        output = self.write(CSVWriter, self.items)
+        self.assertEqual(output, 'id,workflow tag\n1,exome\n2,\n')
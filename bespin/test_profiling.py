@@ -0,0 +1,70 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from bespin.profiling import run_with_profile, run_with_tracemalloc
+import io
+import os
+import pstats
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+def allocate_and_release():
+    data = [bytearray(1024) for _ in range(2000)]
+    return len(data)
+
+
+class RunWithProfileTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_run_with_profile(self):
+        filename = os.path.join(self.temp_dir, 'out.pstats')
+        outfile = io.StringIO()
+
+        result = run_with_profile(allocate_and_release, filename, 5, outfile)
+
+        self.assertEqual(result, 2000)
+        self.assertIn('allocate_and_release', outfile.getvalue())
+        self.assertIn('Wrote profile to {}'.format(filename), outfile.getvalue())
+        pstats.Stats(filename)
+
+    def test_run_with_profile_includes_worker_threads(self):
+        filename = os.path.join(self.temp_dir, 'out.pstats')
+
+        def run_in_workers():
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                return sum(executor.map(lambda _: allocate_and_release(), range(2)))
+
+        result = run_with_profile(run_in_workers, filename, 50, io.StringIO())
+
+        self.assertEqual(result, 4000)
+        function_names = [function_name for filename, lineno, function_name in pstats.Stats(filename).stats]
+        self.assertIn('allocate_and_release', function_names)
+
+    def test_run_with_profile_writes_stats_when_func_fails(self):
+        filename = os.path.join(self.temp_dir, 'out.pstats')
+
+        def fail():
+            raise ValueError("Failed")
+
+        with self.assertRaises(ValueError):
+            run_with_profile(fail, filename, 5, io.StringIO())
+        self.assertTrue(os.path.exists(filename))
+
+
+class RunWithTracemallocTestCase(TestCase):
+    def test_reports_peak_allocation_site_after_memory_is_released(self):
+        outfile = io.StringIO()
+
+        result = run_with_tracemalloc(allocate_and_release, 3, outfile, poll_interval=0.001)
+
+        self.assertEqual(result, 2000)
+        lines = outfile.getvalue().split('\n')
+        self.assertTrue(lines[0].startswith('Peak traced memory: '))
+        peak_kib = float(lines[0].split(': ')[1].split()[0])
+        self.assertGreater(peak_kib, 2000)
+        self.assertEqual(lines[1], 'Largest allocation sites near the peak:')
@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from bespin.stats import Stats, percentile
+from mock import patch, Mock
+import io
+import json
+
+
+class PercentileTestCase(TestCase):
+    def test_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(percentile(values, 0.5), 50.0)
+        self.assertEqual(percentile(values, 0.95), 95.0)
+        self.assertEqual(percentile([3.0], 0.95), 3.0)
+        self.assertEqual(percentile([1.0, 2.0], 0.0), 1.0)
+
+
+class StatsTestCase(TestCase):
+    def test_disabled_records_nothing(self):
+        stats = Stats()
+        with stats.timer('api GET jobs/'):
+            pass
+        stats.increment('hits')
+        self.assertEqual(stats.to_dict(), {'timers': [], 'counters': []})
+
+    def test_recording(self):
+        stats = Stats()
+        self.assertFalse(stats.recording)
+        with patch('bespin.stats.TRACER', Mock(enabled=True)):
+            self.assertTrue(stats.recording)
+        stats.enable()
+        self.assertTrue(stats.recording)
+
+    def test_timer_and_counters(self):
+        stats = Stats()
+        stats.enable()
+        with stats.timer('api GET jobs/') as timer_details:
+            timer_details['bytes'] = 100
+        stats.add_time('api GET jobs/', 0.5, 50)
+        stats.add_time('dukeds get_projects', 0.25)
+        stats.increment('hits')
+        stats.increment('hits', 2)
+
+        timers = stats.get_timer_summaries()
+        self.assertEqual([(timer['name'], timer['count'], timer['bytes']) for timer in timers], [
+            ('api GET jobs/', 2, 150),
+            ('dukeds get_projects', 1, None),
+        ])
+        self.assertEqual(timers[1]['total_seconds'], 0.25)
+        self.assertEqual(timers[1]['p95_ms'], 250.0)
+        self.assertEqual(timers[0]['max_ms'], 500.0)
+        self.assertEqual(stats.get_counters(), [{'name': 'hits', 'value': 3}])
+
+    def test_timer_records_failures(self):
+        stats = Stats()
+        stats.enable()
+        with self.assertRaises(ValueError):
+            with stats.timer('workflow load'):
+                raise ValueError()
+        self.assertEqual(stats.get_timer_summaries()[0]['count'], 1)
+
+    def test_write_json_and_table(self):
+        stats = Stats()
+        stats.enable()
+        stats.add_time('yaml load', 0.002)
+        stats.increment('dukeds file cache hits', 4)
+
+        outfile = io.StringIO()
+        stats.write_json(outfile)
+        self.assertEqual(json.loads(outfile.getvalue()), stats.to_dict())
+
+        outfile = io.StringIO()
+        stats.write_table(outfile)
+        self.assertEqual(outfile.getvalue().split('\n'), [
+            'Name         Count    Total Seconds    Mean Ms    P50 Ms    P95 Ms    Max Ms  Bytes',
+            '---------  -------  ---------------  ---------  --------  --------  --------  -------',
+            'yaml load        1            0.002          2         2         2         2',
+            '',
+            'Name                      Value',
+            '----------------------  -------',
+            'dukeds file cache hits        4',
+            '',
+        ])
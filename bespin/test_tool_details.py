@@ -1,7 +1,15 @@
 from unittest import TestCase
 from unittest.mock import patch, call, Mock
+import json
+import os
+import shutil
+import tempfile
+import yaml
 
-from bespin.tool_details import DockerToolDetail, SoftwareToolDetail, ToolDetailsBuilder, ToolDetails
+from bespin.tool_details import DockerToolDetail, SoftwareToolDetail, ToolDetailsBuilder, ToolDetails, \
+    ToolDetailsCache, ToolDetailsDiff, TOOL_DETAILS_CACHE_FORMAT_VERSION
+from bespin.test_cwlmetadata import WORKFLOW_CWL, SUBWORKFLOW_CWL, ALIGN_CWL, ECHO_CWL
+from bespin.workflow import CWLWorkflowVersion
 
 
 class DockerToolDetailTestCase(TestCase):
@@ -141,6 +149,112 @@ class ToolDetailsBuilderTestCase(TestCase):
                            'packages': [{'package': 'abc-tk', 'versions': ['1.0'], 'citation': 'https://example.org'}]}]
         self.assertEqual(built, expected_built)
 
+    def test_build_keeps_first_visit_order(self):
+        # scattered workflows visit the same tools many times, in a different order on each pass
+        tool_numbers = [3, 1, 3, 2, 1, 0, 2, 3] * 625
+        nodes = [{
+            'class': 'CommandLineTool',
+            'id': '/pre/tool{}.cwl'.format(tool_number),
+            'requirements': [{'class': 'DockerRequirement', 'dockerPull': 'orgname/tool{}:1.0'.format(tool_number)}],
+        } for tool_number in tool_numbers]
+        self.assertEqual(len(nodes), 5000)
+        visitor = Mock()
+        visitor.visit.side_effect = lambda op: [op(node) for node in nodes]
+        builder = ToolDetailsBuilder(self.prefix)
+        builder.accept(visitor)
+        built = builder.build()
+        self.assertEqual([detail['tool_name'] for detail in built],
+                         ['tool3.cwl', 'tool1.cwl', 'tool2.cwl', 'tool0.cwl'])
+        self.assertEqual(built[0]['docker_images'], ['orgname/tool3:1.0'])
+
+    def test_extract_uses_cached_tool_info(self):
+        cache = Mock()
+        cache.get.return_value = {'id_fragment': '', 'tool_info': {'docker': [{'image_name': 'cached:1.0'}]}}
+        builder = ToolDetailsBuilder(self.prefix, cache, {'/pre/tool.cwl': 'abc123'})
+        builder.extract_tool_details({'class': 'CommandLineTool', 'id': '/pre/tool.cwl',
+                                      'requirements': [self.docker_req]})
+        self.assertEqual(cache.get.call_args, call('abc123'))
+        self.assertFalse(cache.put.called)
+        self.assertEqual(builder.build()[0]['docker_images'], ['cached:1.0'])
+
+    def test_extract_adds_tool_info_to_cache(self):
+        cache = Mock()
+        cache.get.return_value = None
+        builder = ToolDetailsBuilder(self.prefix, cache, {'/pre/packed.cwl#tool.cwl': 'abc123'})
+        builder.extract_tool_details({'class': 'CommandLineTool', 'id': '/pre/packed.cwl#tool.cwl',
+                                      'requirements': [self.docker_req]})
+        self.assertEqual(cache.put.call_args, call('abc123', 'tool.cwl', {'docker': [{'image_name': 'orgname/image:1.0'}]}))
+
+    def test_extract_without_content_hash_skips_cache(self):
+        cache = Mock()
+        builder = ToolDetailsBuilder(self.prefix, cache, {})
+        builder.extract_tool_details({'class': 'CommandLineTool', 'id': '/pre/tool.cwl',
+                                      'requirements': [self.docker_req]})
+        self.assertFalse(cache.get.called)
+        self.assertFalse(cache.put.called)
+        self.assertEqual(builder.build()[0]['docker_images'], ['orgname/image:1.0'])
+
+
+class ToolDetailsCacheTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_put_save_and_get(self):
+        cache = ToolDetailsCache(self.filename)
+        self.assertIsNone(cache.get('abc123'))
+        cache.put('abc123', '', {'docker': [{'image_name': 'orgname/image:1.0'}]})
+        cache.save()
+        self.assertEqual(ToolDetailsCache(self.filename).get('abc123'),
+                         {'id_fragment': '', 'tool_info': {'docker': [{'image_name': 'orgname/image:1.0'}]}})
+
+    def test_save_skips_unchanged(self):
+        ToolDetailsCache(self.filename).save()
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_ignores_other_format_versions(self):
+        with open(self.filename, 'w') as outfile:
+            json.dump({'version': TOOL_DETAILS_CACHE_FORMAT_VERSION + 1,
+                       'records': {'abc123': {'id_fragment': '', 'tool_info': {}}}}, outfile)
+        self.assertIsNone(ToolDetailsCache(self.filename).get('abc123'))
+
+
+class ToolDetailsDiffTestCase(TestCase):
+    def test_get_column_data(self):
+        old_contents = [
+            {'tool_name': 'align.cwl', 'docker_images': ['org/aligner:1.2'], 'packages': [
+                {'package': 'bwa', 'versions': ['0.7.17'], 'citation': None},
+                {'package': 'samtools', 'versions': ['1.9'], 'citation': None},
+            ]},
+            {'tool_name': 'echo.cwl', 'docker_images': ['ubuntu:18.04'], 'packages': []},
+            {'tool_name': 'old.cwl', 'docker_images': ['old:1.0'], 'packages': []},
+        ]
+        new_contents = [
+            {'tool_name': 'align.cwl', 'docker_images': ['org/aligner:1.3'], 'packages': [
+                {'package': 'bwa', 'versions': ['0.7.18'], 'citation': None},
+                {'package': 'samtools', 'versions': ['1.9'], 'citation': None},
+                {'package': 'picard', 'versions': ['2.0'], 'citation': None},
+            ]},
+            {'tool_name': 'echo.cwl', 'docker_images': ['ubuntu:18.04'], 'packages': []},
+            {'tool_name': 'new.cwl', 'docker_images': ['new:1.0'], 'packages': []},
+        ]
+        diff = ToolDetailsDiff(old_contents, new_contents)
+        self.assertEqual(diff.column_names, ['tool_name', 'requirement', 'old', 'new'])
+        self.assertEqual(list(diff.get_column_data()), [
+            {'tool_name': 'align.cwl', 'requirement': 'docker', 'old': 'org/aligner:1.2', 'new': 'org/aligner:1.3'},
+            {'tool_name': 'align.cwl', 'requirement': 'bwa', 'old': '0.7.17', 'new': '0.7.18'},
+            {'tool_name': 'align.cwl', 'requirement': 'picard', 'old': None, 'new': '2.0'},
+            {'tool_name': 'old.cwl', 'requirement': 'docker', 'old': 'old:1.0', 'new': None},
+            {'tool_name': 'new.cwl', 'requirement': 'docker', 'old': None, 'new': 'new:1.0'},
+        ])
+
+    def test_no_changes(self):
+        contents = [{'tool_name': 'echo.cwl', 'docker_images': ['ubuntu:18.04'], 'packages': []}]
+        self.assertEqual(list(ToolDetailsDiff(contents, contents).get_column_data()), [])
+
 
 class ToolDetailsTestCase(TestCase):
     def setUp(self):
@@ -154,9 +268,10 @@ class ToolDetailsTestCase(TestCase):
         self.assertEqual(tool_details.version, mock_parser.return_value.version)
         self.assertEqual(tool_details.tag, mock_parser.return_value.tag)
         self.assertEqual(tool_details.contents, mock_builder.return_value.build.return_value)
-        self.assertEqual(mock_loader.call_args, call(self.workflow_version))
+        self.assertEqual(mock_loader.call_args, call(self.workflow_version, None))
         self.assertEqual(mock_parser.call_args, call(mock_loader.return_value.load.return_value))
-        self.assertEqual(mock_builder.call_args, call(mock_loader.return_value.get_prefix.return_value))
+        self.assertEqual(mock_builder.call_args, call(mock_loader.return_value.get_prefix.return_value, None,
+                                                      mock_parser.return_value.loaded_workflow.content_hashes))
         self.assertEqual(mock_builder.return_value.accept.call_args, call(mock_parser.return_value.loaded_workflow))
 
     @patch('bespin.tool_details.BespinWorkflowLoader')
@@ -171,3 +286,59 @@ class ToolDetailsTestCase(TestCase):
                          call(tool_details.tag, tool_details.version))
         self.assertEqual(mock_api.workflow_version_tool_details_post.call_args, call('56', tool_details.contents))
         self.assertEqual(result, mock_api.workflow_version_tool_details_post.return_value)
+
+
+class IncrementalToolDetailsTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = os.path.realpath(tempfile.mkdtemp())
+        self.cache = ToolDetailsCache(os.path.join(self.temp_dir, 'cache.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_workflow_version(self, version, align_cwl):
+        workflow_dir = os.path.join(self.temp_dir, version)
+        os.makedirs(os.path.join(workflow_dir, 'tools'))
+        for path, content in [('workflow.cwl', WORKFLOW_CWL), ('subworkflow.cwl', SUBWORKFLOW_CWL),
+                              ('tools/align.cwl', align_cwl), ('tools/echo.cwl', ECHO_CWL)]:
+            with open(os.path.join(workflow_dir, path), 'w') as outfile:
+                outfile.write(content)
+        return CWLWorkflowVersion('file://' + os.path.join(workflow_dir, 'workflow.cwl'), 'direct', None,
+                                  strict=False)
+
+    def test_only_changed_tools_are_parsed(self):
+        old_version = self.write_workflow_version('v1', ALIGN_CWL)
+        new_version = self.write_workflow_version('v2', ALIGN_CWL.replace('org/aligner:1.2', 'org/aligner:1.3'))
+        old_contents = ToolDetails(old_version, self.cache).contents
+        self.cache.save()
+
+        with patch('bespin.cwlmetadata.yaml.safe_load', side_effect=yaml.safe_load) as mock_safe_load:
+            new_contents = ToolDetails(new_version, ToolDetailsCache(self.cache.filename)).contents
+        parsed = [args[0] for args, kwargs in mock_safe_load.call_args_list]
+        self.assertEqual(len(parsed), 3)
+        self.assertNotIn(ECHO_CWL, parsed)
+        self.assertEqual(new_contents, ToolDetails(new_version).contents)
+        self.assertEqual(list(ToolDetailsDiff(old_contents, new_contents).get_column_data()), [
+            {'tool_name': 'tools/align.cwl', 'requirement': 'docker', 'old': 'org/aligner:1.2',
+             'new': 'org/aligner:1.3'},
+        ])
+
+    def test_changed_imported_requirement_is_parsed(self):
+        workflow_version = self.write_workflow_version('v1', ALIGN_CWL)
+        workflow_dir = os.path.join(self.temp_dir, 'v1')
+        docker_path = os.path.join(workflow_dir, 'docker.yml')
+        with open(os.path.join(workflow_dir, 'tools', 'echo.cwl'), 'w') as outfile:
+            outfile.write(ECHO_CWL.replace('hints:\n  - class: DockerRequirement\n    dockerPull: ubuntu:18.04',
+                                           'hints:\n  - $import: ../docker.yml'))
+        with open(docker_path, 'w') as outfile:
+            outfile.write('class: DockerRequirement\ndockerPull: example/tool:1.0\n')
+        ToolDetails(workflow_version, self.cache).contents
+        self.cache.save()
+
+        with open(docker_path, 'w') as outfile:
+            outfile.write('class: DockerRequirement\ndockerPull: example/tool:2.0\n')
+        contents = ToolDetails(workflow_version, ToolDetailsCache(self.cache.filename)).contents
+
+        echo_details = [details for details in contents if details['tool_name'] == 'tools/echo.cwl'][0]
+        self.assertEqual(echo_details['docker_images'], ['example/tool:2.0'])
+        self.assertEqual(contents, ToolDetails(workflow_version).contents)
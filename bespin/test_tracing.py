@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from bespin.tracing import Tracer
+from bespin.stats import Stats
+from mock import patch
+import io
+import json
+import threading
+
+
+class TracerTestCase(TestCase):
+    def get_spans(self, tracer):
+        return dict((event['name'], event) for event in tracer.get_events() if event['ph'] == 'X')
+
+    def test_disabled_records_nothing(self):
+        tracer = Tracer()
+        with tracer.span('api GET /jobs/'):
+            pass
+        self.assertEqual(tracer.get_events(), [])
+
+    def test_nested_spans(self):
+        tracer = Tracer()
+        tracer.enable()
+        with tracer.span('job create'):
+            with tracer.span('api POST /stage-groups/', {'bytes': 10}):
+                pass
+        spans = self.get_spans(tracer)
+        parent = spans['job create']
+        child = spans['api POST /stage-groups/']
+        self.assertEqual(parent['ph'], 'X')
+        self.assertEqual(parent['cat'], 'job')
+        self.assertEqual(parent['args']['parent_id'], None)
+        self.assertEqual(child['cat'], 'api')
+        self.assertEqual(child['args']['parent_id'], parent['args']['span_id'])
+        self.assertEqual(child['args']['bytes'], 10)
+        self.assertEqual(child['tid'], threading.current_thread().ident)
+        self.assertGreaterEqual(child['ts'], parent['ts'])
+        self.assertLessEqual(child['ts'] + child['dur'], parent['ts'] + parent['dur'] + 1)
+
+    def test_span_recorded_when_body_fails(self):
+        tracer = Tracer()
+        tracer.enable()
+        with self.assertRaises(ValueError):
+            with tracer.span('job create'):
+                raise ValueError("Failed")
+        self.assertEqual(list(self.get_spans(tracer).keys()), ['job create'])
+        self.assertEqual(tracer.current_span_id(), None)
+
+    def test_bind_sets_parent_in_worker_thread(self):
+        tracer = Tracer()
+        tracer.enable()
+
+        def lookup():
+            with tracer.span('dukeds get_child_for_path'):
+                pass
+
+        with tracer.span('job create'):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(tracer.bind(lookup)).result()
+                executor.submit(lookup).result()
+        parent_id = self.get_spans(tracer)['job create']['args']['span_id']
+        lookups = [event for event in tracer.get_events() if event['name'] == 'dukeds get_child_for_path']
+        self.assertEqual([event['args']['parent_id'] for event in lookups], [parent_id, None])
+        self.assertNotEqual(lookups[0]['tid'], threading.current_thread().ident)
+
+    def test_write_chrome_trace(self):
+        tracer = Tracer()
+        tracer.enable()
+        with tracer.span('workflow download'):
+            pass
+        outfile = io.StringIO()
+        tracer.write_chrome_trace(outfile)
+        trace = json.loads(outfile.getvalue())
+        self.assertEqual(trace['displayTimeUnit'], 'ms')
+        self.assertEqual([event['ph'] for event in trace['traceEvents']], ['X', 'M'])
+        self.assertEqual(trace['traceEvents'][1]['args'], {'name': threading.current_thread().name})
+
+    def test_stats_timer_records_span(self):
+        tracer = Tracer()
+        tracer.enable()
+        stats = Stats()
+        with patch('bespin.stats.TRACER', tracer):
+            with stats.timer('api GET /jobs/') as timer_details:
+                timer_details['bytes'] = 100
+        self.assertEqual(self.get_spans(tracer)['api GET /jobs/']['args']['bytes'], 100)
+        self.assertEqual(stats.to_dict(), {'timers': [], 'counters': []})
@@ -30,7 +30,8 @@ class BespinWorkflowLoaderTestCase(TestCase):
     def setUp(self):
         self.workflow_version = create_autospec(CWLWorkflowVersion,
                                                 url='http://example.com/workflow.cwl',
-                                                workflow_type='dummy')
+                                                workflow_type='dummy',
+                                                strict=True)
         self.packed_workflow_version = create_autospec(CWLWorkflowVersion,
                                                        url='http://example.com/packed.cwl',
                                                        workflow_type=BespinWorkflowLoader.TYPE_PACKED,
@@ -120,6 +121,20 @@ class BespinWorkflowLoaderTestCase(TestCase):
         self.assertEqual(loaded, mock_load_tool.return_value)
         self.assertEqual(mock_load_tool.call_args, call('tool-path', mock_context.return_value))
 
+    @patch('bespin.workflow.load_cwl_metadata')
+    @patch('bespin.workflow.load_tool')
+    @patch('bespin.workflow.BespinWorkflowLoader._get_tool_path')
+    def test__load_downloaded_workflow_not_strict(self, mock_get_tool_path, mock_load_tool, mock_load_cwl_metadata,
+                                                  mock_mkdtemp):
+        self.setup_mkdtemp(mock_mkdtemp)
+        mock_get_tool_path.return_value = 'tool-path'
+        self.workflow_version.strict = False
+        loader = BespinWorkflowLoader(self.workflow_version)
+        loaded = loader._load_downloaded_workflow()
+        self.assertEqual(loaded, mock_load_cwl_metadata.return_value)
+        self.assertEqual(mock_load_cwl_metadata.call_args, call('tool-path', None))
+        self.assertFalse(mock_load_tool.called)
+
     def test__get_tool_path_packed(self, mock_mkdtemp):
         self.setup_mkdtemp(mock_mkdtemp)
         loader = BespinWorkflowLoader(self.packed_workflow_version)
@@ -5,8 +5,20 @@ documented at https://www.commonwl.org/v1.0/CommandLineTool.html, namely DockerR
 and SoftwarePackage
 
 """
+from collections import OrderedDict
+from six.moves.urllib.parse import urldefrag
+import copy
+import json
+import os
+import tempfile
+import threading
+from bespin.stats import STATS
 from bespin.workflow import BespinWorkflowLoader, BespinWorkflowParser, remove_prefix
 
+TOOL_DETAILS_CACHE_FILENAME_ENV = 'BESPIN_TOOL_DETAILS_CACHE'
+DEFAULT_TOOL_DETAILS_CACHE_FILENAME = '~/.bespin-tool-details-cache.json'
+TOOL_DETAILS_CACHE_FORMAT_VERSION = 1
+
 
 class DockerToolDetail(object):
     """
@@ -49,21 +61,122 @@ class SoftwareToolDetail(object):
         info_dict['software'] = software_info
 
 
+class ToolDetailsCache(object):
+    """
+    File of the tool info extracted from CommandLineTools keyed by the sha256 of the tool's CWL, so tools that did
+    not change between workflow versions are not parsed or extracted again. Safe to use from multiple threads.
+    """
+    def __init__(self, filename=os.environ.get(TOOL_DETAILS_CACHE_FILENAME_ENV, DEFAULT_TOOL_DETAILS_CACHE_FILENAME)):
+        """
+        :param filename: str: path of the JSON file used to store records
+        """
+        self.filename = os.path.expanduser(filename)
+        self._records = None
+        self._added_records = {}
+        self._changed = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._records is None:
+            self._records = {}
+            try:
+                with open(self.filename) as infile:
+                    data = json.load(infile)
+                if data.get('version') == TOOL_DETAILS_CACHE_FORMAT_VERSION:
+                    self._records = data['records']
+            except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+                # a missing or unreadable cache is the same as an empty one
+                self._records = {}
+        return self._records
+
+    def get(self, content_hash):
+        """
+        :param content_hash: str: sha256 of the tool's CWL
+        :return: dict: record with the 'id_fragment' and 'tool_info' of the tool or None if it is not cached
+        """
+        with self._lock:
+            record = self._load().get(content_hash)
+        if record is None:
+            STATS.increment('tool details cache misses')
+        else:
+            STATS.increment('tool details cache hits')
+        return record
+
+    def put(self, content_hash, id_fragment, tool_info):
+        """
+        :param content_hash: str: sha256 of the tool's CWL
+        :param id_fragment: str: fragment of the tool's id, empty when the tool's id is its file
+        :param tool_info: dict: tool info extracted from the tool's requirements and hints
+        """
+        self.add_records({content_hash: {'id_fragment': id_fragment, 'tool_info': tool_info}})
+
+    def add_records(self, records):
+        """
+        :param records: dict: content hash to record, such as the added_records of a cache used by another process
+        """
+        with self._lock:
+            self._load().update(records)
+            self._added_records.update(records)
+            self._changed = True
+
+    @property
+    def added_records(self):
+        """
+        :return: dict: content hash to record for the records added since this cache was created
+        """
+        with self._lock:
+            return dict(self._added_records)
+
+    def save(self):
+        """
+        Write the records to the cache file if any changed, replacing the file in a single step.
+        """
+        with self._lock:
+            if not self._changed:
+                return
+            data = {
+                'version': TOOL_DETAILS_CACHE_FORMAT_VERSION,
+                'records': self._records,
+            }
+            directory = os.path.dirname(self.filename) or '.'
+            with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as outfile:
+                json.dump(data, outfile)
+            os.replace(outfile.name, self.filename)
+            self._changed = False
+
+
 class ToolDetailsBuilder(object):
     """
     Tallies a list of tool details, using a loaded cwltool workflow's visit() method to pull details out of
-    every node in the workflow graph of class CommandLineTool
+    every node in the workflow graph of class CommandLineTool.
+    Details are indexed by tool name in the order tools are first found, so checking for a tool already
+    included by an earlier node does not depend on the number of tools.
     """
 
-    def __init__(self, prefix):
-        self.details = []
+    def __init__(self, prefix, cache=None, content_hashes=None):
+        """
+        :param prefix: str: URI prefix removed from tool ids to create tool names
+        :param cache: ToolDetailsCache: tool info is read from and added to this cache when not None
+        :param content_hashes: dict: tool id to the content hash of the tool, tools without one are not cached
+        """
+        self._details_by_tool_name = OrderedDict()
         self.prefix = prefix
+        self.cache = cache
+        self.content_hashes = content_hashes or {}
+
+    @property
+    def details(self):
+        return list(self._details_by_tool_name.values())
+
+    @details.setter
+    def details(self, details):
+        self._details_by_tool_name = OrderedDict((detail['tool_name'], detail) for detail in details)
 
     def accept(self, visitor):
         visitor.visit(self.extract_tool_details)
 
     def tool_exists(self, tool_name):
-        return tool_name in [detail['tool_name'] for detail in self.details]
+        return tool_name in self._details_by_tool_name
 
     @staticmethod
     def extract_requirements(requirements, tool_info):
@@ -81,6 +194,20 @@ class ToolDetailsBuilder(object):
                 tool_detail = SoftwareToolDetail(req)
                 tool_detail.add_info(tool_info)
 
+    def extract_tool_info(self, node):
+        """
+        :param node: A CWL object of class CommandLineTool
+        :return: dict: tool info from the requirements and hints of the node, empty when it has none
+        """
+        tool_info = {}
+        reqs = node.get('requirements')
+        if reqs:
+            self.extract_requirements(reqs, tool_info)
+        hints = node.get('hints')
+        if hints:
+            self.extract_requirements(hints, tool_info)
+        return tool_info
+
     def extract_tool_details(self, node):
         """
         Visitor function to handle a node in the CWL workflow graph and update self.details
@@ -94,15 +221,16 @@ class ToolDetailsBuilder(object):
             # Avoid duplicating tools included multiple times in the same workflow
             if self.tool_exists(tool_name):
                 return
-            tool_info = {}
-            reqs = node.get('requirements')
-            if reqs:
-                self.extract_requirements(reqs, tool_info)
-            hints = node.get('hints')
-            if hints:
-                self.extract_requirements(hints, tool_info)
+            content_hash = self.content_hashes.get(node.get('id'))
+            cached = self.cache.get(content_hash) if self.cache is not None and content_hash else None
+            if cached is not None:
+                tool_info = copy.deepcopy(cached['tool_info'])
+            else:
+                tool_info = self.extract_tool_info(node)
+                if self.cache is not None and content_hash:
+                    self.cache.put(content_hash, urldefrag(node.get('id'))[1], tool_info)
             if tool_info: # only add if we have data
-                self.details.append({'tool_name': tool_name, 'tool_info': tool_info})
+                self._details_by_tool_name[tool_name] = {'tool_name': tool_name, 'tool_info': tool_info}
 
     def build(self):
         """
@@ -110,7 +238,7 @@ class ToolDetailsBuilder(object):
         :return: A list of dictionaries, one for each tool in self.details
         """
         details_list = []
-        for detail in self.details:
+        for detail in self._details_by_tool_name.values():
             tool_name = detail.get('tool_name', '')
             docker_infos_list = detail.get('tool_info', {}).get('docker', {})
             docker_images = [d.get('image_name','') for d in docker_infos_list]
@@ -127,16 +255,75 @@ class ToolDetailsBuilder(object):
         return details_list
 
 
+class ToolDetailsDiff(object):
+    """
+    Docker images and package versions that differ between the tool details of two workflow versions.
+    Each change is a row with the tool name, 'docker' or the package name, and the old and new values,
+    where old is None for added tools and packages and new is None for removed ones.
+    """
+
+    DOCKER_REQUIREMENT = 'docker'
+
+    def __init__(self, old_contents, new_contents):
+        """
+        :param old_contents: [dict]: built tool details of the old workflow version
+        :param new_contents: [dict]: built tool details of the new workflow version
+        """
+        self.old_contents = old_contents
+        self.new_contents = new_contents
+        self.column_names = ['tool_name', 'requirement', 'old', 'new']
+
+    @staticmethod
+    def _get_requirement_values(detail):
+        """
+        :param detail: dict: built tool detail
+        :return: OrderedDict: 'docker' and package names to their images or versions joined into a string
+        """
+        values = OrderedDict()
+        if detail.get('docker_images'):
+            values[ToolDetailsDiff.DOCKER_REQUIREMENT] = ', '.join(detail['docker_images'])
+        for package in detail.get('packages', []):
+            values[package['package']] = ', '.join(package.get('versions') or [])
+        return values
+
+    def get_column_data(self):
+        old_details = OrderedDict((detail['tool_name'], detail) for detail in self.old_contents)
+        new_details = OrderedDict((detail['tool_name'], detail) for detail in self.new_contents)
+        tool_names = list(old_details) + [tool_name for tool_name in new_details if tool_name not in old_details]
+        for tool_name in tool_names:
+            old_values = self._get_requirement_values(old_details.get(tool_name, {}))
+            new_values = self._get_requirement_values(new_details.get(tool_name, {}))
+            requirements = list(old_values) + [requirement for requirement in new_values
+                                               if requirement not in old_values]
+            for requirement in requirements:
+                old_value = old_values.get(requirement)
+                new_value = new_values.get(requirement)
+                if old_value != new_value:
+                    yield {
+                        'tool_name': tool_name,
+                        'requirement': requirement,
+                        'old': old_value,
+                        'new': new_value,
+                    }
+
+
 class ToolDetails(object):
     """
     Given a CWLWorkflowVersion, fetch, load, and parse it. Then build a list of tool details from it.
     """
 
-    def __init__(self, workflow_version):
-        loader = BespinWorkflowLoader(workflow_version)
+    def __init__(self, workflow_version, cache=None):
+        """
+        :param workflow_version: CWLWorkflowVersion: workflow to extract tool details from
+        :param cache: ToolDetailsCache: reuse the details of tools that have not changed since they were cached,
+        only used when the workflow version is not strict since cwltool loads every tool
+        """
+        loader = BespinWorkflowLoader(workflow_version, cache)
         parser = BespinWorkflowParser(loader.load())
         prefix = loader.get_prefix()
-        builder = ToolDetailsBuilder(prefix)
+        # processes loaded by cwltool have no content hashes
+        content_hashes = getattr(parser.loaded_workflow, 'content_hashes', None)
+        builder = ToolDetailsBuilder(prefix, cache, content_hashes)
         builder.accept(parser.loaded_workflow)
         self.version = parser.version
         self.tag = parser.tag
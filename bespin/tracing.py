@@ -0,0 +1,135 @@
+"""
+Records spans with parent/child relationships and thread ids, written as a Chrome trace-event JSON file
+that can be opened offline in chrome://tracing or Perfetto (see the global --trace option).
+Every STATS timer is also a span, so nothing is recorded until TRACER is enabled.
+"""
+from contextlib import contextmanager
+import itertools
+import json
+import os
+import threading
+import time
+
+SPAN_PHASE_COMPLETE = 'X'
+SPAN_PHASE_METADATA = 'M'
+
+
+class Tracer(object):
+    """
+    Collects completed spans from any thread.
+    Spans opened on a thread are children of the span open on that thread when they start.
+    Use bind to make spans in worker threads children of the span that submitted the work.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._span_ids = itertools.count(1)
+        self._events = []
+        self._thread_names = {}
+        self._start = time.time()
+
+    def enable(self):
+        self._start = time.time()
+        self.enabled = True
+
+    def reset(self):
+        with self._lock:
+            self._events = []
+            self._thread_names = {}
+
+    def _get_span_stack(self):
+        span_stack = getattr(self._local, 'span_stack', None)
+        if span_stack is None:
+            span_stack = []
+            self._local.span_stack = span_stack
+        return span_stack
+
+    def current_span_id(self):
+        span_stack = self._get_span_stack()
+        if span_stack:
+            return span_stack[-1]
+        return None
+
+    @contextmanager
+    def span(self, name, args=None):
+        """
+        Record the body of a with statement as a span
+        :param name: str: name of the span, the first word is used as its category
+        :param args: dict: values to include with the span, read when the span ends
+        """
+        if not self.enabled:
+            yield
+            return
+        span_stack = self._get_span_stack()
+        parent_id = span_stack[-1] if span_stack else None
+        with self._lock:
+            span_id = next(self._span_ids)
+        span_stack.append(span_id)
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            span_stack.pop()
+            self._add_span(name, span_id, parent_id, start, end, args)
+
+    def _add_span(self, name, span_id, parent_id, start, end, args):
+        thread = threading.current_thread()
+        span_args = {'span_id': span_id, 'parent_id': parent_id}
+        if args:
+            span_args.update(args)
+        event = {
+            'name': name,
+            'cat': name.split(' ', 1)[0],
+            'ph': SPAN_PHASE_COMPLETE,
+            'ts': int((start - self._start) * 1000000),
+            'dur': int((end - start) * 1000000),
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': span_args,
+        }
+        with self._lock:
+            self._events.append(event)
+            self._thread_names[thread.ident] = thread.name
+
+    def bind(self, func):
+        """
+        Wrap func so spans it opens on another thread are children of the span open now
+        :param func: function: work that will be run on another thread
+        :return: function: wrapper accepting the same arguments as func
+        """
+        if not self.enabled:
+            return func
+        parent_id = self.current_span_id()
+
+        def bound_func(*args, **kwargs):
+            span_stack = self._get_span_stack()
+            previous_span_stack = list(span_stack)
+            span_stack[:] = [parent_id] if parent_id else []
+            try:
+                return func(*args, **kwargs)
+            finally:
+                span_stack[:] = previous_span_stack
+        return bound_func
+
+    def get_events(self):
+        """
+        :return: [dict]: Chrome trace events for every span plus thread name metadata
+        """
+        with self._lock:
+            events = list(self._events)
+            thread_names = dict(self._thread_names)
+        pid = os.getpid()
+        for tid, thread_name in sorted(thread_names.items()):
+            events.append({'name': 'thread_name', 'ph': SPAN_PHASE_METADATA, 'pid': pid, 'tid': tid,
+                           'args': {'name': thread_name}})
+        return events
+
+    def write_chrome_trace(self, outfile):
+        json.dump({'traceEvents': self.get_events(), 'displayTimeUnit': 'ms'}, outfile)
+        outfile.write('\n')
+
+
+# process wide tracer shared by all bespin modules
+TRACER = Tracer()
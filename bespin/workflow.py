@@ -11,7 +11,9 @@ from cwltool.load_tool import load_tool
 from cwltool.resolver import tool_resolver
 from cwltool.workflow import default_make_tool
 
+from bespin.cwlmetadata import load_cwl_metadata
 from bespin.exceptions import InvalidWorkflowFileException
+from bespin.stats import STATS
 
 log = logging.getLogger(__name__)
 
@@ -25,19 +27,22 @@ def remove_prefix(text, prefix):
 class BespinWorkflowLoader(object):
     """
     Downloads, extracts, and loads workflows from a URL - packed or zipped.
+    Strict workflow versions are loaded and validated by cwltool, others only have their metadata read by
+    bespin.cwlmetadata which is much faster.
     """
 
     TYPE_PACKED = 'packed'
     TYPE_ZIPPED = 'zipped'
     TYPE_DIRECT = 'direct'
 
-    def __init__(self, workflow_version):
+    def __init__(self, workflow_version, tool_cache=None):
         """
         Create a workflow loader
         :param workflow_version: CWLWorkflowVersion containing the workflow_type and workflow_path
-        :param download_dir: Optional path to a download directory. If None, a temp directory is used
+        :param tool_cache: ToolDetailsCache: tools that are not parsed again when the workflow version is not strict
         """
         self.workflow_version = workflow_version
+        self.tool_cache = tool_cache
         if not self.workflow_version.workflow_type == self.TYPE_DIRECT:
             self.download_dir = os.path.realpath(tempfile.mkdtemp())
             self.download_path = os.path.join(self.download_dir, os.path.basename(workflow_version.url))
@@ -48,9 +53,12 @@ class BespinWorkflowLoader(object):
         the temporary directory.
         :return: loaded CWL workflow
         """
-        self._download_workflow()
-        self._handle_download()
-        loaded = self._load_downloaded_workflow()
+        with STATS.timer('workflow download'):
+            self._download_workflow()
+        with STATS.timer('workflow extract'):
+            self._handle_download()
+        with STATS.timer('workflow load'):
+            loaded = self._load_downloaded_workflow()
         self._cleanup()
         return loaded
 
@@ -64,6 +72,9 @@ class BespinWorkflowLoader(object):
                 z.extractall(self.download_dir)
 
     def _load_downloaded_workflow(self):
+        tool_path = self._get_tool_path()
+        if not self.workflow_version.strict:
+            return load_cwl_metadata(tool_path, self.tool_cache)
         # Turn down cwltool and rdflib logging
         logging.getLogger("cwltool").setLevel(logging.ERROR)
         logging.getLogger("rdflib.term").setLevel(logging.ERROR)
@@ -71,7 +82,6 @@ class BespinWorkflowLoader(object):
                                   "resolver": tool_resolver,
                                   "disable_js_validation": True})
         context.strict = False
-        tool_path = self._get_tool_path()
         return load_tool(tool_path, context)
 
     def _get_tool_path(self):
@@ -248,7 +258,7 @@ class BespinWorkflowParser(object):
 class CWLWorkflowVersion(object):
 
     def __init__(self, url, workflow_type, workflow_path, version_info_url=None,
-                 override_version=None, override_tag=None, validate=True):
+                 override_version=None, override_tag=None, validate=True, strict=True):
         self.url = url
         self.workflow_type = workflow_type
         self.workflow_path = workflow_path
@@ -256,6 +266,9 @@ class CWLWorkflowVersion(object):
         self.override_version = override_version
         self.override_tag = override_tag
         self.validate = validate
+        # strict workflows are loaded by cwltool, checking them against the CWL schema, otherwise only the
+        # metadata bespin uses is read
+        self.strict = strict
 
     def _load_and_parse_workflow(self, expected_tag=None, expected_version=None):
         """
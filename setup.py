@@ -28,13 +28,13 @@ setup(name='bespin-cli',
       author='John Bradley',
       license='MIT',
       packages=['bespin'],
+      python_requires='>=3.4',
       install_requires=[
           'DukeDSClient',
           'future',
           'PyYAML',
           'requests>=2.20.0',
           'six',
-          'tabulate',
           'cwltool==1.0.20181217162649',
           'html5lib==1.0.1',
       ],
@@ -48,7 +48,6 @@ setup(name='bespin-cli',
           'Intended Audience :: Science/Research',
           'Topic :: Utilities',
           'License :: OSI Approved :: MIT License',
-          'Programming Language :: Python :: 2.7',
           'Programming Language :: Python :: 3.4',
           'Programming Language :: Python :: 3.5',
           'Programming Language :: Python :: 3.6',